@@ -0,0 +1,11 @@
+from fastapi import APIRouter, Response
+
+from core import metrics
+
+router = APIRouter()
+
+
+@router.get("/metrics", summary="Metricas Prometheus", include_in_schema=False)
+def read_metrics():
+    body, media_type = metrics.latest()
+    return Response(content=body, media_type=media_type)
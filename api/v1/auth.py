@@ -1,9 +1,10 @@
 from fastapi import APIRouter, Depends, HTTPException, status
+from core.profiling import ProfiledRoute
 from db.session import get_db
 from models.auth import AppLoginRequest, AppTokenRequest, AppTokenResponse
 from services import app_tokens
 
-router = APIRouter()
+router = APIRouter(route_class=ProfiledRoute)
 
 
 @router.post("/auth/app-token", response_model=AppTokenResponse, summary="Gerar token por aplicacao")
@@ -0,0 +1,112 @@
+import json
+import time
+from datetime import datetime, timezone
+from typing import AsyncIterator, Literal, Optional
+
+import anyio
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
+
+from core import tracing
+from core.config import settings
+from core.profiling import ProfiledRoute
+from core.rate_limit import rate_limit_dependency
+from core.security import Role, require_roles
+from db.models import ChangeEvent
+from models.change import ChangeList, ChangeOut
+from services import changes
+
+router = APIRouter(route_class=ProfiledRoute)
+
+SINCE_DESCRIPTION = "Ultimo seq ja processado; a resposta traz os eventos posteriores"
+EXPIRED_DETAIL = "Eventos posteriores a since ja foram descartados; refaca a carga completa"
+
+
+def _change_out(event: ChangeEvent) -> ChangeOut:
+    return ChangeOut(
+        seq=event.seq,
+        scope=event.scope,
+        object_id=event.object_id,
+        change=event.change,
+        attributes=json.loads(event.attributes_json) if event.attributes_json else [],
+        source=event.source,
+        actor=event.actor,
+        action=event.action,
+        recorded_at=datetime.fromtimestamp(event.recorded_at, timezone.utc),
+    )
+
+
+async def _check_expired(since: int) -> None:
+    if await run_in_threadpool(changes.expired, since):
+        raise HTTPException(status_code=status.HTTP_410_GONE, detail=EXPIRED_DETAIL)
+
+
+@router.get(
+    "/changes",
+    summary="Feed de mudancas de usuarios e grupos",
+    dependencies=[Depends(rate_limit_dependency)],
+    response_model=ChangeList,
+)
+async def list_changes(
+    since: int = Query(default=0, ge=0, description=SINCE_DESCRIPTION),
+    limit: Optional[int] = Query(default=None, ge=1, description="Maximo de eventos (padrao CHANGES_PAGE_SIZE)"),
+    wait: float = Query(default=0, ge=0, description="Segundos de espera por eventos novos (long-poll)"),
+    scope: Optional[Literal["users", "groups"]] = Query(default=None),
+    payload=Depends(require_roles(Role.admin, Role.helpdesk, Role.auditor)),
+):
+    await _check_expired(since)
+    limit = min(limit or settings.changes_page_size, settings.changes_page_size)
+    deadline = time.monotonic() + min(wait, settings.changes_max_wait_seconds)
+    while True:
+        events = await run_in_threadpool(changes.read, since, limit, scope)
+        remaining = deadline - time.monotonic()
+        if events or remaining <= 0:
+            break
+        with tracing.idle():
+            await anyio.sleep(min(settings.changes_poll_seconds, remaining))
+    return ChangeList(events=[_change_out(event) for event in events], next=events[-1].seq if events else since)
+
+
+@router.get(
+    "/changes/stream",
+    summary="Feed de mudancas via Server-Sent Events",
+    response_class=StreamingResponse,
+    responses={200: {"content": {"text/event-stream": {}}, "description": "Um evento `change` por mudanca"}},
+)
+async def stream_changes(
+    request: Request,
+    since: int = Query(default=0, ge=0, description=f"{SINCE_DESCRIPTION}; Last-Event-ID tem precedencia"),
+    scope: Optional[Literal["users", "groups"]] = Query(default=None),
+    payload=Depends(require_roles(Role.admin, Role.helpdesk, Role.auditor)),
+):
+    # reconexao do EventSource manda o ultimo id recebido
+    last_event_id = request.headers.get("last-event-id", "")
+    cursor = int(last_event_id) if last_event_id.isdigit() else since
+    await _check_expired(cursor)
+
+    async def events() -> AsyncIterator[str]:
+        position = cursor
+        quiet_since = time.monotonic()
+        while True:
+            batch = await run_in_threadpool(changes.read, position, settings.changes_page_size, scope)
+            for event in batch:
+                data = _change_out(event).model_dump_json()
+                yield f"id: {event.seq}\nevent: change\ndata: {data}\n\n"
+                position = event.seq
+            if len(batch) == settings.changes_page_size:
+                continue
+            if batch:
+                quiet_since = time.monotonic()
+            elif time.monotonic() - quiet_since >= settings.changes_heartbeat_seconds:
+                # comentario SSE: mantem a conexao viva em proxies com timeout de inatividade
+                yield ": keepalive\n\n"
+                quiet_since = time.monotonic()
+            with tracing.idle():
+                await anyio.sleep(settings.changes_poll_seconds)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
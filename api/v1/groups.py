@@ -1,39 +1,130 @@
-from fastapi import APIRouter, Depends, HTTPException, Query, status
-from fastapi.responses import PlainTextResponse
+from typing import Any, Dict
+
+from fastapi import APIRouter, Depends, Query, Request, status
 from sqlalchemy.orm import Session
 
+from api.v1.responses import (
+    CONDITIONAL_RESPONSES,
+    JOB_RESPONSES,
+    TEXT_RESPONSES,
+    etag_matches,
+    first_entry,
+    job_accepted,
+    not_modified,
+    render,
+    render_snapshot,
+    render_spooled,
+    representation,
+    script_error,
+    script_result,
+    snapshot_fallback_allowed,
+    stream_render,
+    stream_snapshot,
+)
+from core.config import settings
+from core.profiling import ProfiledRoute
 from core.rate_limit import rate_limit_dependency
 from core.security import Role, actor_from_payload, require_roles
 from db.session import get_db
-from models.group import GroupCreate, GroupMemberChange, GroupUpdate
+from models.common import ScriptResult, SyncResult
+from models.group import GroupCreate, GroupEntryList, GroupList, GroupMemberChange, GroupOut, GroupUpdate
+from services import snapshots
+from services import jobs
 from services import groups as group_service
-from services.script_runner import ScriptExecutionError
+from services.script_runner import ScriptExecutionError, normalize_attributes, resolve_fields
+
+router = APIRouter(route_class=ProfiledRoute)
+
+FIELDS_DESCRIPTION = "Atributos separados por virgula ('*' para todos os atributos)"
+
 
-router = APIRouter()
+def _group_out(entry: Dict[str, Any], fallback: str = "") -> GroupOut:
+    attributes = normalize_attributes(entry)
+    dn = attributes.pop("dn", None)
+    groupname = attributes.get("sAMAccountName") or attributes.get("cn") or fallback
+    return GroupOut(groupname=str(groupname), dn=dn, attributes=attributes)
 
 
-@router.get("/groups", summary="Listar grupos", response_class=PlainTextResponse)
-def list_groups(db: Session = Depends(get_db), payload=Depends(require_roles(Role.admin, Role.helpdesk, Role.auditor))):
+@router.get(
+    "/groups",
+    summary="Listar grupos",
+    dependencies=[Depends(rate_limit_dependency)],
+    response_model=GroupList | GroupEntryList,
+    responses=CONDITIONAL_RESPONSES,
+)
+def list_groups(
+    request: Request,
+    fields: str | None = Query(default=None, description=FIELDS_DESCRIPTION),
+    db: Session = Depends(get_db),
+    payload=Depends(require_roles(Role.admin, Role.helpdesk, Role.auditor)),
+):
     actor = actor_from_payload(payload)
     try:
-        return group_service.list_groups(db, actor)
+        selected = resolve_fields(fields, [])
+        etag, fresh = snapshots.list_etag(db, "groups", selected, representation(request))
+        if fresh and etag_matches(request, etag):
+            snapshots.record_not_modified(
+                db, actor=actor, action="list_groups", object_type="group", object_id="list", etag=etag
+            )
+            return not_modified(etag)
+        header, data = group_service.list_groups(db, actor, selected)
+        if not fresh:
+            # geracao parada nao prova que o AD nao mudou: mesmo ETag com outro corpo
+            etag = None
+        if selected:
+            return stream_render(
+                request, header, data, key="groups", item=lambda entry: _group_out(entry).model_dump(), etag=etag
+            )
+        return stream_render(request, header, data, key="groups", etag=etag)
     except ScriptExecutionError as exc:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST, detail=exc.stderr or exc.stdout or str(exc)
-        ) from exc
+        if snapshot_fallback_allowed(request, exc):
+            age = snapshots.snapshot_age(db, "groups")
+            if age is not None:
+                entries = snapshots.iter_snapshot("groups", selected)
+                if selected:
+                    items = (_group_out(entry, name).model_dump() for name, entry in entries)
+                    return stream_snapshot("groups", items, age)
+                return stream_snapshot("groups", (name for name, _ in entries), age)
+        raise script_error(exc) from exc
 
 
-@router.get("/groups/{groupname}", summary="Detalhar grupo", response_class=PlainTextResponse)
+@router.get(
+    "/groups/{groupname}",
+    summary="Detalhar grupo",
+    dependencies=[Depends(rate_limit_dependency)],
+    response_model=GroupOut,
+    responses=CONDITIONAL_RESPONSES,
+)
 def get_group(
-    groupname: str, db: Session = Depends(get_db), payload=Depends(require_roles(Role.admin, Role.helpdesk, Role.auditor))
+    groupname: str,
+    request: Request,
+    fields: str | None = Query(default=None, description=FIELDS_DESCRIPTION),
+    db: Session = Depends(get_db),
+    payload=Depends(require_roles(Role.admin, Role.helpdesk, Role.auditor)),
 ):
     actor = actor_from_payload(payload)
+    variant = representation(request)
     try:
-        return group_service.get_group(db, actor, groupname)
+        selected = resolve_fields(fields, settings.ad_group_default_fields)
+        if request.headers.get("if-none-match"):
+            cached = snapshots.snapshot_entry_etag(db, "groups", groupname, selected, variant)
+            if etag_matches(request, cached):
+                snapshots.record_not_modified(
+                    db, actor=actor, action="get_group", object_type="group", object_id=groupname, etag=cached
+                )
+                return not_modified(cached)
+        output = group_service.get_group(db, actor, groupname, selected)
+        entry = first_entry(output, "Grupo nao encontrado")
+        etag = snapshots.entry_etag(groupname, entry, selected, variant)
+        if etag_matches(request, etag):
+            return not_modified(etag)
+        return render(request, output, lambda: _group_out(entry, groupname), etag=etag)
     except ScriptExecutionError as exc:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST, detail=exc.stderr or exc.stdout or str(exc)
-        ) from exc
+        if snapshot_fallback_allowed(request, exc):
+            cached = snapshots.snapshot_entry(db, "groups", groupname, selected)
+            if cached is not None:
+                return render_snapshot(_group_out(cached[0], groupname), cached[1])
+        raise script_error(exc) from exc
 
 
 @router.post(
@@ -41,117 +132,141 @@ def get_group(
     status_code=status.HTTP_201_CREATED,
     summary="Criar grupo",
     dependencies=[Depends(rate_limit_dependency)],
-    response_class=PlainTextResponse,
+    response_model=ScriptResult,
+    responses=JOB_RESPONSES,
 )
 def create_group(
     body: GroupCreate,
+    request: Request,
     db: Session = Depends(get_db),
     payload=Depends(require_roles(Role.admin)),
 ):
     actor = actor_from_payload(payload)
+    if settings.job_queue_enabled:
+        return job_accepted(jobs.enqueue(db, actor, "groups.create_group", body.groupname, body.description))
     try:
-        return group_service.create_group(db, actor, body.groupname, body.description)
+        output = group_service.create_group(db, actor, body.groupname, body.description)
     except ScriptExecutionError as exc:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST, detail=exc.stderr or exc.stdout or str(exc)
-        ) from exc
+        raise script_error(exc) from exc
+    return render(request, output, lambda: script_result(output), status_code=status.HTTP_201_CREATED)
 
 
 @router.patch(
     "/groups/{groupname}",
     summary="Editar descricao do grupo",
     dependencies=[Depends(rate_limit_dependency)],
-    response_class=PlainTextResponse,
+    response_model=ScriptResult,
+    responses=JOB_RESPONSES,
 )
 def update_group(
     groupname: str,
     body: GroupUpdate,
+    request: Request,
     db: Session = Depends(get_db),
     payload=Depends(require_roles(Role.admin, Role.helpdesk)),
 ):
     actor = actor_from_payload(payload)
+    if settings.job_queue_enabled:
+        return job_accepted(jobs.enqueue(db, actor, "groups.update_group_description", groupname, body.description))
     try:
-        return group_service.update_group_description(db, actor, groupname, body.description)
+        output = group_service.update_group_description(db, actor, groupname, body.description)
     except ScriptExecutionError as exc:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST, detail=exc.stderr or exc.stdout or str(exc)
-        ) from exc
+        raise script_error(exc) from exc
+    return render(request, output, lambda: script_result(output))
 
 
 @router.post(
     "/groups/{groupname}/members",
     summary="Adicionar membro ao grupo",
     dependencies=[Depends(rate_limit_dependency)],
-    response_class=PlainTextResponse,
+    response_model=ScriptResult,
+    responses=JOB_RESPONSES,
 )
 def add_member(
     groupname: str,
     body: GroupMemberChange,
+    request: Request,
     db: Session = Depends(get_db),
     payload=Depends(require_roles(Role.admin, Role.helpdesk)),
 ):
     actor = actor_from_payload(payload)
+    if settings.job_queue_enabled:
+        return job_accepted(jobs.enqueue(db, actor, "groups.add_member", groupname, body.member))
     try:
-        return group_service.add_member(db, actor, groupname, body.member)
+        output = group_service.add_member(db, actor, groupname, body.member)
     except ScriptExecutionError as exc:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST, detail=exc.stderr or exc.stdout or str(exc)
-        ) from exc
+        raise script_error(exc) from exc
+    return render(request, output, lambda: script_result(output))
 
 
 @router.delete(
     "/groups/{groupname}/members",
     summary="Remover membro do grupo",
     dependencies=[Depends(rate_limit_dependency)],
-    response_class=PlainTextResponse,
+    response_model=ScriptResult,
+    responses=JOB_RESPONSES,
 )
 def remove_member(
     groupname: str,
     body: GroupMemberChange,
+    request: Request,
     db: Session = Depends(get_db),
     payload=Depends(require_roles(Role.admin, Role.helpdesk)),
 ):
     actor = actor_from_payload(payload)
+    if settings.job_queue_enabled:
+        return job_accepted(jobs.enqueue(db, actor, "groups.remove_member", groupname, body.member))
     try:
-        return group_service.remove_member(db, actor, groupname, body.member)
+        output = group_service.remove_member(db, actor, groupname, body.member)
     except ScriptExecutionError as exc:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST, detail=exc.stderr or exc.stdout or str(exc)
-        ) from exc
+        raise script_error(exc) from exc
+    return render(request, output, lambda: script_result(output))
 
 
 @router.post(
     "/groups/{groupname}/disable",
     summary="Desativar grupo",
     dependencies=[Depends(rate_limit_dependency)],
-    response_class=PlainTextResponse,
+    response_model=ScriptResult,
+    responses=JOB_RESPONSES,
 )
 def disable_group(
     groupname: str,
+    request: Request,
     target_ou_dn: str = Query(..., description="DN da OU de destino"),
     db: Session = Depends(get_db),
     payload=Depends(require_roles(Role.admin)),
 ):
     actor = actor_from_payload(payload)
+    if settings.job_queue_enabled:
+        return job_accepted(jobs.enqueue(db, actor, "groups.disable_group", groupname, target_ou_dn))
     try:
-        return group_service.disable_group(db, actor, groupname, target_ou_dn)
+        output = group_service.disable_group(db, actor, groupname, target_ou_dn)
     except ScriptExecutionError as exc:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST, detail=exc.stderr or exc.stdout or str(exc)
-        ) from exc
+        raise script_error(exc) from exc
+    return render(request, output, lambda: script_result(output))
 
 
 @router.post(
     "/sync/groups",
     summary="Sincronizar grupos",
     dependencies=[Depends(rate_limit_dependency)],
-    response_class=PlainTextResponse,
+    response_model=SyncResult,
+    responses=TEXT_RESPONSES,
 )
-def sync_groups(db: Session = Depends(get_db), payload=Depends(require_roles(Role.admin, Role.auditor))):
+def sync_groups(
+    request: Request,
+    db: Session = Depends(get_db),
+    payload=Depends(require_roles(Role.admin, Role.auditor)),
+):
     actor = actor_from_payload(payload)
     try:
-        return group_service.sync_groups(db, actor)
+        result = group_service.sync_groups(db, actor)
     except ScriptExecutionError as exc:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST, detail=exc.stderr or exc.stdout or str(exc)
-        ) from exc
+        raise script_error(exc) from exc
+    header = script_result("\n".join(result["header"]))
+    return render_spooled(
+        request,
+        result["output"],
+        lambda: SyncResult(**header.model_dump(), total=result["total"], updated=result["updated"]),
+    )
@@ -0,0 +1,32 @@
+from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy.orm import Session
+
+from api.v1.responses import script_result
+from core.profiling import ProfiledRoute
+from core.security import Role, require_roles
+from db.session import get_db
+from models.job import JobOut
+from services import jobs
+
+router = APIRouter(route_class=ProfiledRoute)
+
+
+@router.get("/jobs/{job_id}", summary="Consultar operacao enfileirada", response_model=JobOut)
+def get_job(
+    job_id: int,
+    db: Session = Depends(get_db),
+    payload=Depends(require_roles(Role.admin, Role.helpdesk, Role.auditor)),
+):
+    job = jobs.get_job(db, job_id)
+    if job is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Job nao encontrado")
+    return JobOut(
+        job_id=job.id,
+        operation=job.operation,
+        status=job.status,
+        attempts=job.attempts,
+        result=script_result(job.output) if job.output else None,
+        error=job.error,
+        created_at=job.created_at,
+        finished_at=job.finished_at,
+    )
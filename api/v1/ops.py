@@ -0,0 +1,118 @@
+import json
+import time
+from typing import Literal
+
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from sqlalchemy.orm import Session
+
+from api.v1.responses import script_error
+from core import circuit_breaker, concurrency, profiling
+from core.config import settings
+from core.profiling import ProfiledRoute
+from core.rate_limit import rate_limit_dependency
+from core.security import Role, actor_from_payload, require_roles
+from db.session import get_db
+from models.ops import (
+    AllocationSite,
+    CircuitStatus,
+    ConcurrencyStatus,
+    DomainControllerList,
+    DomainControllerOut,
+    OrphanReportList,
+    OrphanReportOut,
+    SlowOperationList,
+    SlowOperationOut,
+    SyncProfile,
+)
+from services import dc_pool, process_group
+from services import groups as group_service
+from services import slow_ops
+from services import users as user_service
+from services.script_runner import ScriptExecutionError
+
+router = APIRouter(route_class=ProfiledRoute)
+
+
+@router.get("/ops/slow", summary="Listar operacoes lentas", response_model=SlowOperationList)
+def list_slow_operations(
+    limit: int = Query(default=50, ge=1, le=500),
+    min_ms: float | None = Query(default=None, ge=0, description="Duracao minima em milissegundos"),
+    db: Session = Depends(get_db),
+    payload=Depends(require_roles(Role.admin, Role.auditor)),
+):
+    operations = [
+        SlowOperationOut(
+            id=entry.id,
+            request_id=entry.request_id,
+            name=entry.name,
+            status=entry.status,
+            duration_ms=entry.duration_ms,
+            spans=json.loads(entry.spans_json),
+            created_at=entry.created_at,
+        )
+        for entry in slow_ops.list_slow(db, limit=limit, min_ms=min_ms)
+    ]
+    return SlowOperationList(operations=operations)
+
+
+@router.get("/ops/circuits", summary="Estado dos circuitos e timeouts dos scripts", response_model=CircuitStatus)
+def circuit_status(payload=Depends(require_roles(Role.admin, Role.auditor))):
+    # estado deste processo; com varios workers, use as metricas ad_circuit_*
+    return CircuitStatus(enabled=settings.circuit_breaker_enabled, **circuit_breaker.snapshot())
+
+
+@router.get("/ops/concurrency", summary="Limite adaptativo de scripts simultaneos", response_model=ConcurrencyStatus)
+def concurrency_status(payload=Depends(require_roles(Role.admin, Role.auditor))):
+    # estado deste processo; com varios workers, use as metricas ad_concurrency_*
+    return ConcurrencyStatus(enabled=settings.concurrency_limit_enabled, **concurrency.limiter().snapshot())
+
+
+@router.get("/ops/dcs", summary="Saude e latencia dos controladores de dominio", response_model=DomainControllerList)
+def list_domain_controllers(payload=Depends(require_roles(Role.admin, Role.auditor))):
+    # ordem de preferencia para leituras neste processo
+    return DomainControllerList(
+        controllers=[DomainControllerOut(**item) for item in dc_pool.get_pool().snapshot()]
+    )
+
+
+@router.get(
+    "/ops/orphans", summary="Processos que sobreviveram aos scripts", response_model=OrphanReportList
+)
+def list_orphans(payload=Depends(require_roles(Role.admin, Role.auditor))):
+    # ultimos registros deste processo; o total de todos os workers esta em ad_script_orphans_total
+    return OrphanReportList(reports=[OrphanReportOut(**item) for item in process_group.recent_orphans()])
+
+
+@router.post(
+    "/ops/profile/sync",
+    summary="Perfil de memoria da sincronizacao",
+    dependencies=[Depends(rate_limit_dependency)],
+    response_model=SyncProfile,
+)
+def profile_sync(
+    scope: Literal["users", "groups"] = Query(default="users"),
+    top: int = Query(default=20, ge=1, le=100),
+    db: Session = Depends(get_db),
+    payload=Depends(require_roles(Role.admin)),
+):
+    if not settings.profiling_enabled:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Profiling desativado")
+    actor = actor_from_payload(payload)
+    sync = user_service.sync_users if scope == "users" else group_service.sync_groups
+    start = time.perf_counter()
+    try:
+        with profiling.allocation_profile(top) as report:
+            result = sync(db, actor)
+            result["output"].close()
+    except profiling.ProfilingBusyError as exc:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(exc)) from exc
+    except ScriptExecutionError as exc:
+        raise script_error(exc) from exc
+    return SyncProfile(
+        scope=scope,
+        total=result["total"],
+        updated=result["updated"],
+        duration_ms=round((time.perf_counter() - start) * 1000, 3),
+        peak_bytes=report["peak_bytes"],
+        top=[AllocationSite(**site) for site in report["top"]],
+    )
@@ -0,0 +1,201 @@
+import math
+from typing import IO, Any, Callable, Dict, Iterable, Iterator, List, Optional
+
+import orjson
+
+from fastapi import HTTPException, Request, status
+from fastapi.responses import PlainTextResponse, Response, StreamingResponse
+from pydantic import BaseModel
+
+from core.config import settings
+from core.responses import FastJSONResponse
+from db.models import Job
+from models.common import ScriptResult
+from models.job import JobAccepted
+from services.existence import NotFoundError
+from services.script_runner import (
+    CircuitOpenError,
+    OverloadedError,
+    ScriptExecutionError,
+    extract_data_block,
+    is_dc_failure,
+    iter_ldif_entries,
+    parse_ldif_entries,
+    parse_script_header,
+)
+
+TEXT_MEDIA_TYPE = "text/plain; charset=utf-8"
+STREAM_CHUNK_BYTES = 64 * 1024
+
+TEXT_RESPONSES: Dict[int | str, Dict[str, Any]] = {200: {"content": {"text/plain": {}}}}
+JOB_RESPONSES: Dict[int | str, Dict[str, Any]] = {
+    **TEXT_RESPONSES,
+    202: {"model": JobAccepted, "description": "Enfileirado para o worker (JOB_QUEUE_ENABLED)"},
+}
+CONDITIONAL_RESPONSES: Dict[int | str, Dict[str, Any]] = {
+    **TEXT_RESPONSES,
+    304: {"description": "Nao modificado (If-None-Match)"},
+}
+SNAPSHOT_SOURCE = "snapshot"
+
+
+def prefers_text(request: Request) -> bool:
+    accept = request.headers.get("accept", "")
+    return "text/plain" in accept and "application/json" not in accept
+
+
+def representation(request: Request) -> str:
+    return "text" if prefers_text(request) else "json"
+
+
+def render(
+    request: Request,
+    output: str,
+    build: Callable[[], BaseModel],
+    *,
+    status_code: int = 200,
+    etag: Optional[str] = None,
+) -> Response:
+    headers = {"ETag": etag} if etag else None
+    if prefers_text(request):
+        return PlainTextResponse(output, status_code=status_code, headers=headers)
+    return FastJSONResponse(build().model_dump(), status_code=status_code, headers=headers)
+
+
+def etag_matches(request: Request, etag: Optional[str]) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header or not etag:
+        return False
+    candidates = {item.strip().removeprefix("W/") for item in header.split(",")}
+    return "*" in candidates or etag in candidates
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+
+
+def job_accepted(job: Job) -> Response:
+    body = JobAccepted(job_id=job.id, status=job.status, operation=job.operation)
+    return FastJSONResponse(
+        body.model_dump(), status_code=status.HTTP_202_ACCEPTED, headers={"Location": f"/api/v1/jobs/{job.id}"}
+    )
+
+
+def script_error(exc: ScriptExecutionError) -> HTTPException:
+    if isinstance(exc, (CircuitOpenError, OverloadedError)):
+        return HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=str(exc),
+            headers={"Retry-After": str(math.ceil(exc.retry_after))},
+        )
+    if isinstance(exc, NotFoundError):
+        return HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(exc))
+    detail = exc.stderr or exc.stdout or str(exc)
+    if is_dc_failure(exc.returncode, exc.stderr):
+        return HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=detail)
+    return HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=detail)
+
+
+def snapshot_fallback_allowed(request: Request, exc: ScriptExecutionError) -> bool:
+    # o snapshot guarda atributos, nao a saida do script: so ha representacao JSON
+    return isinstance(exc, CircuitOpenError) and settings.circuit_breaker_snapshot_fallback and not prefers_text(request)
+
+
+def snapshot_headers(age: float) -> Dict[str, str]:
+    return {"X-Data-Source": SNAPSHOT_SOURCE, "X-Snapshot-Age": str(int(age))}
+
+
+def render_snapshot(model: BaseModel, age: float) -> Response:
+    return FastJSONResponse(model.model_dump(), headers=snapshot_headers(age))
+
+
+def stream_snapshot(key: str, items: Iterable[Any], age: float) -> StreamingResponse:
+    return StreamingResponse(
+        _batched(_json_array_parts(key, items)), media_type=FastJSONResponse.media_type, headers=snapshot_headers(age)
+    )
+
+
+def script_result(output: str) -> ScriptResult:
+    header = parse_script_header(output)
+    return ScriptResult(
+        status=header.get("STATUS", "OK"),
+        action=header.get("ACTION", ""),
+        identifier=header.get("IDENTIFIER", ""),
+    )
+
+
+def data_entries(output: str) -> List[Dict[str, Any]]:
+    return parse_ldif_entries(extract_data_block(output))
+
+
+def first_entry(output: str, missing_message: str) -> Dict[str, Any]:
+    entries = data_entries(output)
+    if not entries:
+        raise ScriptExecutionError(missing_message, stdout=output)
+    return entries[0]
+
+
+def _batched(parts: Iterable[bytes]) -> Iterator[bytes]:
+    buffer = bytearray()
+    for part in parts:
+        buffer += part
+        if len(buffer) >= STREAM_CHUNK_BYTES:
+            yield bytes(buffer)
+            buffer.clear()
+    if buffer:
+        yield bytes(buffer)
+
+
+def _text_parts(header: List[str], data: Iterable[str]) -> Iterator[bytes]:
+    yield "\n".join([*header, "DATA_BEGIN", ""]).encode("utf-8")
+    for line in data:
+        yield line.encode("utf-8") + b"\n"
+    yield b"DATA_END\n"
+
+
+def _json_array_parts(key: str, items: Iterable[Any]) -> Iterator[bytes]:
+    yield b'{"' + key.encode("utf-8") + b'":['
+    separator = b""
+    for item in items:
+        yield separator + orjson.dumps(item)
+        separator = b","
+    yield b"]}"
+
+
+def stream_render(
+    request: Request,
+    header: List[str],
+    data: Iterator[str],
+    *,
+    key: str,
+    item: Optional[Callable[[Dict[str, Any]], Dict[str, Any]]] = None,
+    etag: Optional[str] = None,
+) -> StreamingResponse:
+    headers = {"ETag": etag} if etag else None
+    if prefers_text(request):
+        return StreamingResponse(_batched(_text_parts(header, data)), media_type=TEXT_MEDIA_TYPE, headers=headers)
+    if item is None:
+        items: Iterable[Any] = (line.strip() for line in data if line.strip())
+    else:
+        items = (item(entry) for entry in iter_ldif_entries(data))
+    return StreamingResponse(
+        _batched(_json_array_parts(key, items)), media_type=FastJSONResponse.media_type, headers=headers
+    )
+
+
+def _file_chunks(fp: IO[str]) -> Iterator[bytes]:
+    try:
+        while True:
+            chunk = fp.read(STREAM_CHUNK_BYTES)
+            if not chunk:
+                return
+            yield chunk.encode("utf-8")
+    finally:
+        fp.close()
+
+
+def render_spooled(request: Request, output: IO[str], build: Callable[[], BaseModel]) -> Response:
+    if prefers_text(request):
+        return StreamingResponse(_file_chunks(output), media_type=TEXT_MEDIA_TYPE)
+    output.close()
+    return FastJSONResponse(build().model_dump())
@@ -1,39 +1,138 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from fastapi.responses import PlainTextResponse
+from typing import Any, Dict
+
+from fastapi import APIRouter, Depends, Query, Request, status
 from sqlalchemy.orm import Session
 
+from api.v1.responses import (
+    CONDITIONAL_RESPONSES,
+    JOB_RESPONSES,
+    TEXT_RESPONSES,
+    etag_matches,
+    first_entry,
+    job_accepted,
+    not_modified,
+    render,
+    render_snapshot,
+    render_spooled,
+    representation,
+    script_error,
+    script_result,
+    snapshot_fallback_allowed,
+    stream_render,
+    stream_snapshot,
+)
+from core.config import settings
+from core.profiling import ProfiledRoute
 from core.rate_limit import rate_limit_dependency
 from core.security import Role, actor_from_payload, require_roles
 from db.session import get_db
-from models.user import UserCreate, UserGroupChange, UserPasswordReset, UserUpdate
+from models.common import ScriptResult, SyncResult
+from models.user import (
+    UserCreate,
+    UserEntryList,
+    UserGroupChange,
+    UserList,
+    UserOut,
+    UserPasswordReset,
+    UserUpdate,
+)
+from services import snapshots
+from services import jobs
 from services import users as user_service
-from services.script_runner import ScriptExecutionError
+from services.script_runner import ScriptExecutionError, normalize_attributes, resolve_fields
+
+router = APIRouter(route_class=ProfiledRoute)
+
+FIELDS_DESCRIPTION = "Atributos separados por virgula ('*' para todos os atributos)"
 
-router = APIRouter()
 
+def _user_out(entry: Dict[str, Any], fallback: str = "") -> UserOut:
+    attributes = normalize_attributes(entry)
+    dn = attributes.pop("dn", None)
+    username = attributes.get("sAMAccountName") or fallback
+    return UserOut(username=str(username), dn=dn, attributes=attributes)
 
-@router.get("/users", summary="Listar usuarios", response_class=PlainTextResponse)
-def list_users(db: Session = Depends(get_db), payload=Depends(require_roles(Role.admin, Role.helpdesk, Role.auditor))):
+
+@router.get(
+    "/users",
+    summary="Listar usuarios",
+    dependencies=[Depends(rate_limit_dependency)],
+    response_model=UserList | UserEntryList,
+    responses=CONDITIONAL_RESPONSES,
+)
+def list_users(
+    request: Request,
+    fields: str | None = Query(default=None, description=FIELDS_DESCRIPTION),
+    db: Session = Depends(get_db),
+    payload=Depends(require_roles(Role.admin, Role.helpdesk, Role.auditor)),
+):
     actor = actor_from_payload(payload)
     try:
-        return user_service.list_users(db, actor)
+        selected = resolve_fields(fields, [])
+        etag, fresh = snapshots.list_etag(db, "users", selected, representation(request))
+        if fresh and etag_matches(request, etag):
+            snapshots.record_not_modified(
+                db, actor=actor, action="list_users", object_type="user", object_id="list", etag=etag
+            )
+            return not_modified(etag)
+        header, data = user_service.list_users(db, actor, selected)
+        if not fresh:
+            # geracao parada nao prova que o AD nao mudou: mesmo ETag com outro corpo
+            etag = None
+        if selected:
+            return stream_render(
+                request, header, data, key="users", item=lambda entry: _user_out(entry).model_dump(), etag=etag
+            )
+        return stream_render(request, header, data, key="users", etag=etag)
     except ScriptExecutionError as exc:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST, detail=exc.stderr or exc.stdout or str(exc)
-        ) from exc
+        if snapshot_fallback_allowed(request, exc):
+            age = snapshots.snapshot_age(db, "users")
+            if age is not None:
+                entries = snapshots.iter_snapshot("users", selected)
+                if selected:
+                    items = (_user_out(entry, name).model_dump() for name, entry in entries)
+                    return stream_snapshot("users", items, age)
+                return stream_snapshot("users", (name for name, _ in entries), age)
+        raise script_error(exc) from exc
 
 
-@router.get("/users/{username}", summary="Detalhar usuario", response_class=PlainTextResponse)
+@router.get(
+    "/users/{username}",
+    summary="Detalhar usuario",
+    dependencies=[Depends(rate_limit_dependency)],
+    response_model=UserOut,
+    responses=CONDITIONAL_RESPONSES,
+)
 def get_user(
-    username: str, db: Session = Depends(get_db), payload=Depends(require_roles(Role.admin, Role.helpdesk, Role.auditor))
+    username: str,
+    request: Request,
+    fields: str | None = Query(default=None, description=FIELDS_DESCRIPTION),
+    db: Session = Depends(get_db),
+    payload=Depends(require_roles(Role.admin, Role.helpdesk, Role.auditor)),
 ):
     actor = actor_from_payload(payload)
+    variant = representation(request)
     try:
-        return user_service.get_user(db, actor, username)
+        selected = resolve_fields(fields, settings.ad_user_default_fields)
+        if request.headers.get("if-none-match"):
+            cached = snapshots.snapshot_entry_etag(db, "users", username, selected, variant)
+            if etag_matches(request, cached):
+                snapshots.record_not_modified(
+                    db, actor=actor, action="get_user", object_type="user", object_id=username, etag=cached
+                )
+                return not_modified(cached)
+        output = user_service.get_user(db, actor, username, selected)
+        entry = first_entry(output, "Usuario nao encontrado")
+        etag = snapshots.entry_etag(username, entry, selected, variant)
+        if etag_matches(request, etag):
+            return not_modified(etag)
+        return render(request, output, lambda: _user_out(entry, username), etag=etag)
     except ScriptExecutionError as exc:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST, detail=exc.stderr or exc.stdout or str(exc)
-        ) from exc
+        if snapshot_fallback_allowed(request, exc):
+            cached = snapshots.snapshot_entry(db, "users", username, selected)
+            if cached is not None:
+                return render_snapshot(_user_out(cached[0], username), cached[1])
+        raise script_error(exc) from exc
 
 
 @router.post(
@@ -41,177 +140,211 @@ def get_user(
     status_code=status.HTTP_201_CREATED,
     summary="Criar usuario",
     dependencies=[Depends(rate_limit_dependency)],
-    response_class=PlainTextResponse,
+    response_model=ScriptResult,
+    responses=JOB_RESPONSES,
 )
 def create_user(
     body: UserCreate,
+    request: Request,
     db: Session = Depends(get_db),
     payload=Depends(require_roles(Role.admin)),
 ):
     actor = actor_from_payload(payload)
+    if settings.job_queue_enabled:
+        return job_accepted(jobs.enqueue(db, actor, "users.create_user", body.model_dump()))
     try:
-        return user_service.create_user(db, actor, body.model_dump())
+        output = user_service.create_user(db, actor, body.model_dump())
     except ScriptExecutionError as exc:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST, detail=exc.stderr or exc.stdout or str(exc)
-        ) from exc
+        raise script_error(exc) from exc
+    return render(request, output, lambda: script_result(output), status_code=status.HTTP_201_CREATED)
 
 
 @router.patch(
     "/users/{username}",
     summary="Atualizar usuario",
     dependencies=[Depends(rate_limit_dependency)],
-    response_class=PlainTextResponse,
+    response_model=ScriptResult,
+    responses=JOB_RESPONSES,
 )
 def update_user(
     username: str,
     body: UserUpdate,
+    request: Request,
     db: Session = Depends(get_db),
     payload=Depends(require_roles(Role.admin, Role.helpdesk)),
 ):
     actor = actor_from_payload(payload)
+    if settings.job_queue_enabled:
+        return job_accepted(jobs.enqueue(db, actor, "users.update_user", username, body.model_dump(exclude_unset=True)))
     try:
-        return user_service.update_user(db, actor, username, body.model_dump(exclude_unset=True))
+        output = user_service.update_user(db, actor, username, body.model_dump(exclude_unset=True))
     except ScriptExecutionError as exc:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST, detail=exc.stderr or exc.stdout or str(exc)
-        ) from exc
+        raise script_error(exc) from exc
+    return render(request, output, lambda: script_result(output))
 
 
 @router.post(
     "/users/{username}/reset-password",
     summary="Resetar senha",
     dependencies=[Depends(rate_limit_dependency)],
-    response_class=PlainTextResponse,
+    response_model=ScriptResult,
+    responses=JOB_RESPONSES,
 )
 def reset_password(
     username: str,
     body: UserPasswordReset,
+    request: Request,
     db: Session = Depends(get_db),
     payload=Depends(require_roles(Role.admin, Role.helpdesk)),
 ):
     actor = actor_from_payload(payload)
+    if settings.job_queue_enabled:
+        job = jobs.enqueue(db, actor, "users.reset_password", username, body.new_password, body.must_change_password)
+        return job_accepted(job)
     try:
-        return user_service.reset_password(db, actor, username, body.new_password, body.must_change_password)
+        output = user_service.reset_password(db, actor, username, body.new_password, body.must_change_password)
     except ScriptExecutionError as exc:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST, detail=exc.stderr or exc.stdout or str(exc)
-        ) from exc
+        raise script_error(exc) from exc
+    return render(request, output, lambda: script_result(output))
 
 
 @router.post(
     "/users/{username}/enable",
     summary="Habilitar usuario",
     dependencies=[Depends(rate_limit_dependency)],
-    response_class=PlainTextResponse,
+    response_model=ScriptResult,
+    responses=JOB_RESPONSES,
 )
 def enable_user(
     username: str,
+    request: Request,
     db: Session = Depends(get_db),
     payload=Depends(require_roles(Role.admin, Role.helpdesk)),
 ):
     actor = actor_from_payload(payload)
+    if settings.job_queue_enabled:
+        return job_accepted(jobs.enqueue(db, actor, "users.enable_user", username))
     try:
-        return user_service.enable_user(db, actor, username)
+        output = user_service.enable_user(db, actor, username)
     except ScriptExecutionError as exc:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST, detail=exc.stderr or exc.stdout or str(exc)
-        ) from exc
+        raise script_error(exc) from exc
+    return render(request, output, lambda: script_result(output))
 
 
 @router.post(
     "/users/{username}/disable",
     summary="Desabilitar usuario",
     dependencies=[Depends(rate_limit_dependency)],
-    response_class=PlainTextResponse,
+    response_model=ScriptResult,
+    responses=JOB_RESPONSES,
 )
 def disable_user(
     username: str,
+    request: Request,
     db: Session = Depends(get_db),
     payload=Depends(require_roles(Role.admin, Role.helpdesk)),
 ):
     actor = actor_from_payload(payload)
+    if settings.job_queue_enabled:
+        return job_accepted(jobs.enqueue(db, actor, "users.disable_user", username))
     try:
-        return user_service.disable_user(db, actor, username)
+        output = user_service.disable_user(db, actor, username)
     except ScriptExecutionError as exc:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST, detail=exc.stderr or exc.stdout or str(exc)
-        ) from exc
+        raise script_error(exc) from exc
+    return render(request, output, lambda: script_result(output))
 
 
 @router.delete(
     "/users/{username}",
     summary="Remover usuario",
     dependencies=[Depends(rate_limit_dependency)],
-    response_class=PlainTextResponse,
+    response_model=ScriptResult,
+    responses=JOB_RESPONSES,
 )
 def delete_user(
     username: str,
+    request: Request,
     db: Session = Depends(get_db),
     payload=Depends(require_roles(Role.admin)),
 ):
     actor = actor_from_payload(payload)
+    if settings.job_queue_enabled:
+        return job_accepted(jobs.enqueue(db, actor, "users.delete_user", username))
     try:
-        return user_service.delete_user(db, actor, username)
+        output = user_service.delete_user(db, actor, username)
     except ScriptExecutionError as exc:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST, detail=exc.stderr or exc.stdout or str(exc)
-        ) from exc
+        raise script_error(exc) from exc
+    return render(request, output, lambda: script_result(output))
 
 
 @router.post(
     "/users/{username}/groups",
     summary="Adicionar usuario ao grupo",
     dependencies=[Depends(rate_limit_dependency)],
-    response_class=PlainTextResponse,
+    response_model=ScriptResult,
+    responses=JOB_RESPONSES,
 )
 def add_user_to_group(
     username: str,
     body: UserGroupChange,
+    request: Request,
     db: Session = Depends(get_db),
     payload=Depends(require_roles(Role.admin, Role.helpdesk)),
 ):
     actor = actor_from_payload(payload)
+    if settings.job_queue_enabled:
+        return job_accepted(jobs.enqueue(db, actor, "users.add_user_to_group", username, body.group))
     try:
-        return user_service.add_user_to_group(db, actor, username, body.group)
+        output = user_service.add_user_to_group(db, actor, username, body.group)
     except ScriptExecutionError as exc:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST, detail=exc.stderr or exc.stdout or str(exc)
-        ) from exc
+        raise script_error(exc) from exc
+    return render(request, output, lambda: script_result(output))
 
 
 @router.delete(
     "/users/{username}/groups",
     summary="Remover usuario do grupo",
     dependencies=[Depends(rate_limit_dependency)],
-    response_class=PlainTextResponse,
+    response_model=ScriptResult,
+    responses=JOB_RESPONSES,
 )
 def remove_user_from_group(
     username: str,
     body: UserGroupChange,
+    request: Request,
     db: Session = Depends(get_db),
     payload=Depends(require_roles(Role.admin, Role.helpdesk)),
 ):
     actor = actor_from_payload(payload)
+    if settings.job_queue_enabled:
+        return job_accepted(jobs.enqueue(db, actor, "users.remove_user_from_group", username, body.group))
     try:
-        return user_service.remove_user_from_group(db, actor, username, body.group)
+        output = user_service.remove_user_from_group(db, actor, username, body.group)
     except ScriptExecutionError as exc:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST, detail=exc.stderr or exc.stdout or str(exc)
-        ) from exc
+        raise script_error(exc) from exc
+    return render(request, output, lambda: script_result(output))
 
 
 @router.post(
     "/sync/users",
     summary="Sincronizar usuarios",
     dependencies=[Depends(rate_limit_dependency)],
-    response_class=PlainTextResponse,
+    response_model=SyncResult,
+    responses=TEXT_RESPONSES,
 )
-def sync_users(db: Session = Depends(get_db), payload=Depends(require_roles(Role.admin, Role.auditor))):
+def sync_users(
+    request: Request,
+    db: Session = Depends(get_db),
+    payload=Depends(require_roles(Role.admin, Role.auditor)),
+):
     actor = actor_from_payload(payload)
     try:
-        return user_service.sync_users(db, actor)
+        result = user_service.sync_users(db, actor)
     except ScriptExecutionError as exc:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST, detail=exc.stderr or exc.stdout or str(exc)
-        ) from exc
+        raise script_error(exc) from exc
+    header = script_result("\n".join(result["header"]))
+    return render_spooled(
+        request,
+        result["output"],
+        lambda: SyncResult(**header.model_dump(), total=result["total"], updated=result["updated"]),
+    )
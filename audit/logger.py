@@ -1,9 +1,11 @@
 import json
-from typing import Any, Dict
+from typing import Any, Dict, Iterable, Iterator
 
 from sqlalchemy.orm import Session
 
+from core import metrics, tracing
 from db.models import AuditLog
+from db.session import SessionLocal
 
 
 def log_audit(
@@ -16,6 +18,9 @@ def log_audit(
     result: str,
     details: Dict[str, Any] | None = None,
 ) -> None:
+    request_id = tracing.current_request_id()
+    if request_id:
+        details = {**(details or {}), "request_id": request_id}
     entry = AuditLog(
         actor=actor,
         action=action,
@@ -24,5 +29,42 @@ def log_audit(
         result=result,
         details_json=json.dumps(details, ensure_ascii=True) if details else None,
     )
-    db.add(entry)
-    db.commit()
+    with metrics.timed(metrics.AUDIT_FLUSH), tracing.span("audit", action=action):
+        db.add(entry)
+        db.commit()
+
+
+def audit_stream(
+    lines: Iterable[str],
+    *,
+    actor: str,
+    action: str,
+    object_type: str,
+    object_id: str,
+    details: Dict[str, Any],
+) -> Iterator[str]:
+    result = "error"
+    extra: Dict[str, Any] = {}
+    try:
+        yield from lines
+        result = "success"
+    except GeneratorExit:
+        result = "aborted"
+        raise
+    except Exception as exc:
+        extra = {"stdout": getattr(exc, "stdout", ""), "stderr": getattr(exc, "stderr", "") or str(exc)}
+        raise
+    finally:
+        db = SessionLocal()
+        try:
+            log_audit(
+                db,
+                actor=actor,
+                action=action,
+                object_type=object_type,
+                object_id=object_id,
+                result=result,
+                details={**details, **extra},
+            )
+        finally:
+            db.close()
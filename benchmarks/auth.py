@@ -0,0 +1,97 @@
+"""Benchmark do custo de autenticacao por requisicao.
+
+Mede ``verify_token`` mais a checagem de role de ``require_roles`` com poucos tokens
+reusados (o caso das integracoes, servido pelo cache) e com um token novo por
+requisicao (so misses), ao lado da versao anterior (``jwt.decode`` a cada chamada e
+conjunto de roles montado por chamada).
+Uso: ``python -m benchmarks.auth --help``.
+"""
+
+import argparse
+import json
+import platform
+import sys
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO_ROOT))
+
+from fastapi import HTTPException, status  # noqa: E402
+from jose import JWTError, jwt  # noqa: E402
+
+from core import security  # noqa: E402
+from core.config import settings  # noqa: E402
+from core.security import Role, create_access_token  # noqa: E402
+
+ROLES = (Role.admin, Role.helpdesk, Role.auditor)
+
+
+def reference_auth(token: str) -> Dict[str, Any]:
+    # versao anterior: decode com HMAC e conjunto de roles a cada requisicao
+    try:
+        payload = jwt.decode(token, settings.jwt_secret_key, algorithms=[settings.jwt_algorithm])
+    except JWTError as exc:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Token invalido") from exc
+    if "sub" not in payload or "role" not in payload:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Token incompleto")
+    if payload.get("role") not in {role.value for role in ROLES}:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Permissao insuficiente")
+    return payload
+
+
+def _current() -> Callable[[str], Dict[str, Any]]:
+    checker = security.require_roles(*ROLES)
+    return lambda token: checker(security.verify_token(token))
+
+
+def _tokens(count: int) -> List[str]:
+    return [
+        create_access_token(f"app:integracao.{index}", Role.helpdesk, {"app": f"integracao.{index}"})
+        for index in range(count)
+    ]
+
+
+def measure(auth: Callable[[str], Dict[str, Any]], tokens: List[str], calls: int, repeat: int) -> float:
+    """Menor media, em microssegundos, de ``calls`` autenticacoes em rodizio pelos tokens."""
+    best = float("inf")
+    for _ in range(repeat):
+        security.purge_token_cache()
+        began = time.perf_counter_ns()
+        for index in range(calls):
+            auth(tokens[index % len(tokens)])
+        best = min(best, (time.perf_counter_ns() - began) / calls / 1000)
+    return round(best, 2)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.auth", description=__doc__.splitlines()[0])
+    parser.add_argument("--tokens", type=int, default=8, help="tokens reusados no cenario com cache")
+    parser.add_argument("--calls", type=int, default=100_000, help="autenticacoes por medida")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", default=None, help="grava o resultado em JSON")
+    args = parser.parse_args(argv)
+
+    reused = _tokens(args.tokens)
+    # mais tokens que o cache: toda chamada e miss
+    unique = _tokens(max(args.calls // 10, settings.jwt_token_cache_size + 1))
+    current = _current()
+    results = {
+        "referencia": measure(reference_auth, reused, args.calls, args.repeat),
+        "atual_reusados": measure(current, reused, args.calls, args.repeat),
+        "atual_unicos": measure(current, unique, args.calls // 10, args.repeat),
+    }
+    for name, micros in results.items():
+        print(f"{name:>16} {micros:>8.2f} us/requisicao")
+    if args.output:
+        report = {
+            "meta": {"python": platform.python_version(), "platform": platform.platform(), "tokens": args.tokens},
+            "us_per_request": results,
+        }
+        Path(args.output).write_text(json.dumps(report, indent=2) + "\n", encoding="utf-8")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,67 @@
+"""Compara dois resultados de ``benchmarks.load`` (por exemplo, de commits diferentes).
+
+Uso: ``python -m benchmarks.compare base.json novo.json [--fail-above 10]``.
+"""
+
+import argparse
+import json
+import sys
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+LATENCY_KEYS = ("p50_ms", "p95_ms", "p99_ms")
+
+
+def _load(path: str) -> Dict[str, Any]:
+    return json.loads(Path(path).read_text(encoding="utf-8"))
+
+
+def _change(before: float, after: float) -> Optional[float]:
+    if not before:
+        return None
+    return (after - before) / before * 100
+
+
+def _fmt(change: Optional[float]) -> str:
+    return "   n/a" if change is None else f"{change:+6.1f}%"
+
+
+def compare(base: Dict[str, Any], new: Dict[str, Any], fail_above: Optional[float]) -> int:
+    print(f"base: {base['meta'].get('commit', '')[:12]}  novo: {new['meta'].get('commit', '')[:12]}")
+    regressions: List[str] = []
+    routes = sorted(set(base["routes"]) | set(new["routes"]))
+    for route in ["overall", *routes]:
+        before = base["overall"] if route == "overall" else base["routes"].get(route)
+        after = new["overall"] if route == "overall" else new["routes"].get(route)
+        if before is None or after is None:
+            print(f"  {route:55} presente so em um dos resultados")
+            continue
+        columns = []
+        for key in LATENCY_KEYS:
+            change = _change(before[key], after[key])
+            columns.append(f"{key[:-3]} {before[key]:>9.1f} -> {after[key]:>9.1f} {_fmt(change)}")
+            if fail_above is not None and change is not None and change > fail_above:
+                regressions.append(f"{route} {key}")
+        rps = _change(before["throughput_rps"], after["throughput_rps"])
+        columns.append(f"rps {_fmt(rps)}")
+        print(f"  {route:55} " + "  ".join(columns))
+    server_before, server_after = base["server"], new["server"]
+    for key in ("peak_tree_rss_bytes", "peak_subprocesses"):
+        print(f"  {key:55} {server_before[key]} -> {server_after[key]} {_fmt(_change(server_before[key], server_after[key]))}")
+    if regressions:
+        print(f"Regressoes acima de {fail_above}%: " + ", ".join(regressions))
+        return 1
+    return 0
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.compare", description=__doc__.splitlines()[0])
+    parser.add_argument("base")
+    parser.add_argument("new")
+    parser.add_argument("--fail-above", type=float, default=None, help="falha se alguma latencia piorar mais que N%%")
+    args = parser.parse_args(argv)
+    return compare(_load(args.base), _load(args.new), args.fail_above)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
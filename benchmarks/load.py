@@ -0,0 +1,541 @@
+"""Benchmark de carga ponta a ponta da API contra o diretorio falso (fakeldap).
+
+Sobe o uvicorn num diretorio de trabalho isolado (banco SQLite, copia dos
+scripts e do diretorio falso), dispara uma mistura de requisicoes com N
+clientes concorrentes por um tempo fixo e grava um JSON com vazao, latencias
+por rota e consumo do servidor. Uso: ``python -m benchmarks.load --help``.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import secrets
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+DEVTOOLS_DIR = REPO_ROOT / "scripts_ad" / "devtools"
+FAKELDAP_BIN = DEVTOOLS_DIR / "fakeldap" / "bin"
+RESULTS_DIR = REPO_ROOT / "benchmarks" / "results"
+API = "/api/v1"
+
+MIXES: Dict[str, Dict[str, int]] = {
+    # portal interno: leitura de perfil e grupos
+    "portal": {"get_user": 55, "get_user_fields": 15, "get_group": 20, "list_users": 5, "list_groups": 5},
+    # rajada de admissoes: cria, coloca em grupo, troca senha e confere
+    "onboarding": {"create_user": 30, "add_to_group": 30, "reset_password": 10, "get_user": 30},
+    # sincronizacoes concorrentes com leitura de fundo
+    "sync": {"sync_users": 10, "sync_groups": 10, "get_user": 60, "get_group": 20},
+}
+
+Request = Tuple[str, str, str, Optional[Dict[str, Any]]]
+
+
+@dataclass
+class Pools:
+    users: List[str]
+    groups: List[str]
+    created: List[str] = field(default_factory=list)
+    counter: int = 0
+    run_id: str = field(default_factory=lambda: secrets.token_hex(3))
+
+    def new_username(self) -> str:
+        self.counter += 1
+        return f"bench.{self.run_id}.{self.counter}"
+
+    def any_user(self, rng: random.Random) -> str:
+        if self.created and rng.random() < 0.5:
+            return rng.choice(self.created)
+        return rng.choice(self.users)
+
+
+def _get_user(rng: random.Random, pools: Pools) -> Request:
+    return "GET", f"{API}/users/{{username}}", f"{API}/users/{rng.choice(pools.users)}", None
+
+
+def _get_user_fields(rng: random.Random, pools: Pools) -> Request:
+    path = f"{API}/users/{rng.choice(pools.users)}?fields=mail,displayName,memberOf"
+    return "GET", f"{API}/users/{{username}}?fields", path, None
+
+
+def _get_group(rng: random.Random, pools: Pools) -> Request:
+    return "GET", f"{API}/groups/{{groupname}}", f"{API}/groups/{rng.choice(pools.groups)}", None
+
+
+def _list_users(rng: random.Random, pools: Pools) -> Request:
+    return "GET", f"{API}/users", f"{API}/users", None
+
+
+def _list_groups(rng: random.Random, pools: Pools) -> Request:
+    return "GET", f"{API}/groups", f"{API}/groups", None
+
+
+def _create_user(rng: random.Random, pools: Pools) -> Request:
+    username = pools.new_username()
+    pools.created.append(username)
+    body = {
+        "username": username,
+        "password": "Bench@12345",
+        "given_name": "Bench",
+        "surname": str(pools.counter),
+        "display_name": f"Bench {pools.run_id} {pools.counter}",
+        "mail": f"{username}@bench.local",
+    }
+    return "POST", f"{API}/users", f"{API}/users", body
+
+
+def _add_to_group(rng: random.Random, pools: Pools) -> Request:
+    group = rng.choice(pools.groups)
+    body = {"member": pools.any_user(rng)}
+    return "POST", f"{API}/groups/{{groupname}}/members", f"{API}/groups/{group}/members", body
+
+
+def _reset_password(rng: random.Random, pools: Pools) -> Request:
+    path = f"{API}/users/{pools.any_user(rng)}/reset-password"
+    return "POST", f"{API}/users/{{username}}/reset-password", path, {"new_password": "Bench@54321"}
+
+
+def _sync_users(rng: random.Random, pools: Pools) -> Request:
+    return "POST", f"{API}/sync/users", f"{API}/sync/users", None
+
+
+def _sync_groups(rng: random.Random, pools: Pools) -> Request:
+    return "POST", f"{API}/sync/groups", f"{API}/sync/groups", None
+
+
+ACTIONS: Dict[str, Callable[[random.Random, Pools], Request]] = {
+    "get_user": _get_user,
+    "get_user_fields": _get_user_fields,
+    "get_group": _get_group,
+    "list_users": _list_users,
+    "list_groups": _list_groups,
+    "create_user": _create_user,
+    "add_to_group": _add_to_group,
+    "reset_password": _reset_password,
+    "sync_users": _sync_users,
+    "sync_groups": _sync_groups,
+}
+
+
+def parse_mix(value: str) -> Dict[str, int]:
+    if value in MIXES:
+        return MIXES[value]
+    mix: Dict[str, int] = {}
+    for item in value.split(","):
+        name, _, weight = item.partition("=")
+        name = name.strip()
+        if name not in ACTIONS:
+            raise argparse.ArgumentTypeError(f"acao desconhecida: {name} (validas: {', '.join(ACTIONS)})")
+        mix[name] = int(weight or 1)
+    return mix
+
+
+# ---- estatisticas ---------------------------------------------------------
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, int(round(pct / 100 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+@dataclass
+class RouteStats:
+    latencies: List[float] = field(default_factory=list)
+    statuses: Dict[str, int] = field(default_factory=dict)
+    errors: int = 0
+
+    def record(self, status: str, elapsed: float) -> None:
+        self.latencies.append(elapsed)
+        self.statuses[status] = self.statuses.get(status, 0) + 1
+        if not status.isdigit() or int(status) >= 400:
+            self.errors += 1
+
+    def summary(self, duration: float) -> Dict[str, Any]:
+        ordered = sorted(self.latencies)
+        return {
+            "count": len(ordered),
+            "errors": self.errors,
+            "statuses": dict(sorted(self.statuses.items())),
+            "throughput_rps": round(len(ordered) / duration, 3) if duration else 0.0,
+            "p50_ms": round(percentile(ordered, 50) * 1000, 2),
+            "p95_ms": round(percentile(ordered, 95) * 1000, 2),
+            "p99_ms": round(percentile(ordered, 99) * 1000, 2),
+            "max_ms": round((ordered[-1] if ordered else 0.0) * 1000, 2),
+        }
+
+
+# ---- amostragem do servidor -----------------------------------------------
+
+
+def _children(pid: int) -> List[int]:
+    found: List[int] = []
+    try:
+        for task in os.listdir(f"/proc/{pid}/task"):
+            with open(f"/proc/{pid}/task/{task}/children", encoding="ascii") as fp:
+                found.extend(int(item) for item in fp.read().split())
+    except OSError:
+        pass
+    return found
+
+
+def _rss_bytes(pid: int) -> int:
+    try:
+        with open(f"/proc/{pid}/statm", encoding="ascii") as fp:
+            return int(fp.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        return 0
+
+
+class ProcessSampler:
+    """Amostra a arvore de processos do servidor (Linux, via /proc)."""
+
+    def __init__(self, pid: int, worker_depth: int = 0, interval: float = 0.05) -> None:
+        self.pid = pid
+        # com --workers o uvicorn cria processos intermediarios que nao sao scripts
+        self.worker_depth = worker_depth
+        self.interval = interval
+        self.peak_rss = 0
+        self.peak_tree_rss = 0
+        self.peak_subprocesses = 0
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="bench-sampler", daemon=True)
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            pending = [(self.pid, 0)]
+            tree: List[int] = []
+            scripts = 0
+            while pending:
+                current, depth = pending.pop()
+                tree.append(current)
+                scripts += depth > self.worker_depth
+                pending.extend((child, depth + 1) for child in _children(current))
+            self.peak_rss = max(self.peak_rss, _rss_bytes(self.pid))
+            self.peak_tree_rss = max(self.peak_tree_rss, sum(_rss_bytes(pid) for pid in tree))
+            self.peak_subprocesses = max(self.peak_subprocesses, scripts)
+            self.samples += 1
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+
+def scrape_metrics(text: str) -> Dict[str, float]:
+    from prometheus_client.parser import text_string_to_metric_families
+
+    totals = {"scripts_spawned": 0.0, "script_timeouts": 0.0, "db_lock_errors": 0.0, "load_shed": 0.0}
+    totals.update({"db_commit_seconds": 0.0, "db_commits": 0.0})
+    for family in text_string_to_metric_families(text):
+        for sample in family.samples:
+            if sample.name == "ad_script_exits_total":
+                totals["scripts_spawned"] += sample.value
+            elif sample.name == "ad_script_timeouts_total":
+                totals["script_timeouts"] += sample.value
+            elif sample.name == "ad_load_shed_total":
+                totals["load_shed"] += sample.value
+            elif sample.name == "db_lock_errors_total":
+                totals["db_lock_errors"] += sample.value
+            elif sample.name == "db_commit_seconds_sum":
+                totals["db_commit_seconds"] += sample.value
+            elif sample.name == "db_commit_seconds_count":
+                totals["db_commits"] += sample.value
+    return totals
+
+
+def _delta(before: Dict[str, float], after: Dict[str, float]) -> Dict[str, float]:
+    return {key: round(after.get(key, 0.0) - before.get(key, 0.0), 6) for key in after}
+
+
+# ---- ambiente -------------------------------------------------------------
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _git(*args: str) -> str:
+    try:
+        return subprocess.run(
+            ["git", *args], cwd=REPO_ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def prepare_workdir(args: argparse.Namespace, workdir: Path) -> Path:
+    scripts_dir = workdir / "scripts_ad"
+    shutil.copytree(REPO_ROOT / "scripts_ad", scripts_dir, ignore=shutil.ignore_patterns("devtools"))
+    for script in scripts_dir.rglob("*.sh"):
+        script.chmod(0o755)
+    directory = workdir / "fakeldap.sqlite3"
+    if args.directory and Path(args.directory).exists():
+        shutil.copyfile(args.directory, directory)
+    else:
+        subprocess.run(
+            [
+                sys.executable, "-m", "fakeldap", "seed",
+                "--db", str(directory),
+                "--users", str(args.users),
+                "--groups", str(args.groups),
+                "--seed", str(args.seed),
+            ],
+            env={**os.environ, "PYTHONPATH": str(DEVTOOLS_DIR)},
+            check=True,
+        )
+        if args.directory:
+            shutil.copyfile(directory, args.directory)
+    return directory
+
+
+def load_pools(directory: Path, users_ou: str, sample: int, seed: int) -> Pools:
+    sys.path.insert(0, str(DEVTOOLS_DIR))
+    from fakeldap.directory import Directory
+    from fakeldap.schema import normalize_dn
+
+    ldap = Directory(str(directory))
+    try:
+        rows = ldap.conn.execute(
+            "SELECT i.value, o.value, i.dn_key FROM eq_index i JOIN eq_index o ON o.dn_key = i.dn_key "
+            "WHERE i.attr = 'samaccountname' AND o.attr = 'objectclass' AND o.value IN ('user', 'group')"
+        ).fetchall()
+    finally:
+        ldap.close()
+    # so contas dentro de USERS_OU, que e onde os scripts procuram usuarios
+    suffix = "," + normalize_dn(users_ou)
+    rng = random.Random(seed)
+    users = sorted({name for name, kind, key in rows if kind == "user" and key.endswith(suffix)})
+    users = [name for name in users if not name.endswith("$")]
+    groups = sorted({name for name, kind, _ in rows if kind == "group"})
+    return Pools(
+        users=rng.sample(users, min(sample, len(users))),
+        groups=rng.sample(groups, min(sample, len(groups))),
+    )
+
+
+def server_env(args: argparse.Namespace, workdir: Path, directory: Path, secret: str) -> Dict[str, str]:
+    env = {
+        **os.environ,
+        "PATH": f"{FAKELDAP_BIN}{os.pathsep}{os.environ.get('PATH', '')}",
+        "PYTHONPATH": str(REPO_ROOT),
+        "FAKELDAP_DB": str(directory),
+        "FAKELDAP_LATENCY_MS": str(args.ldap_latency_ms),
+        "AD_SCRIPTS_DIR": str(workdir / "scripts_ad"),
+        "DATABASE_URL": f"sqlite:///{workdir / 'app.db'}",
+        "JWT_SECRET_KEY": secret,
+        "LDAP_URI": "ldap://fakeldap",
+        "BIND_DN": "CN=bench",
+        "BIND_PW": "bench",
+        "METRICS_ENABLED": "true",
+        "RATE_LIMIT_PER_MINUTE": "100000000",
+        "RATE_LIMIT_BURST": "100000000",
+    }
+    if args.workers > 1:
+        metrics_dir = workdir / "metrics"
+        metrics_dir.mkdir()
+        env["PROMETHEUS_MULTIPROC_DIR"] = str(metrics_dir)
+    return env
+
+
+def start_server(args: argparse.Namespace, env: Dict[str, str], port: int, log_path: Path) -> subprocess.Popen:
+    command = [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port)]
+    command += ["--log-level", "warning"]
+    if args.workers > 1:
+        command += ["--workers", str(args.workers)]
+    log = log_path.open("wb")
+    return subprocess.Popen(command, cwd=REPO_ROOT, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+
+def stop_server(proc: subprocess.Popen) -> None:
+    proc.send_signal(signal.SIGINT)
+    try:
+        proc.wait(timeout=15)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+        proc.wait()
+
+
+# ---- carga ----------------------------------------------------------------
+
+
+async def _wait_ready(client: Any, proc: subprocess.Popen, deadline: float) -> None:
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"Servidor encerrou com codigo {proc.returncode} (veja server.log)")
+        try:
+            response = await client.get("/metrics")
+            if response.status_code == 200:
+                return
+        except Exception:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError("Servidor nao respondeu a tempo (veja server.log no diretorio de trabalho)")
+
+
+async def run_load(
+    args: argparse.Namespace, proc: subprocess.Popen, base_url: str, token: str, pools: Pools
+) -> Dict[str, Any]:
+    import httpx
+
+    mix = args.mix
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    stats: Dict[str, RouteStats] = {}
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    headers = {"Authorization": f"Bearer {token}", "Accept-Encoding": "identity"}
+    async with httpx.AsyncClient(base_url=base_url, headers=headers, timeout=args.timeout, limits=limits) as client:
+        await _wait_ready(client, proc, time.monotonic() + args.startup_timeout)
+        before = scrape_metrics((await client.get("/metrics")).text)
+
+        async def worker(index: int, until: float, measure: bool) -> None:
+            rng = random.Random(args.seed * 1000 + index)
+            while time.monotonic() < until:
+                method, route, path, body = ACTIONS[rng.choices(names, weights)[0]](rng, pools)
+                start = time.perf_counter()
+                try:
+                    response = await client.request(method, path, json=body)
+                    status = str(response.status_code)
+                except httpx.HTTPError as exc:
+                    status = type(exc).__name__
+                elapsed = time.perf_counter() - start
+                if measure:
+                    stats.setdefault(f"{method} {route}", RouteStats()).record(status, elapsed)
+
+        if args.warmup > 0:
+            until = time.monotonic() + args.warmup
+            await asyncio.gather(*(worker(i, until, False) for i in range(args.concurrency)))
+        started = time.monotonic()
+        until = started + args.duration
+        await asyncio.gather(*(worker(i, until, True) for i in range(args.concurrency)))
+        elapsed = time.monotonic() - started
+        after = scrape_metrics((await client.get("/metrics")).text)
+
+    total = sum(len(route.latencies) for route in stats.values())
+    overall = RouteStats()
+    for route in stats.values():
+        overall.latencies.extend(route.latencies)
+        overall.errors += route.errors
+    summary = overall.summary(elapsed)
+    summary.pop("statuses")
+    return {
+        "duration_s": round(elapsed, 3),
+        "requests": total,
+        "overall": summary,
+        "routes": {name: route.summary(elapsed) for name, route in sorted(stats.items())},
+        "server_metrics": _delta(before, after),
+    }
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.load", description=__doc__.splitlines()[0])
+    parser.add_argument("--mix", type=parse_mix, default="portal", help=f"{'|'.join(MIXES)} ou acao=peso,...")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=30.0, help="segundos medidos")
+    parser.add_argument("--warmup", type=float, default=3.0, help="segundos descartados antes da medicao")
+    parser.add_argument("--workers", type=int, default=1, help="workers do uvicorn")
+    parser.add_argument("--users", type=int, default=10000, help="usuarios do diretorio gerado")
+    parser.add_argument("--groups", type=int, default=500, help="grupos do diretorio gerado")
+    parser.add_argument("--directory", default=None, help="SQLite do fakeldap a reaproveitar (gerado se nao existir)")
+    parser.add_argument("--ldap-latency-ms", type=int, default=0, help="FAKELDAP_LATENCY_MS por operacao LDAP")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--timeout", type=float, default=120.0, help="timeout por requisicao")
+    parser.add_argument("--startup-timeout", type=float, default=30.0)
+    parser.add_argument("--output", default=None, help="arquivo JSON (padrao: benchmarks/results/)")
+    parser.add_argument("--keep-workdir", action="store_true")
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    workdir = Path(tempfile.mkdtemp(prefix="api-ad-bench-"))
+    secret = secrets.token_urlsafe(32)
+    os.environ["JWT_SECRET_KEY"] = secret
+    sys.path.insert(0, str(REPO_ROOT))
+    from core.config import settings
+    from core.security import Role, create_access_token
+
+    token = create_access_token("benchmark", Role.admin)
+    try:
+        directory = prepare_workdir(args, workdir)
+        pools = load_pools(directory, settings.users_ou, 2000, args.seed)
+        port = _free_port()
+        proc = start_server(args, server_env(args, workdir, directory, secret), port, workdir / "server.log")
+        sampler = ProcessSampler(proc.pid, worker_depth=1 if args.workers > 1 else 0)
+        sampler.start()
+        try:
+            result = asyncio.run(run_load(args, proc, f"http://127.0.0.1:{port}", token, pools))
+        finally:
+            sampler.stop()
+            stop_server(proc)
+    finally:
+        if args.keep_workdir:
+            print(f"diretorio de trabalho: {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    commit = _git("rev-parse", "HEAD")
+    report = {
+        "meta": {
+            "started_at": datetime.now(timezone.utc).isoformat(),
+            "commit": commit,
+            "dirty": bool(_git("status", "--porcelain", "--untracked-files=no")),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "args": {key: value for key, value in vars(args).items() if key != "output"},
+        },
+        **result,
+        "server": {
+            "peak_rss_bytes": sampler.peak_rss,
+            "peak_tree_rss_bytes": sampler.peak_tree_rss,
+            "peak_subprocesses": sampler.peak_subprocesses,
+            "samples": sampler.samples,
+        },
+    }
+    if args.output:
+        output = Path(args.output)
+    else:
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+        output = RESULTS_DIR / f"{stamp}-{(commit or 'nogit')[:8]}-{'+'.join(sorted(args.mix))[:40]}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2, ensure_ascii=True) + "\n", encoding="utf-8")
+
+    overall = result["overall"]
+    print(f"{result['requests']} requisicoes em {result['duration_s']}s ({overall['throughput_rps']} req/s)")
+    for name, route in result["routes"].items():
+        print(
+            f"  {name:55} n={route['count']:<6} err={route['errors']:<4} "
+            f"p50={route['p50_ms']}ms p95={route['p95_ms']}ms p99={route['p99_ms']}ms"
+        )
+    metrics = result["server_metrics"]
+    print(
+        f"subprocessos={int(metrics['scripts_spawned'])} (pico {sampler.peak_subprocesses}) "
+        f"rss_pico={sampler.peak_tree_rss // 1024 // 1024}MiB db_lock_errors={int(metrics['db_lock_errors'])} "
+        f"commit_total={metrics['db_commit_seconds']:.3f}s descartes={int(metrics['load_shed'])}"
+    )
+    print(f"resultado: {output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
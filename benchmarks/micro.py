@@ -0,0 +1,224 @@
+"""Microbenchmarks das primitivas de parsing e hash de services/script_runner.
+
+Gera corpora LDIF sinteticos (com valores base64, atributos multivalorados e
+linhas longas) e mede tempo e alocacao por entrada de cada funcao e das
+implementacoes de referencia/candidatas. ``--check`` compara com o baseline
+gravado e falha se alguma medida piorar alem do limite.
+Uso: ``python -m benchmarks.micro --help``.
+"""
+
+import argparse
+import base64
+import gc
+import hashlib
+import json
+import platform
+import random
+import sys
+import time
+import tracemalloc
+import uuid
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+BASELINE = REPO_ROOT / "benchmarks" / "baselines" / "micro.json"
+DEFAULT_SIZES = (1000, 10000, 50000)
+sys.path.insert(0, str(REPO_ROOT))
+
+from services import script_runner  # noqa: E402
+
+
+# ---- corpus ---------------------------------------------------------------
+
+
+def _entry(rng: random.Random, index: int) -> List[str]:
+    name = f"Usuario {index} Conceição" if index % 7 == 0 else f"Usuario {index}"
+    dn = f"CN={name},OU=Usuarios,OU=Nabarrete,DC=nabarrete,DC=local"
+    lines = []
+    if name.isascii():
+        lines.append(f"dn: {dn}")
+    else:
+        lines.append(f"dn:: {base64.b64encode(dn.encode()).decode()}")
+    lines += [f"objectClass: {value}" for value in ("top", "person", "organizationalPerson", "user")]
+    sam = f"usuario.{index}"
+    lines += [
+        f"cn: {name}" if name.isascii() else f"cn:: {base64.b64encode(name.encode()).decode()}",
+        f"sAMAccountName: {sam}",
+        f"userPrincipalName: {sam}@nabarrete.local",
+        f"displayName: {name}",
+        f"mail: {sam}@nabarrete.local",
+        f"objectGUID:: {base64.b64encode(uuid.UUID(int=rng.getrandbits(128)).bytes_le).decode()}",
+        f"objectSid:: {base64.b64encode(rng.randbytes(28)).decode()}",
+        f"userAccountControl: {rng.choice((512, 514, 66048))}",
+        f"whenChanged: 2026{rng.randint(1, 12):02d}{rng.randint(1, 28):02d}101010.0Z",
+        f"description: {'Descricao longa do colaborador ' * rng.randint(1, 12)}",
+    ]
+    lines += [f"proxyAddresses: smtp:{sam}.{n}@nabarrete.local" for n in range(rng.randint(1, 4))]
+    lines += [
+        f"memberOf: CN=GRP-{rng.randint(0, 5000):05d},OU=Grupos,OU=Nabarrete,DC=nabarrete,DC=local"
+        for _ in range(rng.randint(0, 25))
+    ]
+    if rng.random() < 0.1:
+        lines.append(f"thumbnailPhoto:: {base64.b64encode(rng.randbytes(rng.randint(1024, 4096))).decode()}")
+    return lines
+
+
+def build_corpus(size: int, seed: int = 42) -> str:
+    rng = random.Random(seed + size)
+    parts = ["STATUS=OK", "ACTION=sync_users", "IDENTIFIER=users", "DATA_BEGIN"]
+    for index in range(size):
+        parts.extend(_entry(rng, index))
+        parts.append("")
+    parts.append("DATA_END")
+    return "\n".join(parts) + "\n"
+
+
+# ---- implementacoes de referencia e candidatas -----------------------------
+
+
+def reference_extract_data_block(output: str) -> str:
+    # versao anterior: divide a saida inteira em linhas e junta de novo
+    lines = output.splitlines()
+    start = lines.index("DATA_BEGIN")
+    end = lines.index("DATA_END")
+    return "\n".join(lines[start + 1 : end]).strip()
+
+
+def reference_normalize_for_hash(payload: Dict[str, Any]) -> str:
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, ensure_ascii=True).encode("utf-8")).hexdigest()
+
+
+def candidate_orjson_hash(payload: Dict[str, Any]) -> str:
+    # mais rapido, mas gera bytes diferentes (todos os ad_hash gravados mudariam)
+    import orjson
+
+    return hashlib.sha256(orjson.dumps(payload, option=orjson.OPT_SORT_KEYS)).hexdigest()
+
+
+Case = Tuple[Callable[[str], Any], Callable[[Any], Any]]
+
+
+def _payloads(corpus: str) -> List[Dict[str, Any]]:
+    entries = script_runner.parse_ldif_entries(script_runner.extract_data_block(corpus))
+    return [{"id": entry.get("sAMAccountName"), "attributes": entry} for entry in entries]
+
+
+def _hash_all(function: Callable[[Dict[str, Any]], str]) -> Callable[[List[Dict[str, Any]]], Any]:
+    return lambda payloads: [function(payload) for payload in payloads]
+
+
+CASES: Dict[str, Case] = {
+    "extract_data_block": (lambda corpus: corpus, script_runner.extract_data_block),
+    "extract_data_block[referencia]": (lambda corpus: corpus, reference_extract_data_block),
+    "parse_ldif_entries": (script_runner.extract_data_block, script_runner.parse_ldif_entries),
+    "iter_ldif_entries[stream]": (
+        lambda corpus: script_runner.extract_data_block(corpus).splitlines(),
+        lambda lines: sum(1 for _ in script_runner.iter_ldif_entries(iter(lines))),
+    ),
+    "normalize_for_hash": (_payloads, _hash_all(script_runner.normalize_for_hash)),
+    "normalize_for_hash[referencia]": (_payloads, _hash_all(reference_normalize_for_hash)),
+    "normalize_for_hash[orjson]": (_payloads, _hash_all(candidate_orjson_hash)),
+}
+# casos que nao medem codigo do repositorio: ficam fora do --check
+COMPARISON_CASES = {"extract_data_block[referencia]", "normalize_for_hash[referencia]", "normalize_for_hash[orjson]"}
+
+
+# ---- medicao --------------------------------------------------------------
+
+
+def measure(function: Callable[[Any], Any], argument: Any, entries: int, repeat: int) -> Dict[str, float]:
+    timings = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter_ns()
+        function(argument)
+        timings.append(time.perf_counter_ns() - start)
+    gc.collect()
+    tracemalloc.start()
+    try:
+        function(argument)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {
+        "ns_per_entry": round(min(timings) / entries, 1),
+        "peak_bytes_per_entry": round(peak / entries, 1),
+    }
+
+
+def run(sizes: List[int], cases: List[str], repeat: int) -> Dict[str, Dict[str, Dict[str, float]]]:
+    results: Dict[str, Dict[str, Dict[str, float]]] = {}
+    for size in sizes:
+        corpus = build_corpus(size)
+        print(f"corpus {size} entradas ({len(corpus) / 1024 / 1024:.1f} MiB)")
+        for name in cases:
+            setup, function = CASES[name]
+            argument = setup(corpus)
+            result = measure(function, argument, size, repeat)
+            results.setdefault(name, {})[str(size)] = result
+            print(f"  {name:34} {result['ns_per_entry']:>10.1f} ns/entrada {result['peak_bytes_per_entry']:>10.1f} B/entrada")
+    return results
+
+
+def check(results: Dict[str, Dict[str, Dict[str, float]]], baseline: Dict[str, Any], threshold: float) -> List[str]:
+    failures = []
+    for name, by_size in results.items():
+        if name in COMPARISON_CASES:
+            continue
+        for size, current in by_size.items():
+            reference = baseline.get("results", {}).get(name, {}).get(size)
+            if not reference:
+                continue
+            for key in ("ns_per_entry", "peak_bytes_per_entry"):
+                if reference[key] and current[key] > reference[key] * (1 + threshold / 100):
+                    change = (current[key] - reference[key]) / reference[key] * 100
+                    failures.append(f"{name} [{size}] {key}: {reference[key]} -> {current[key]} (+{change:.0f}%)")
+    return failures
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.micro", description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)), help="ex.: 1000,10000,200000")
+    parser.add_argument("--cases", default=",".join(CASES), help="subconjunto de casos separados por virgula")
+    parser.add_argument("--repeat", type=int, default=5, help="execucoes por medida (vale a mais rapida)")
+    parser.add_argument("--baseline", default=str(BASELINE))
+    parser.add_argument("--check", action="store_true", help="falha se piorar alem de --threshold")
+    parser.add_argument("--threshold", type=float, default=25.0, help="tolerancia em %% para --check")
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--output", default=None, help="grava o resultado em JSON")
+    args = parser.parse_args(argv)
+
+    cases = [name.strip() for name in args.cases.split(",") if name.strip()]
+    unknown = [name for name in cases if name not in CASES]
+    if unknown:
+        parser.error(f"casos desconhecidos: {', '.join(unknown)}")
+    sizes = [int(size) for size in args.sizes.split(",")]
+    results = run(sizes, cases, args.repeat)
+    report = {
+        "meta": {"python": platform.python_version(), "platform": platform.platform(), "repeat": args.repeat},
+        "results": results,
+    }
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2) + "\n", encoding="utf-8")
+    baseline_path = Path(args.baseline)
+    if args.update_baseline:
+        baseline_path.parent.mkdir(parents=True, exist_ok=True)
+        baseline_path.write_text(json.dumps(report, indent=2) + "\n", encoding="utf-8")
+        print(f"baseline atualizado: {baseline_path}")
+    if args.check:
+        if not baseline_path.exists():
+            print(f"baseline inexistente: {baseline_path} (rode com --update-baseline)", file=sys.stderr)
+            return 2
+        failures = check(results, json.loads(baseline_path.read_text(encoding="utf-8")), args.threshold)
+        if failures:
+            print(f"Regressoes acima de {args.threshold}%:", file=sys.stderr)
+            for failure in failures:
+                print(f"  {failure}", file=sys.stderr)
+            return 1
+        print("Sem regressoes em relacao ao baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,166 @@
+"""Benchmark do rate limit em memoria com milhoes de chaves distintas.
+
+Alimenta o limitador com chaves unicas (``ip:/api/v1/users/<nome>/...``, como
+usernames no path geram em producao) e registra, a cada faixa de chaves, o custo
+medio de ``allow()`` e a memoria retida pelo limitador. Compara com a versao
+anterior (dict sem limite e lock global) e, com ``--threads``, mede a vazao com
+varias threads disputando o limitador. ``--limiters sqlite`` mede o backend
+compartilhado entre workers (a memoria dele fica no arquivo, nao no processo).
+Uso: ``python -m benchmarks.rate_limit --help``.
+"""
+
+import argparse
+import gc
+import json
+import platform
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO_ROOT))
+
+from core.config import settings  # noqa: E402
+from core.rate_limit import InMemoryRateLimiter, SQLiteRateLimiter  # noqa: E402
+
+
+@dataclass
+class Bucket:
+    tokens: float
+    last: float
+
+
+class ReferenceRateLimiter:
+    # versao anterior: um Bucket por chave para sempre, sob um unico lock
+    def __init__(self) -> None:
+        self._store: Dict[str, Bucket] = {}
+        self._lock = threading.Lock()
+
+    def allow(self, key: str) -> bool:
+        now = time.monotonic()
+        refill_rate = settings.rate_limit_per_minute / 60.0
+        burst = settings.rate_limit_burst
+        with self._lock:
+            bucket = self._store.get(key)
+            if bucket is None:
+                bucket = Bucket(tokens=burst, last=now)
+                self._store[key] = bucket
+            elapsed = now - bucket.last
+            bucket.tokens = min(burst, bucket.tokens + elapsed * refill_rate)
+            bucket.last = now
+            if bucket.tokens >= 1:
+                bucket.tokens -= 1
+                return True
+            return False
+
+
+def _key(index: int) -> str:
+    return f"10.{index >> 16 & 255}.{index >> 8 & 255}.{index & 255}:/api/v1/users/usuario.{index}/reset-password"
+
+
+def build(name: str, max_keys: int, shards: int) -> Any:
+    if name == "referencia":
+        return ReferenceRateLimiter()
+    if name == "sqlite":
+        # arquivo novo a cada medicao; fica ao lado dos temporarios do sistema
+        path = Path(tempfile.mkdtemp(prefix="rate-limit-")) / "rate_limit.sqlite3"
+        return SQLiteRateLimiter(str(path))
+    return InMemoryRateLimiter(max_keys=max_keys, shards=shards)
+
+
+def timeline(factory: Callable[[], Any], keys: int, step: int, *, memory: bool) -> List[Dict[str, float]]:
+    """Custo de allow() e memoria (com ``memory``) a cada ``step`` chaves novas."""
+    gc.collect()
+    if memory:
+        tracemalloc.start()
+    try:
+        limiter = factory()
+        points = []
+        for start in range(0, keys, step):
+            batch = [_key(index) for index in range(start, min(keys, start + step))]
+            began = time.perf_counter_ns()
+            for key in batch:
+                limiter.allow(key)
+            elapsed = time.perf_counter_ns() - began
+            point = {"keys": start + len(batch), "ns_per_allow": round(elapsed / len(batch), 1)}
+            if memory:
+                del batch
+                point["retained_mib"] = round(tracemalloc.get_traced_memory()[0] / 1024 / 1024, 1)
+            points.append(point)
+        return points
+    finally:
+        if memory:
+            tracemalloc.stop()
+
+
+def contention(factory: Callable[[], Any], threads: int, calls: int) -> float:
+    """Chamadas por segundo com ``threads`` threads, cada uma com suas chaves."""
+    limiter = factory()
+    keys = [[_key(worker * calls + index % 1000) for index in range(calls)] for worker in range(threads)]
+    barrier = threading.Barrier(threads + 1)
+
+    def work(batch: List[str]) -> None:
+        barrier.wait()
+        for key in batch:
+            limiter.allow(key)
+
+    workers = [threading.Thread(target=work, args=(batch,)) for batch in keys]
+    for worker in workers:
+        worker.start()
+    barrier.wait()
+    began = time.perf_counter()
+    for worker in workers:
+        worker.join()
+    return round(threads * calls / (time.perf_counter() - began))
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.rate_limit", description=__doc__.splitlines()[0])
+    parser.add_argument("--keys", type=int, default=2_000_000, help="chaves distintas enviadas")
+    parser.add_argument("--step", type=int, default=250_000, help="chaves por ponto medido")
+    parser.add_argument("--max-keys", type=int, default=settings.rate_limit_max_keys)
+    parser.add_argument("--shards", type=int, default=settings.rate_limit_shards)
+    parser.add_argument("--limiters", default="atual,referencia", help="atual, referencia e/ou sqlite")
+    parser.add_argument("--threads", type=int, default=8, help="threads no teste de disputa (0 pula)")
+    parser.add_argument("--output", default=None, help="grava o resultado em JSON")
+    args = parser.parse_args(argv)
+
+    names = [name.strip() for name in args.limiters.split(",") if name.strip()]
+    report: Dict[str, Any] = {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "max_keys": args.max_keys,
+            "shards": args.shards,
+        },
+        "results": {},
+    }
+    for name in names:
+        factory = lambda name=name: build(name, args.max_keys, args.shards)  # noqa: E731
+        timing = timeline(factory, args.keys, args.step, memory=False)
+        retained = timeline(factory, args.keys, args.step, memory=True)
+        result: Dict[str, Any] = {
+            "points": [dict(point, retained_mib=mem["retained_mib"]) for point, mem in zip(timing, retained)]
+        }
+        print(name)
+        for point in result["points"]:
+            print(f"  {point['keys']:>10} chaves {point['ns_per_allow']:>8.1f} ns/allow {point['retained_mib']:>8.1f} MiB")
+        if args.threads:
+            result["calls_per_second"] = {
+                "1": contention(factory, 1, 200_000),
+                str(args.threads): contention(factory, args.threads, 200_000),
+            }
+            print(f"  vazao: {result['calls_per_second']} chamadas/s por numero de threads")
+        report["results"][name] = result
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2) + "\n", encoding="utf-8")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,472 @@
+"""Reproduz o trafego registrado em ``audit_logs`` contra a API com o diretorio falso.
+
+Le uma janela de registros de auditoria (banco de producao ou copia), remonta a
+sequencia de requisicoes com os intervalos originais entre chegadas (ou
+acelerados por ``--speed``) e dispara cada uma no seu horario, sem esperar as
+anteriores. Os identificadores registrados sao mapeados de forma estavel para
+contas do diretorio falso. O resultado segue o formato de ``benchmarks.load``
+(comparavel com ``benchmarks.compare``) e traz a carga registrada ao lado da
+latencia medida. Uso: ``python -m benchmarks.replay --help``.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import secrets
+import shutil
+import sys
+import tempfile
+import time
+import zlib
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from benchmarks.load import (
+    API,
+    REPO_ROOT,
+    RESULTS_DIR,
+    Pools,
+    ProcessSampler,
+    Request,
+    RouteStats,
+    _delta,
+    _free_port,
+    _git,
+    _wait_ready,
+    load_pools,
+    percentile,
+    prepare_workdir,
+    scrape_metrics,
+    server_env,
+    start_server,
+    stop_server,
+)
+
+BENCH_PASSWORD = "Bench@12345"
+
+
+@dataclass
+class Event:
+    offset: float
+    action: str
+    object_id: str
+    result: str
+    details: Dict[str, Any]
+
+
+def _parse_time(value: str) -> datetime:
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is not None:
+        # created_at e gravado em UTC sem fuso
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def read_events(
+    source: str, since: Optional[datetime], until: Optional[datetime], limit: Optional[int], max_gap: Optional[float]
+) -> Tuple[List[Event], Dict[str, int], float]:
+    """Le a janela pedida e retorna eventos reproduziveis, ignorados por acao e duracao registrada."""
+    from sqlalchemy import create_engine, select
+
+    from db.models import AuditLog
+
+    query = select(
+        AuditLog.created_at, AuditLog.action, AuditLog.object_id, AuditLog.result, AuditLog.details_json
+    ).order_by(AuditLog.created_at, AuditLog.id)
+    if since is not None:
+        query = query.where(AuditLog.created_at >= since)
+    if until is not None:
+        query = query.where(AuditLog.created_at < until)
+    if limit:
+        query = query.limit(limit)
+
+    engine = create_engine(source)
+    events: List[Event] = []
+    skipped: Dict[str, int] = {}
+    first: Optional[datetime] = None
+    previous: Optional[datetime] = None
+    offset = 0.0
+    try:
+        with engine.connect() as conn:
+            for created_at, action, object_id, result, details_json in conn.execute(query):
+                if action not in BUILDERS:
+                    skipped[action] = skipped.get(action, 0) + 1
+                    continue
+                if first is None:
+                    first = previous = created_at
+                gap = (created_at - previous).total_seconds()
+                offset += min(gap, max_gap) if max_gap is not None else gap
+                previous = created_at
+                details = json.loads(details_json) if details_json else {}
+                events.append(Event(offset, action, object_id, result, details))
+    finally:
+        engine.dispose()
+    recorded = (previous - first).total_seconds() if first is not None else 0.0
+    return events, skipped, recorded
+
+
+# ---- mapeamento de identificadores ----------------------------------------
+
+
+@dataclass
+class IdentityMap:
+    """Associa cada usuario/grupo registrado a um do diretorio falso, sempre o mesmo."""
+
+    pools: Optional[Pools]
+    users: Dict[str, str] = field(default_factory=dict)
+    groups: Dict[str, str] = field(default_factory=dict)
+    created_groups: int = 0
+
+    def user(self, recorded: str) -> str:
+        if self.pools is None:
+            return recorded
+        if recorded not in self.users:
+            self.users[recorded] = self.pools.users[zlib.crc32(recorded.encode("utf-8")) % len(self.pools.users)]
+        return self.users[recorded]
+
+    def group(self, recorded: str) -> str:
+        if self.pools is None:
+            return recorded
+        if recorded not in self.groups:
+            self.groups[recorded] = self.pools.groups[zlib.crc32(recorded.encode("utf-8")) % len(self.pools.groups)]
+        return self.groups[recorded]
+
+    def new_user(self, recorded: str) -> str:
+        if self.pools is not None:
+            self.users[recorded] = self.pools.new_username()
+        return self.user(recorded)
+
+    def new_group(self, recorded: str) -> str:
+        if self.pools is not None:
+            self.created_groups += 1
+            self.groups[recorded] = f"GRP-BENCH-{self.pools.run_id}-{self.created_groups}"
+        return self.group(recorded)
+
+
+def _fields(event: Event, skip: int) -> str:
+    fields = [str(value) for value in (event.details.get("arguments") or [])[skip:] if value]
+    return f"?fields={','.join(fields)}" if fields else ""
+
+
+def _list_users(event: Event, ids: IdentityMap) -> Request:
+    return "GET", f"{API}/users", f"{API}/users{_fields(event, 0)}", None
+
+
+def _get_user(event: Event, ids: IdentityMap) -> Request:
+    return "GET", f"{API}/users/{{username}}", f"{API}/users/{ids.user(event.object_id)}{_fields(event, 1)}", None
+
+
+def _create_user(event: Event, ids: IdentityMap) -> Request:
+    username = ids.new_user(event.object_id)
+    body = {"username": username, "password": BENCH_PASSWORD, "display_name": f"Replay {username}"}
+    return "POST", f"{API}/users", f"{API}/users", body
+
+
+def _update_user(event: Event, ids: IdentityMap) -> Request:
+    path = f"{API}/users/{ids.user(event.object_id)}"
+    return "PATCH", f"{API}/users/{{username}}", path, {"display_name": "Replay"}
+
+
+def _user_post(suffix: str, body: Optional[Dict[str, Any]] = None):
+    def build(event: Event, ids: IdentityMap) -> Request:
+        path = f"{API}/users/{ids.user(event.object_id)}/{suffix}"
+        return "POST", f"{API}/users/{{username}}/{suffix}", path, body
+
+    return build
+
+
+def _delete_user(event: Event, ids: IdentityMap) -> Request:
+    return "DELETE", f"{API}/users/{{username}}", f"{API}/users/{ids.user(event.object_id)}", None
+
+
+def _user_group(method: str):
+    def build(event: Event, ids: IdentityMap) -> Request:
+        path = f"{API}/users/{ids.user(event.object_id)}/groups"
+        body = {"group": ids.group(str(event.details.get("group") or event.object_id))}
+        return method, f"{API}/users/{{username}}/groups", path, body
+
+    return build
+
+
+def _sync(scope: str):
+    def build(event: Event, ids: IdentityMap) -> Request:
+        return "POST", f"{API}/sync/{scope}", f"{API}/sync/{scope}", None
+
+    return build
+
+
+def _list_groups(event: Event, ids: IdentityMap) -> Request:
+    return "GET", f"{API}/groups", f"{API}/groups{_fields(event, 0)}", None
+
+
+def _get_group(event: Event, ids: IdentityMap) -> Request:
+    path = f"{API}/groups/{ids.group(event.object_id)}{_fields(event, 1)}"
+    return "GET", f"{API}/groups/{{groupname}}", path, None
+
+
+def _create_group(event: Event, ids: IdentityMap) -> Request:
+    return "POST", f"{API}/groups", f"{API}/groups", {"groupname": ids.new_group(event.object_id)}
+
+
+def _update_group(event: Event, ids: IdentityMap) -> Request:
+    path = f"{API}/groups/{ids.group(event.object_id)}"
+    return "PATCH", f"{API}/groups/{{groupname}}", path, {"description": "Replay"}
+
+
+def _group_member(method: str):
+    def build(event: Event, ids: IdentityMap) -> Request:
+        path = f"{API}/groups/{ids.group(event.object_id)}/members"
+        body = {"member": ids.user(str(event.details.get("member") or ""))}
+        return method, f"{API}/groups/{{groupname}}/members", path, body
+
+    return build
+
+
+def _disable_group(event: Event, ids: IdentityMap) -> Request:
+    from core.config import settings
+
+    path = f"{API}/groups/{ids.group(event.object_id)}/disable?target_ou_dn=OU=Desativados,{settings.base_dn}"
+    return "POST", f"{API}/groups/{{groupname}}/disable", path, None
+
+
+BUILDERS = {
+    "list_users": _list_users,
+    "get_user": _get_user,
+    "create_user": _create_user,
+    "update_user": _update_user,
+    "reset_password": _user_post("reset-password", {"new_password": BENCH_PASSWORD}),
+    "enable_user": _user_post("enable"),
+    "disable_user": _user_post("disable"),
+    "delete_user": _delete_user,
+    "add_user_to_group": _user_group("POST"),
+    "remove_user_from_group": _user_group("DELETE"),
+    "sync_users": _sync("users"),
+    "list_groups": _list_groups,
+    "get_group": _get_group,
+    "create_group": _create_group,
+    "update_group_description": _update_group,
+    "add_group_member": _group_member("POST"),
+    "remove_group_member": _group_member("DELETE"),
+    "disable_group": _disable_group,
+    "sync_groups": _sync("groups"),
+}
+
+
+# ---- reproducao -----------------------------------------------------------
+
+
+def recorded_profile(events: List[Event], duration: float) -> Dict[str, Any]:
+    per_second: Dict[int, int] = {}
+    for event in events:
+        second = int(event.offset)
+        per_second[second] = per_second.get(second, 0) + 1
+    return {
+        "events": len(events),
+        "duration_s": round(duration, 3),
+        "mean_rps": round(len(events) / duration, 3) if duration else 0.0,
+        "peak_rps_1s": max(per_second.values(), default=0),
+        "errors": sum(1 for event in events if event.result == "error"),
+    }
+
+
+async def replay(
+    args: argparse.Namespace, proc: Any, base_url: str, token: str, events: List[Event], ids: IdentityMap
+) -> Dict[str, Any]:
+    import httpx
+
+    # mapeia na ordem registrada: criacoes vem antes dos usos do mesmo identificador
+    requests = [(event, BUILDERS[event.action](event, ids)) for event in events]
+    stats: Dict[str, RouteStats] = {}
+    recorded: Dict[str, Dict[str, int]] = {}
+    lags: List[float] = []
+    limits = httpx.Limits(max_connections=args.max_inflight, max_keepalive_connections=args.max_inflight)
+    headers = {"Authorization": f"Bearer {token}", "Accept-Encoding": "identity"}
+    inflight = asyncio.Semaphore(args.max_inflight)
+    async with httpx.AsyncClient(base_url=base_url, headers=headers, timeout=args.timeout, limits=limits) as client:
+        if proc is not None:
+            await _wait_ready(client, proc, time.monotonic() + args.startup_timeout)
+        before = scrape_metrics((await client.get("/metrics")).text)
+
+        async def fire(due: float, request: Request) -> None:
+            method, route, path, body = request
+            async with inflight:
+                start = time.perf_counter()
+                lags.append(max(0.0, time.monotonic() - due))
+                try:
+                    response = await client.request(method, path, json=body)
+                    status = str(response.status_code)
+                except httpx.HTTPError as exc:
+                    status = type(exc).__name__
+                elapsed = time.perf_counter() - start
+            stats.setdefault(f"{method} {route}", RouteStats()).record(status, elapsed)
+
+        tasks = []
+        started = time.monotonic()
+        for event, request in requests:
+            due = started + event.offset / args.speed
+            delay = due - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            tasks.append(asyncio.create_task(fire(due, request)))
+            counts = recorded.setdefault(f"{request[0]} {request[1]}", {"count": 0, "errors": 0})
+            counts["count"] += 1
+            counts["errors"] += event.result == "error"
+        await asyncio.gather(*tasks)
+        elapsed = time.monotonic() - started
+        after = scrape_metrics((await client.get("/metrics")).text)
+
+    overall = RouteStats()
+    for route in stats.values():
+        overall.latencies.extend(route.latencies)
+        overall.errors += route.errors
+    summary = overall.summary(elapsed)
+    summary.pop("statuses")
+    routes = {}
+    for name, route in sorted(stats.items()):
+        routes[name] = {**route.summary(elapsed), "recorded": recorded.get(name, {})}
+    ordered_lags = sorted(lags)
+    return {
+        "duration_s": round(elapsed, 3),
+        "requests": len(requests),
+        "overall": summary,
+        "routes": routes,
+        "schedule_lag_ms": {
+            "p50": round(percentile(ordered_lags, 50) * 1000, 2),
+            "p99": round(percentile(ordered_lags, 99) * 1000, 2),
+            "max": round((ordered_lags[-1] if ordered_lags else 0.0) * 1000, 2),
+        },
+        "server_metrics": _delta(before, after),
+    }
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.replay", description=__doc__.splitlines()[0])
+    parser.add_argument("--source", default=None, help="DATABASE_URL com audit_logs (padrao: DATABASE_URL)")
+    parser.add_argument("--since", type=_parse_time, default=None, help="inicio da janela (ISO 8601)")
+    parser.add_argument("--until", type=_parse_time, default=None, help="fim da janela, exclusivo (ISO 8601)")
+    parser.add_argument("--limit", type=int, default=None, help="maximo de registros lidos")
+    parser.add_argument("--speed", type=float, default=1.0, help="fator de aceleracao (2 = duas vezes mais rapido)")
+    parser.add_argument("--max-gap", type=float, default=None, help="limita pausas ociosas do registro (segundos)")
+    parser.add_argument("--max-inflight", type=int, default=256, help="requisicoes simultaneas no maximo")
+    parser.add_argument("--target", default=None, help="URL de uma instancia ja no ar (exige --token)")
+    parser.add_argument("--token", default=None, help="token admin para --target")
+    parser.add_argument("--workers", type=int, default=1, help="workers do uvicorn")
+    parser.add_argument("--users", type=int, default=10000, help="usuarios do diretorio gerado")
+    parser.add_argument("--groups", type=int, default=500, help="grupos do diretorio gerado")
+    parser.add_argument("--directory", default=None, help="SQLite do fakeldap a reaproveitar (gerado se nao existir)")
+    parser.add_argument("--ldap-latency-ms", type=int, default=0, help="FAKELDAP_LATENCY_MS por operacao LDAP")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--timeout", type=float, default=120.0, help="timeout por requisicao")
+    parser.add_argument("--startup-timeout", type=float, default=30.0)
+    parser.add_argument("--output", default=None, help="arquivo JSON (padrao: benchmarks/results/)")
+    parser.add_argument("--keep-workdir", action="store_true")
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.speed <= 0:
+        parser.error("--speed deve ser positivo")
+    if args.target and not args.token:
+        parser.error("--target exige --token")
+    # o segredo precisa estar no ambiente antes de core.config ser importado
+    secret = secrets.token_urlsafe(32)
+    os.environ["JWT_SECRET_KEY"] = secret
+    sys.path.insert(0, str(REPO_ROOT))
+    from core.config import settings
+
+    source = args.source or settings.db_url
+    events, skipped, recorded_duration = read_events(source, args.since, args.until, args.limit, args.max_gap)
+    if not events:
+        print("Nenhum registro reproduzivel na janela informada", file=sys.stderr)
+        return 1
+    profile = recorded_profile(events, events[-1].offset)
+    print(
+        f"{profile['events']} eventos em {profile['duration_s']}s registrados "
+        f"(media {profile['mean_rps']} req/s, pico {profile['peak_rps_1s']} req/s); velocidade {args.speed}x"
+    )
+
+    sampler: Optional[ProcessSampler] = None
+    workdir: Optional[Path] = None
+    try:
+        if args.target:
+            pools = None
+            if args.directory:
+                pools = load_pools(Path(args.directory), settings.users_ou, 2000, args.seed)
+            result = asyncio.run(replay(args, None, args.target, args.token, events, IdentityMap(pools)))
+        else:
+            workdir = Path(tempfile.mkdtemp(prefix="api-ad-replay-"))
+            from core.security import Role, create_access_token
+
+            token = create_access_token("replay", Role.admin)
+            directory = prepare_workdir(args, workdir)
+            ids = IdentityMap(load_pools(directory, settings.users_ou, 2000, args.seed))
+            port = _free_port()
+            proc = start_server(args, server_env(args, workdir, directory, secret), port, workdir / "server.log")
+            sampler = ProcessSampler(proc.pid, worker_depth=1 if args.workers > 1 else 0)
+            sampler.start()
+            try:
+                result = asyncio.run(replay(args, proc, f"http://127.0.0.1:{port}", token, events, ids))
+            finally:
+                sampler.stop()
+                stop_server(proc)
+    finally:
+        if workdir is not None:
+            if args.keep_workdir:
+                print(f"diretorio de trabalho: {workdir}")
+            else:
+                shutil.rmtree(workdir, ignore_errors=True)
+
+    commit = _git("rev-parse", "HEAD")
+    report = {
+        "meta": {
+            "started_at": datetime.now(timezone.utc).isoformat(),
+            "commit": commit,
+            "dirty": bool(_git("status", "--porcelain", "--untracked-files=no")),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "args": {
+                key: (value.isoformat() if isinstance(value, datetime) else value)
+                for key, value in vars(args).items()
+                if key not in ("output", "token", "source")
+            },
+        },
+        "recorded": {**profile, "wall_duration_s": round(recorded_duration, 3), "skipped": skipped},
+        **result,
+        "server": {
+            "peak_rss_bytes": sampler.peak_rss if sampler else 0,
+            "peak_tree_rss_bytes": sampler.peak_tree_rss if sampler else 0,
+            "peak_subprocesses": sampler.peak_subprocesses if sampler else 0,
+            "samples": sampler.samples if sampler else 0,
+        },
+    }
+    if args.output:
+        output = Path(args.output)
+    else:
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+        output = RESULTS_DIR / f"{stamp}-{(commit or 'nogit')[:8]}-replay.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2, ensure_ascii=True) + "\n", encoding="utf-8")
+
+    overall = result["overall"]
+    lag = result["schedule_lag_ms"]
+    print(f"{result['requests']} requisicoes em {result['duration_s']}s ({overall['throughput_rps']} req/s)")
+    for name, route in result["routes"].items():
+        recorded = route["recorded"]
+        print(
+            f"  {name:55} n={route['count']:<6} err={route['errors']:<4} (registrado err={recorded.get('errors', 0)}) "
+            f"p50={route['p50_ms']}ms p95={route['p95_ms']}ms p99={route['p99_ms']}ms"
+        )
+    print(f"atraso de disparo p50={lag['p50']}ms p99={lag['p99']}ms max={lag['max']}ms")
+    print(f"resultado: {output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,214 @@
+import time
+from collections import deque
+from dataclasses import dataclass
+from pathlib import PurePosixPath
+from threading import Lock
+from typing import Callable, Deque, Dict, Optional, Tuple
+
+from core import metrics
+from core.config import settings
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+# leitura pontual, leitura em massa (listagens e sincronizacoes) e escrita falham
+# de formas diferentes; cada categoria tem seu circuito (o timeout e por script)
+READ = "read"
+BULK = "bulk"
+WRITE = "write"
+
+
+def script_category(script_relative: str) -> str:
+    name = PurePosixPath(script_relative).name
+    if name.startswith(("list_", "sync_")):
+        return BULK
+    if name.startswith(("get_", "search_")):
+        return READ
+    return WRITE
+
+
+class CircuitBreaker:
+    """Abre apos muitas falhas de infraestrutura na janela e rejeita chamadas ate o fim da pausa.
+
+    Depois da pausa deixa passar ``half_open_calls`` chamadas de teste: sucesso fecha o
+    circuito, falha o reabre.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        *,
+        window_seconds: float,
+        min_calls: int,
+        failure_ratio: float,
+        open_seconds: float,
+        half_open_calls: int,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.name = name
+        self.window_seconds = window_seconds
+        self.min_calls = min_calls
+        self.failure_ratio = failure_ratio
+        self.open_seconds = open_seconds
+        self.half_open_calls = half_open_calls
+        self._clock = clock
+        self._lock = Lock()
+        self._calls: Deque[Tuple[float, bool]] = deque()
+        self._failures = 0
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._probes = 0
+        metrics.CIRCUIT_STATE.labels(name).set(STATE_VALUES[CLOSED])
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state(self._clock())
+
+    def _current_state(self, now: float) -> str:
+        if self._state == OPEN and now - self._opened_at >= self.open_seconds:
+            self._set_state(HALF_OPEN)
+            self._probes = 0
+        return self._state
+
+    def _set_state(self, state: str) -> None:
+        self._state = state
+        metrics.CIRCUIT_STATE.labels(self.name).set(STATE_VALUES[state])
+
+    def _prune(self, now: float) -> None:
+        limit = now - self.window_seconds
+        while self._calls and self._calls[0][0] < limit:
+            _, failed = self._calls.popleft()
+            self._failures -= failed
+
+    def acquire(self) -> Optional[float]:
+        """Retorna None se a chamada pode seguir ou os segundos ate a proxima tentativa."""
+        with self._lock:
+            now = self._clock()
+            state = self._current_state(now)
+            if state == CLOSED:
+                return None
+            if state == HALF_OPEN and self._probes < self.half_open_calls:
+                self._probes += 1
+                return None
+            metrics.CIRCUIT_REJECTIONS.labels(self.name).inc()
+            if state == HALF_OPEN:
+                return 1.0
+            return max(1.0, self.open_seconds - (now - self._opened_at))
+
+    def cancel(self) -> None:
+        """Devolve a vaga de teste de uma chamada admitida que nao chegou a rodar."""
+        with self._lock:
+            if self._state == HALF_OPEN:
+                self._probes = max(0, self._probes - 1)
+
+    def record(self, *, failed: bool) -> None:
+        with self._lock:
+            now = self._clock()
+            state = self._current_state(now)
+            if state == HALF_OPEN:
+                self._probes = max(0, self._probes - 1)
+                if failed:
+                    self._trip(now)
+                else:
+                    self._calls.clear()
+                    self._failures = 0
+                    self._set_state(CLOSED)
+                return
+            if state == OPEN:
+                return
+            self._calls.append((now, failed))
+            self._failures += failed
+            self._prune(now)
+            if len(self._calls) >= self.min_calls and self._failures / len(self._calls) >= self.failure_ratio:
+                self._trip(now)
+
+    def _trip(self, now: float) -> None:
+        self._opened_at = now
+        self._calls.clear()
+        self._failures = 0
+        self._set_state(OPEN)
+        metrics.CIRCUIT_OPENED.labels(self.name).inc()
+
+    def snapshot(self) -> Dict[str, object]:
+        with self._lock:
+            now = self._clock()
+            state = self._current_state(now)
+            self._prune(now)
+            return {
+                "state": state,
+                "calls": len(self._calls),
+                "failures": self._failures,
+                "retry_after": round(max(0.0, self.open_seconds - (now - self._opened_at)), 3) if state == OPEN else 0.0,
+            }
+
+
+class AdaptiveTimeout:
+    """Timeout derivado do percentil observado, limitado entre o minimo e o timeout fixo."""
+
+    def __init__(self, name: str, *, samples: int) -> None:
+        self.name = name
+        self._lock = Lock()
+        self._durations: Deque[float] = deque(maxlen=samples)
+
+    def observe(self, seconds: float) -> None:
+        with self._lock:
+            self._durations.append(seconds)
+
+    def current(self) -> float:
+        ceiling = float(settings.ad_script_timeout_seconds)
+        if not settings.ad_adaptive_timeout:
+            return ceiling
+        with self._lock:
+            if len(self._durations) < settings.ad_adaptive_timeout_min_samples:
+                return ceiling
+            ordered = sorted(self._durations)
+        index = min(len(ordered) - 1, int(len(ordered) * settings.ad_adaptive_timeout_percentile / 100))
+        observed = ordered[index] * settings.ad_adaptive_timeout_multiplier
+        timeout = min(ceiling, max(float(settings.ad_script_timeout_min_seconds), observed))
+        metrics.SCRIPT_TIMEOUT_LIMIT.labels(self.name).set(timeout)
+        return timeout
+
+
+@dataclass
+class Guard:
+    breaker: CircuitBreaker
+    timeout: AdaptiveTimeout
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_timeouts: Dict[str, AdaptiveTimeout] = {}
+_guards_lock = Lock()
+
+
+def guard(script_relative: str) -> Guard:
+    category = script_category(script_relative)
+    with _guards_lock:
+        breaker = _breakers.get(category)
+        if breaker is None:
+            breaker = CircuitBreaker(
+                category,
+                window_seconds=settings.circuit_breaker_window_seconds,
+                min_calls=settings.circuit_breaker_min_calls,
+                failure_ratio=settings.circuit_breaker_failure_ratio,
+                open_seconds=settings.circuit_breaker_open_seconds,
+                half_open_calls=settings.circuit_breaker_half_open_calls,
+            )
+            _breakers[category] = breaker
+        timeout = _timeouts.get(script_relative)
+        if timeout is None:
+            timeout = AdaptiveTimeout(script_relative, samples=settings.ad_adaptive_timeout_samples)
+            _timeouts[script_relative] = timeout
+    return Guard(breaker=breaker, timeout=timeout)
+
+
+def snapshot() -> Dict[str, Dict[str, object]]:
+    with _guards_lock:
+        breakers = dict(_breakers)
+        timeouts = dict(_timeouts)
+    return {
+        "circuits": {category: breaker.snapshot() for category, breaker in sorted(breakers.items())},
+        "timeouts": {script: round(timeout.current(), 3) for script, timeout in sorted(timeouts.items())},
+    }
@@ -0,0 +1,156 @@
+import zlib
+from typing import Callable, Dict, List, Optional
+
+import anyio.to_thread
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+try:
+    import brotli
+except ImportError:  # sem brotli apenas gzip e oferecido
+    brotli = None
+
+# tipos ja comprimidos ou que precisam chegar aos poucos (SSE)
+EXCLUDED_MEDIA_TYPES = ("text/event-stream", "application/gzip", "application/zip", "image/", "audio/", "video/")
+# trechos maiores que isso sao comprimidos fora do event loop
+THREAD_MINIMUM_SIZE = 128 * 1024
+
+
+class Responder:
+    """Envia a resposta de ``app`` codificada com ``content_encoding``.
+
+    Segue o GZipResponder do Starlette, que e interno a ele e muda entre versoes: corpos
+    menores que ``minimum_size``, respostas ja codificadas, parciais (206) ou de tipos em
+    EXCLUDED_MEDIA_TYPES passam como vieram. Sem ``content_encoding`` nada e comprimido.
+    """
+
+    content_encoding: Optional[str] = None
+
+    def __init__(self, app: ASGIApp, minimum_size: int) -> None:
+        self.app = app
+        self.minimum_size = minimum_size
+        self.send: Optional[Send] = None
+        self.start: Message = {}
+        self.passthrough = False
+        self.started = False
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        self.send = send
+        await self.app(scope, receive, self.send_compressed)
+
+    async def send_compressed(self, message: Message) -> None:
+        kind = message["type"]
+        if kind == "http.response.start":
+            # o start espera o primeiro corpo: so entao se sabe se vale comprimir
+            self.start = message
+            headers = Headers(raw=message["headers"])
+            media_type = headers.get("content-type", "").partition(";")[0].strip().lower()
+            self.passthrough = (
+                self.content_encoding is None
+                or "content-encoding" in headers
+                or message["status"] == 206
+                or media_type.startswith(EXCLUDED_MEDIA_TYPES)
+            )
+            if self.passthrough:
+                await self.send(message)
+        elif kind == "http.response.pathsend" and not (self.passthrough or self.started):
+            # arquivo enviado pelo servidor: vai sem compressao
+            self.started = True
+            await self.send(self.start)
+            await self.send(message)
+        elif kind != "http.response.body":
+            await self.send(message)
+        elif self.passthrough:
+            await self.send(message)
+        elif not self.started:
+            self.started = True
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if len(body) >= self.minimum_size or more_body:
+                headers = MutableHeaders(raw=self.start["headers"])
+                headers.add_vary_header("Accept-Encoding")
+                headers["Content-Encoding"] = self.content_encoding
+                if more_body or self.start.get("trailers", False):
+                    del headers["Content-Length"]
+                message["body"] = await self._compress(body, more_body)
+                if "content-length" in headers:
+                    headers["Content-Length"] = str(len(message["body"]))
+            await self.send(self.start)
+            await self.send(message)
+        else:
+            message["body"] = await self._compress(message.get("body", b""), message.get("more_body", False))
+            await self.send(message)
+
+    async def _compress(self, body: bytes, more_body: bool) -> bytes:
+        if len(body) >= THREAD_MINIMUM_SIZE:
+            return await anyio.to_thread.run_sync(self.compress, body, more_body)
+        return self.compress(body, more_body)
+
+    def compress(self, body: bytes, more_body: bool) -> bytes:
+        """Comprime um trecho; ``more_body`` falso fecha o fluxo."""
+        return body
+
+
+class GzipResponder(Responder):
+    content_encoding = "gzip"
+
+    def __init__(self, app: ASGIApp, minimum_size: int, level: int = 6) -> None:
+        super().__init__(app, minimum_size)
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, body: bytes, more_body: bool) -> bytes:
+        if more_body:
+            return self._compressor.compress(body) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+        return self._compressor.compress(body) + self._compressor.flush()
+
+
+class BrotliResponder(Responder):
+    content_encoding = "br"
+
+    def __init__(self, app: ASGIApp, minimum_size: int, quality: int = 5) -> None:
+        super().__init__(app, minimum_size)
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, body: bytes, more_body: bool) -> bytes:
+        if more_body:
+            return self._compressor.process(body) + self._compressor.flush()
+        return self._compressor.process(body) + self._compressor.finish()
+
+
+def _accepted_encodings(header: str) -> List[str]:
+    accepted = []
+    for item in header.split(","):
+        name, _, params = item.strip().partition(";")
+        if params.replace(" ", "") in ("q=0", "q=0.0"):
+            continue
+        accepted.append(name.strip().lower())
+    return accepted
+
+
+class CompressionMiddleware:
+    def __init__(
+        self,
+        app: ASGIApp,
+        *,
+        algorithms: List[str],
+        minimum_size: int = 1024,
+        gzip_level: int = 6,
+        brotli_quality: int = 5,
+    ) -> None:
+        self.app = app
+        self.algorithms = [name for name in algorithms if name != "br" or brotli is not None]
+        self.minimum_size = minimum_size
+        self.responders: Dict[str, Callable[[], Responder]] = {
+            "br": lambda: BrotliResponder(self.app, self.minimum_size, brotli_quality),
+            "gzip": lambda: GzipResponder(self.app, self.minimum_size, gzip_level),
+        }
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        accepted = _accepted_encodings(Headers(scope=scope).get("accept-encoding", ""))
+        name = next((name for name in self.algorithms if name in accepted), None)
+        responder = self.responders[name]() if name in self.responders else Responder(self.app, self.minimum_size)
+        await responder(scope, receive, send)
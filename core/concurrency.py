@@ -0,0 +1,304 @@
+import math
+import time
+from collections import deque
+from pathlib import PurePosixPath
+from threading import Event, Lock
+from typing import Callable, Deque, Dict, List, Optional
+
+import orjson
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from core import metrics
+from core.config import settings
+
+# a linha de base (menor duracao vista) sobe esta fracao a cada execucao, para
+# acompanhar um DC que ficou mais lento de vez sem esquecer a latencia sem carga
+BASELINE_DRIFT = 0.002
+# media movel da duracao das execucoes, usada para estimar o Retry-After
+DURATION_ALPHA = 0.2
+
+# faixas em ordem de prioridade: o tecnico do helpdesk nao espera a sincronizacao
+INTERACTIVE_WRITE = "interactive_write"
+INTERACTIVE_READ = "interactive_read"
+BULK = "bulk"
+SYNC = "sync"
+LANES = (INTERACTIVE_WRITE, INTERACTIVE_READ, BULK, SYNC)
+
+
+def script_lane(script_relative: str) -> str:
+    name = PurePosixPath(script_relative).name
+    if name.startswith("sync_"):
+        return SYNC
+    if name.startswith("list_"):
+        return BULK
+    if name.startswith(("get_", "search_")):
+        return INTERACTIVE_READ
+    return INTERACTIVE_WRITE
+
+
+def request_lane(method: str, path: str) -> str:
+    if path.startswith(tuple(settings.lane_sync_paths)):
+        return SYNC
+    if method in ("GET", "HEAD"):
+        return BULK if path.rstrip("/") in settings.lane_bulk_paths else INTERACTIVE_READ
+    return INTERACTIVE_WRITE
+
+
+def lane_threads(lane: str) -> int:
+    return {
+        INTERACTIVE_WRITE: settings.lane_interactive_write_threads,
+        INTERACTIVE_READ: settings.lane_interactive_read_threads,
+        BULK: settings.lane_bulk_threads,
+        SYNC: settings.lane_sync_threads,
+    }[lane]
+
+
+def thread_budget() -> int:
+    """Tamanho do threadpool: a soma das faixas mais as rotas fora delas (auth, ops...)."""
+    return sum(lane_threads(lane) for lane in LANES) + settings.lane_other_threads
+
+
+class _Waiter:
+    __slots__ = ("event", "granted", "since")
+
+    def __init__(self, since: float) -> None:
+        self.event = Event()
+        self.granted = False
+        self.since = since
+
+
+class AdaptiveLimiter:
+    """Limita quantos scripts rodam ao mesmo tempo e ajusta o limite por AIMD.
+
+    Cada execucao compara a duracao com a linha de base do proprio script (a menor
+    duracao vista, com deriva lenta para cima). Acima de ``tolerance`` vezes a linha de
+    base, ou em falha do DC, o limite e multiplicado por ``backoff``; caso contrario,
+    com o limite em uso, cresce ``1/limite``.
+
+    O excesso espera na fila da sua faixa (ate ``queue_depth`` chamadas por faixa, por
+    no maximo ``queue_timeout`` segundos); alem disso a chamada e recusada. Vaga livre
+    vai para a faixa de maior prioridade, exceto quando a espera mais antiga de outra
+    faixa passou de ``max_wait``. ``shares`` limita a fracao do limite que cada faixa
+    pode ocupar.
+    """
+
+    def __init__(
+        self,
+        *,
+        initial: int,
+        minimum: int,
+        maximum: int,
+        queue_depth: int,
+        queue_timeout: float,
+        tolerance: float,
+        backoff: float,
+        shares: Optional[Dict[str, float]] = None,
+        max_wait: float = math.inf,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.minimum = minimum
+        self.maximum = max(minimum, maximum)
+        self.limit = float(min(self.maximum, max(minimum, initial)))
+        self.queue_depth = queue_depth
+        self.queue_timeout = queue_timeout
+        self.tolerance = tolerance
+        self.backoff = backoff
+        self.shares = {lane: 1.0 for lane in LANES}
+        self.shares.update(shares or {})
+        self.max_wait = max_wait
+        self._clock = clock
+        self._lock = Lock()
+        self._in_flight = 0
+        self._lane_in_flight: Dict[str, int] = {lane: 0 for lane in LANES}
+        self._queues: Dict[str, Deque[_Waiter]] = {lane: deque() for lane in LANES}
+        self._baselines: Dict[str, float] = {}
+        self._average = 0.0
+        self._last_decrease = -math.inf
+        metrics.CONCURRENCY_LIMIT.set(self.limit)
+
+    def lane_limit(self, lane: str) -> int:
+        return max(1, int(self.limit * self.shares[lane]))
+
+    def retry_after(self) -> float:
+        with self._lock:
+            return self._retry_after()
+
+    def _retry_after(self) -> float:
+        # tempo para esvaziar as filas atuais no ritmo observado
+        queued = sum(len(queue) for queue in self._queues.values())
+        rounds = queued / max(1, int(self.limit)) + 1
+        return max(1.0, math.ceil(self._average * rounds))
+
+    def _has_room(self, lane: str) -> bool:
+        return self._in_flight < int(self.limit) and self._lane_in_flight[lane] < self.lane_limit(lane)
+
+    def _take(self, lane: str) -> None:
+        self._in_flight += 1
+        self._lane_in_flight[lane] += 1
+
+    def acquire(self, lane: str = INTERACTIVE_READ) -> Optional[float]:
+        """Retorna None com a vaga reservada ou os segundos sugeridos para o Retry-After."""
+        with self._lock:
+            now = self._clock()
+            ahead = any(self._queues[other] for other in LANES[: LANES.index(lane) + 1])
+            if not ahead and self._has_room(lane):
+                self._take(lane)
+                metrics.CONCURRENCY_WAIT.labels(lane).observe(0.0)
+                return None
+            queue = self._queues[lane]
+            if len(queue) >= self.queue_depth:
+                metrics.LOAD_SHED.labels(lane, "queue_full").inc()
+                return self._retry_after()
+            waiter = _Waiter(now)
+            queue.append(waiter)
+            metrics.CONCURRENCY_QUEUED.labels(lane).inc()
+        waiter.event.wait(self.queue_timeout)
+        with self._lock:
+            metrics.CONCURRENCY_WAIT.labels(lane).observe(self._clock() - waiter.since)
+            if waiter.granted:
+                return None
+            queue.remove(waiter)
+            metrics.CONCURRENCY_QUEUED.labels(lane).dec()
+            metrics.LOAD_SHED.labels(lane, "queue_timeout").inc()
+            return self._retry_after()
+
+    def release(self, lane: str = INTERACTIVE_READ) -> None:
+        with self._lock:
+            self._in_flight -= 1
+            self._lane_in_flight[lane] -= 1
+            self._grant()
+
+    def _next_lane(self) -> Optional[str]:
+        eligible = [lane for lane in LANES if self._queues[lane] and self._has_room(lane)]
+        if not eligible:
+            return None
+        # protecao contra inanicao: espera acima de max_wait passa na frente da prioridade
+        now = self._clock()
+        starving = [lane for lane in eligible if now - self._queues[lane][0].since >= self.max_wait]
+        if starving:
+            return min(starving, key=lambda lane: self._queues[lane][0].since)
+        return eligible[0]
+
+    def _grant(self) -> None:
+        while True:
+            lane = self._next_lane()
+            if lane is None:
+                return
+            waiter = self._queues[lane].popleft()
+            waiter.granted = True
+            self._take(lane)
+            metrics.CONCURRENCY_QUEUED.labels(lane).dec()
+            waiter.event.set()
+
+    def _baseline(self, script: str, elapsed: float) -> float:
+        previous = self._baselines.get(script)
+        baseline = elapsed if previous is None else min(elapsed, previous * (1 + BASELINE_DRIFT))
+        self._baselines[script] = baseline
+        return baseline
+
+    def observe(self, script: str, elapsed: float, *, failed: bool) -> None:
+        with self._lock:
+            now = self._clock()
+            self._average = elapsed if not self._average else (
+                DURATION_ALPHA * elapsed + (1 - DURATION_ALPHA) * self._average
+            )
+            baseline = self._baseline(script, elapsed)
+            overloaded = failed or elapsed > baseline * self.tolerance
+            if overloaded:
+                # execucoes iniciadas antes da ultima reducao ja refletem o limite antigo
+                if now - elapsed >= self._last_decrease:
+                    self.limit = max(float(self.minimum), self.limit * self.backoff)
+                    self._last_decrease = now
+            elif self._in_flight >= int(self.limit) or any(self._queues.values()):
+                self.limit = min(float(self.maximum), self.limit + 1 / self.limit)
+                self._grant()
+            metrics.CONCURRENCY_LIMIT.set(self.limit)
+
+    def snapshot(self) -> Dict[str, object]:
+        with self._lock:
+            return {
+                "limit": round(self.limit, 3),
+                "in_flight": self._in_flight,
+                "queued": sum(len(queue) for queue in self._queues.values()),
+                "queue_depth": self.queue_depth,
+                "average_seconds": round(self._average, 4),
+                "lanes": {
+                    lane: {
+                        "limit": self.lane_limit(lane),
+                        "in_flight": self._lane_in_flight[lane],
+                        "queued": len(self._queues[lane]),
+                    }
+                    for lane in LANES
+                },
+            }
+
+
+_limiter: Optional[AdaptiveLimiter] = None
+_limiter_lock = Lock()
+
+
+def limiter() -> AdaptiveLimiter:
+    global _limiter
+    with _limiter_lock:
+        if _limiter is None:
+            _limiter = AdaptiveLimiter(
+                initial=settings.concurrency_limit_initial,
+                minimum=settings.concurrency_limit_min,
+                maximum=settings.concurrency_limit_max,
+                queue_depth=settings.concurrency_queue_depth,
+                queue_timeout=settings.concurrency_queue_timeout_seconds,
+                tolerance=settings.concurrency_latency_tolerance,
+                backoff=settings.concurrency_backoff,
+                shares={BULK: settings.lane_bulk_share, SYNC: settings.lane_sync_share},
+                max_wait=settings.lane_max_wait_seconds,
+            )
+        return _limiter
+
+
+class LoadSheddingMiddleware:
+    """Reparte o threadpool entre as faixas e recusa com 503 o que nao cabe na faixa.
+
+    Rotas sincronas esperam por thread antes de chegar ao limitador dos scripts; sem
+    essa reparticao, listagens e sincronizacoes em excesso ocupariam as threads das
+    operacoes interativas.
+    """
+
+    def __init__(self, app: ASGIApp, *, paths: List[str]) -> None:
+        self.app = app
+        self.paths = tuple(paths)
+        self.in_flight = {lane: 0 for lane in LANES}
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not scope["path"].startswith(self.paths):
+            await self.app(scope, receive, send)
+            return
+
+        lane = request_lane(scope["method"], scope["path"])
+        if self.in_flight[lane] >= lane_threads(lane):
+            metrics.LOAD_SHED.labels(lane, "admission").inc()
+            await _reject(send, limiter().retry_after())
+            return
+        # contador do event loop: sem lock
+        self.in_flight[lane] += 1
+        metrics.LANE_REQUESTS_IN_FLIGHT.labels(lane).inc()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.in_flight[lane] -= 1
+            metrics.LANE_REQUESTS_IN_FLIGHT.labels(lane).dec()
+
+
+async def _reject(send: Send, retry_after: float) -> None:
+    body = orjson.dumps({"detail": "Servico sobrecarregado, tente novamente"})
+    await send(
+        {
+            "type": "http.response.start",
+            "status": 503,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(math.ceil(retry_after)).encode()),
+            ],
+        }
+    )
+    await send({"type": "http.response.body", "body": body})
@@ -1,4 +1,4 @@
-from typing import List
+from typing import List, Literal
 
 from pydantic import Field
 from pydantic_settings import BaseSettings, SettingsConfigDict
@@ -14,16 +14,169 @@ class Settings(BaseSettings):
     jwt_algorithm: str = Field(default="HS256", validation_alias="JWT_ALGORITHM")
     jwt_access_token_minutes: int = Field(default=30, validation_alias="JWT_ACCESS_TOKEN_MINUTES")
     jwt_never_expires: bool = Field(default=True, validation_alias="JWT_NEVER_EXPIRES")
+    # tokens ja verificados mantidos por worker (0 desliga o cache)
+    jwt_token_cache_size: int = Field(default=1024, validation_alias="JWT_TOKEN_CACHE_SIZE")
+    # hash do app_secret em memoria; um secret rotacionado em outro worker ainda vale ate este prazo
+    app_credential_cache_seconds: float = Field(default=60.0, validation_alias="APP_CREDENTIAL_CACHE_SECONDS")
+    # intervalo de gravacao em lote de app_clients.last_used (0 grava a cada login)
+    app_last_used_flush_seconds: float = Field(default=30.0, validation_alias="APP_LAST_USED_FLUSH_SECONDS")
 
     ad_scripts_dir: str = Field(default="scripts_ad", validation_alias="AD_SCRIPTS_DIR")
     ad_script_timeout_seconds: int = Field(default=20, validation_alias="AD_SCRIPT_TIMEOUT_SECONDS")
+    ad_adaptive_timeout: bool = Field(default=True, validation_alias="AD_ADAPTIVE_TIMEOUT")
+    ad_script_timeout_min_seconds: float = Field(default=5.0, validation_alias="AD_SCRIPT_TIMEOUT_MIN_SECONDS")
+    ad_adaptive_timeout_percentile: float = Field(default=99.0, validation_alias="AD_ADAPTIVE_TIMEOUT_PERCENTILE")
+    ad_adaptive_timeout_multiplier: float = Field(default=4.0, validation_alias="AD_ADAPTIVE_TIMEOUT_MULTIPLIER")
+    ad_adaptive_timeout_samples: int = Field(default=200, validation_alias="AD_ADAPTIVE_TIMEOUT_SAMPLES")
+    ad_adaptive_timeout_min_samples: int = Field(default=50, validation_alias="AD_ADAPTIVE_TIMEOUT_MIN_SAMPLES")
+    # limites de cada script e dos processos que ele dispara (0 desativa)
+    ad_script_rlimit_cpu_seconds: int = Field(default=60, validation_alias="AD_SCRIPT_RLIMIT_CPU_SECONDS")
+    ad_script_rlimit_as_mb: int = Field(default=1024, validation_alias="AD_SCRIPT_RLIMIT_AS_MB")
+    # teto de memoria de cada run_script: a saida inteira volta como str
+    ad_script_max_output_bytes: int = Field(default=64 * 1024 * 1024, validation_alias="AD_SCRIPT_MAX_OUTPUT_BYTES")
+
+    # limite adaptativo de scripts simultaneos por worker e descarte do excesso
+    concurrency_limit_enabled: bool = Field(default=True, validation_alias="CONCURRENCY_LIMIT_ENABLED")
+    concurrency_limit_initial: int = Field(default=16, validation_alias="CONCURRENCY_LIMIT_INITIAL")
+    concurrency_limit_min: int = Field(default=2, validation_alias="CONCURRENCY_LIMIT_MIN")
+    concurrency_limit_max: int = Field(default=64, validation_alias="CONCURRENCY_LIMIT_MAX")
+    concurrency_queue_depth: int = Field(default=64, validation_alias="CONCURRENCY_QUEUE_DEPTH")
+    concurrency_queue_timeout_seconds: float = Field(default=5.0, validation_alias="CONCURRENCY_QUEUE_TIMEOUT_SECONDS")
+    concurrency_latency_tolerance: float = Field(default=2.0, validation_alias="CONCURRENCY_LATENCY_TOLERANCE")
+    concurrency_backoff: float = Field(default=0.7, validation_alias="CONCURRENCY_BACKOFF")
+    load_shedding_paths: List[str] = Field(
+        default=["/api/v1/users", "/api/v1/groups", "/api/v1/sync"], validation_alias="LOAD_SHEDDING_PATHS"
+    )
+    # faixas de prioridade: threads de cada uma e fracao do limite de scripts
+    lane_interactive_write_threads: int = Field(default=16, validation_alias="LANE_INTERACTIVE_WRITE_THREADS")
+    lane_interactive_read_threads: int = Field(default=24, validation_alias="LANE_INTERACTIVE_READ_THREADS")
+    lane_bulk_threads: int = Field(default=6, validation_alias="LANE_BULK_THREADS")
+    lane_sync_threads: int = Field(default=2, validation_alias="LANE_SYNC_THREADS")
+    lane_other_threads: int = Field(default=8, validation_alias="LANE_OTHER_THREADS")
+    lane_bulk_share: float = Field(default=0.25, validation_alias="LANE_BULK_SHARE")
+    lane_sync_share: float = Field(default=0.125, validation_alias="LANE_SYNC_SHARE")
+    lane_max_wait_seconds: float = Field(default=2.0, validation_alias="LANE_MAX_WAIT_SECONDS")
+    lane_bulk_paths: List[str] = Field(default=["/api/v1/users", "/api/v1/groups"], validation_alias="LANE_BULK_PATHS")
+    lane_sync_paths: List[str] = Field(default=["/api/v1/sync"], validation_alias="LANE_SYNC_PATHS")
+
+    circuit_breaker_enabled: bool = Field(default=True, validation_alias="CIRCUIT_BREAKER_ENABLED")
+    circuit_breaker_window_seconds: float = Field(default=30.0, validation_alias="CIRCUIT_BREAKER_WINDOW_SECONDS")
+    circuit_breaker_min_calls: int = Field(default=10, validation_alias="CIRCUIT_BREAKER_MIN_CALLS")
+    circuit_breaker_failure_ratio: float = Field(default=0.5, validation_alias="CIRCUIT_BREAKER_FAILURE_RATIO")
+    circuit_breaker_open_seconds: float = Field(default=15.0, validation_alias="CIRCUIT_BREAKER_OPEN_SECONDS")
+    circuit_breaker_half_open_calls: int = Field(default=1, validation_alias="CIRCUIT_BREAKER_HALF_OPEN_CALLS")
+    circuit_breaker_snapshot_fallback: bool = Field(
+        default=False, validation_alias="CIRCUIT_BREAKER_SNAPSHOT_FALLBACK"
+    )
+    ad_user_default_fields: List[str] = Field(
+        default=[
+            "sAMAccountName",
+            "userPrincipalName",
+            "cn",
+            "displayName",
+            "givenName",
+            "sn",
+            "mail",
+            "title",
+            "department",
+            "telephoneNumber",
+            "memberOf",
+            "userAccountControl",
+            "pwdLastSet",
+            "accountExpires",
+            "whenCreated",
+            "whenChanged",
+        ],
+        validation_alias="AD_USER_DEFAULT_FIELDS",
+    )
+    ad_group_default_fields: List[str] = Field(
+        default=[
+            "sAMAccountName",
+            "cn",
+            "description",
+            "mail",
+            "groupType",
+            "managedBy",
+            "member",
+            "memberOf",
+            "whenCreated",
+            "whenChanged",
+        ],
+        validation_alias="AD_GROUP_DEFAULT_FIELDS",
+    )
 
     db_url: str = Field(default="sqlite:///./app.db", validation_alias="DATABASE_URL")
 
-    rate_limit_per_minute: int = Field(default=60, validation_alias="RATE_LIMIT_PER_MINUTE")
-    rate_limit_burst: int = Field(default=10, validation_alias="RATE_LIMIT_BURST")
+    snapshot_max_age_seconds: int = Field(default=300, validation_alias="SNAPSHOT_MAX_AGE_SECONDS")
+    # Idempotency-Key nas rotas de escrita: resposta guardada por TTL, repeticoes a recebem pronta
+    idempotency_enabled: bool = Field(default=True, validation_alias="IDEMPOTENCY_ENABLED")
+    idempotency_paths: List[str] = Field(
+        default=["/api/v1/users", "/api/v1/groups"], validation_alias="IDEMPOTENCY_PATHS"
+    )
+    idempotency_ttl_seconds: int = Field(default=86400, validation_alias="IDEMPOTENCY_TTL_SECONDS")
+    # quanto uma repeticao espera a primeira execucao terminar antes do 409
+    idempotency_wait_seconds: float = Field(default=30.0, validation_alias="IDEMPOTENCY_WAIT_SECONDS")
+    # execucao sem resposta por este tempo (worker reiniciado) pode ser refeita
+    idempotency_lock_seconds: float = Field(default=120.0, validation_alias="IDEMPOTENCY_LOCK_SECONDS")
+    idempotency_max_body_bytes: int = Field(default=1024 * 1024, validation_alias="IDEMPOTENCY_MAX_BODY_BYTES")
+    # escritas no AD vao para a tabela jobs e rodam no worker (python -m worker)
+    job_queue_enabled: bool = Field(default=False, validation_alias="JOB_QUEUE_ENABLED")
+    job_max_attempts: int = Field(default=5, validation_alias="JOB_MAX_ATTEMPTS")
+    job_retry_base_seconds: float = Field(default=2.0, validation_alias="JOB_RETRY_BASE_SECONDS")
+    job_poll_seconds: float = Field(default=1.0, validation_alias="JOB_POLL_SECONDS")
+    # job em execucao sem noticia por este tempo (worker caiu) volta para a fila
+    job_lock_seconds: float = Field(default=300.0, validation_alias="JOB_LOCK_SECONDS")
+    worker_concurrency: int = Field(default=4, validation_alias="WORKER_CONCURRENCY")
+    # feed de mudancas (GET /changes); eventos mais velhos que a retencao sao apagados
+    changes_retention_days: float = Field(default=7.0, validation_alias="CHANGES_RETENTION_DAYS")
+    changes_page_size: int = Field(default=500, validation_alias="CHANGES_PAGE_SIZE")
+    changes_poll_seconds: float = Field(default=1.0, validation_alias="CHANGES_POLL_SECONDS")
+    changes_max_wait_seconds: float = Field(default=30.0, validation_alias="CHANGES_MAX_WAIT_SECONDS")
+    changes_heartbeat_seconds: float = Field(default=15.0, validation_alias="CHANGES_HEARTBEAT_SECONDS")
+    # nomes que o AD respondeu como inexistentes, recusados com 404 sem ir ao DC
+    negative_cache_seconds: float = Field(default=30.0, validation_alias="NEGATIVE_CACHE_SECONDS")
+    negative_cache_max_entries: int = Field(default=10_000, validation_alias="NEGATIVE_CACHE_MAX_ENTRIES")
+    # off: so o cache negativo; strict: + sintaxe do sAMAccountName; index: + indice sincronizado
+    ad_name_prevalidation: Literal["off", "strict", "index"] = Field(
+        default="off", validation_alias="AD_NAME_PREVALIDATION"
+    )
+    sync_chunk_size: int = Field(default=500, validation_alias="SYNC_CHUNK_SIZE")
+
+    response_compression: List[str] = Field(default=["br", "gzip"], validation_alias="RESPONSE_COMPRESSION")
+    response_compression_min_size: int = Field(default=1024, validation_alias="RESPONSE_COMPRESSION_MIN_SIZE")
+    response_spool_max_bytes: int = Field(default=1048576, validation_alias="RESPONSE_SPOOL_MAX_BYTES")
+
+    metrics_enabled: bool = Field(default=True, validation_alias="METRICS_ENABLED")
+    slow_op_threshold_ms: int = Field(default=2000, validation_alias="SLOW_OP_THRESHOLD_MS")
+    slow_op_max_rows: int = Field(default=1000, validation_alias="SLOW_OP_MAX_ROWS")
+
+    profiling_enabled: bool = Field(default=False, validation_alias="PROFILING_ENABLED")
+    profile_output_dir: str = Field(default="profiles", validation_alias="PROFILE_OUTPUT_DIR")
+    profile_sample_interval_ms: int = Field(default=5, validation_alias="PROFILE_SAMPLE_INTERVAL_MS")
+
+    # cota por aplicacao, em unidades de custo (uma leitura simples custa 1)
+    rate_limit_per_minute: int = Field(default=600, validation_alias="RATE_LIMIT_PER_MINUTE")
+    rate_limit_burst: int = Field(default=120, validation_alias="RATE_LIMIT_BURST")
+    rate_limit_cost_read: float = Field(default=1.0, validation_alias="RATE_LIMIT_COST_READ")
+    rate_limit_cost_write: float = Field(default=2.0, validation_alias="RATE_LIMIT_COST_WRITE")
+    rate_limit_cost_bulk: float = Field(default=10.0, validation_alias="RATE_LIMIT_COST_BULK")
+    rate_limit_cost_sync: float = Field(default=60.0, validation_alias="RATE_LIMIT_COST_SYNC")
+    # sobrepoe o custo da faixa: "METODO /rota/{parametro}=custo"
+    rate_limit_route_costs: List[str] = Field(
+        default=["POST /api/v1/ops/profile/sync=60"], validation_alias="RATE_LIMIT_ROUTE_COSTS"
+    )
+    # "memory": por worker; "sqlite": arquivo compartilhado pelos workers do host
+    rate_limit_backend: Literal["memory", "sqlite"] = Field(default="memory", validation_alias="RATE_LIMIT_BACKEND")
+    rate_limit_sqlite_path: str = Field(default="rate_limit.sqlite3", validation_alias="RATE_LIMIT_SQLITE_PATH")
+    # teto de baldes em memoria por worker e numero de particoes (cada uma com seu lock)
+    rate_limit_max_keys: int = Field(default=100_000, validation_alias="RATE_LIMIT_MAX_KEYS")
+    rate_limit_shards: int = Field(default=16, validation_alias="RATE_LIMIT_SHARDS")
 
+    # um ou mais DCs separados por virgula ou espaco
     ldap_uri: str = Field(default="ldap://SRV-ADMASTER.nabarrete.local", validation_alias="LDAP_URI")
+    ldap_write_uri: str = Field(default="", validation_alias="LDAP_WRITE_URI")
+    ldap_probe_interval_seconds: float = Field(default=10.0, validation_alias="LDAP_PROBE_INTERVAL_SECONDS")
+    ldap_probe_timeout_seconds: int = Field(default=3, validation_alias="LDAP_PROBE_TIMEOUT_SECONDS")
     bind_dn: str = Field(
         default="CN=Suporte TI NEF,OU=ADM Users,OU=Nabarrete,DC=nabarrete,DC=local",
         validation_alias="BIND_DN",
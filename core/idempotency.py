@@ -0,0 +1,290 @@
+import hashlib
+import time
+from dataclasses import dataclass, field
+from typing import List, Optional, Tuple
+
+import anyio
+import orjson
+from fastapi import HTTPException
+from sqlalchemy.exc import IntegrityError
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from core import metrics
+from core.config import settings
+from core.security import actor_from_payload, verify_token
+from db.models import IdempotencyKey
+from db.session import SessionLocal
+
+HEADER = "idempotency-key"
+METHODS = ("POST", "PUT", "PATCH", "DELETE")
+MAX_KEY_LENGTH = 255
+POLL_SECONDS = 0.1
+# limpeza das chaves vencidas a cada tantas execucoes neste worker
+CLEANUP_EVERY = 100
+
+# cabecalhos da resposta original que a repeticao devolve; os RateLimit-* sao os da
+# execucao (a repeticao nao e cobrada)
+REPLAYED_HEADERS = ("location", "content-location", "etag", "retry-after")
+REPLAYED_PREFIXES = ("ratelimit-",)
+
+# desfechos de claim()
+NEW = "new"
+DONE = "done"
+PENDING = "pending"
+MISMATCH = "mismatch"
+
+
+@dataclass
+class Stored:
+    status_code: int
+    content_type: Optional[str]
+    body: bytes
+    headers: List[Tuple[str, str]] = field(default_factory=list)
+
+
+def claim(app: str, key: str, fingerprint: str) -> Tuple[str, Optional[int], Optional[Stored]]:
+    """Reserva a chave para esta execucao ou devolve o que ja existe para ela.
+
+    Retorna (desfecho, id da linha reservada, resposta guardada). Repeticao de chave
+    concluida custa uma consulta pelo indice unico (app, key).
+    """
+    now = time.time()
+    db = SessionLocal()
+    try:
+        for _ in range(2):
+            record = db.query(IdempotencyKey).filter(IdempotencyKey.app == app, IdempotencyKey.key == key).one_or_none()
+            if record is not None and record.expires_at <= now:
+                db.delete(record)
+                db.commit()
+                record = None
+            if record is None:
+                record = IdempotencyKey(
+                    app=app,
+                    key=key,
+                    fingerprint=fingerprint,
+                    locked_until=now + settings.idempotency_lock_seconds,
+                    expires_at=now + settings.idempotency_ttl_seconds,
+                )
+                db.add(record)
+                try:
+                    db.commit()
+                except IntegrityError:
+                    # outra requisicao com a mesma chave chegou primeiro
+                    db.rollback()
+                    continue
+                return NEW, record.id, None
+            if record.fingerprint != fingerprint:
+                return MISMATCH, None, None
+            if record.status_code is not None:
+                headers = [tuple(pair) for pair in orjson.loads(record.headers_json or "[]")]
+                return DONE, None, Stored(record.status_code, record.content_type, record.body or b"", headers)
+            # execucao abandonada (worker caiu): a primeira repeticao depois do prazo assume
+            taken = (
+                db.query(IdempotencyKey)
+                .filter(
+                    IdempotencyKey.id == record.id,
+                    IdempotencyKey.status_code.is_(None),
+                    IdempotencyKey.locked_until <= now,
+                )
+                .update({IdempotencyKey.locked_until: now + settings.idempotency_lock_seconds})
+            )
+            db.commit()
+            return (NEW, record.id, None) if taken else (PENDING, None, None)
+        return PENDING, None, None
+    finally:
+        db.close()
+
+
+_completed = 0
+
+
+def complete(record_id: int, stored: Stored) -> None:
+    global _completed
+    db = SessionLocal()
+    try:
+        db.query(IdempotencyKey).filter(IdempotencyKey.id == record_id).update(
+            {
+                IdempotencyKey.status_code: stored.status_code,
+                IdempotencyKey.content_type: stored.content_type,
+                IdempotencyKey.headers_json: orjson.dumps(stored.headers).decode(),
+                IdempotencyKey.body: stored.body,
+            }
+        )
+        _completed += 1
+        if _completed % CLEANUP_EVERY == 0:
+            db.query(IdempotencyKey).filter(IdempotencyKey.expires_at <= time.time()).delete(
+                synchronize_session=False
+            )
+        db.commit()
+    finally:
+        db.close()
+
+
+def release(record_id: int) -> None:
+    """Libera a chave sem resposta guardada: a proxima repeticao executa de novo."""
+    db = SessionLocal()
+    try:
+        db.query(IdempotencyKey).filter(IdempotencyKey.id == record_id).delete(synchronize_session=False)
+        db.commit()
+    finally:
+        db.close()
+
+
+def _storable(status_code: int) -> bool:
+    # 5xx e recusas antes da execucao (auth, rate limit) nao contam como resultado
+    return status_code < 500 and status_code not in (401, 403, 429)
+
+
+class IdempotencyMiddleware:
+    """Idempotency-Key nas rotas de escrita.
+
+    A primeira requisicao com a chave executa e tem a resposta guardada por
+    IDEMPOTENCY_TTL_SECONDS; repeticoes recebem a mesma resposta (com
+    ``Idempotent-Replayed: true``) sem executar o script. Repeticao concorrente espera
+    a primeira terminar; a mesma chave com outro corpo recebe 422. A chave vale por
+    aplicacao (claim ``app`` do JWT).
+    """
+
+    def __init__(self, app: ASGIApp, *, paths: List[str]) -> None:
+        self.app = app
+        self.paths = tuple(paths)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["method"] not in METHODS or not scope["path"].startswith(self.paths):
+            await self.app(scope, receive, send)
+            return
+        headers = Headers(scope=scope)
+        key = headers.get(HEADER)
+        caller = _caller(headers)
+        if key is None or caller is None:
+            # sem token valido a rota responde 401 por conta propria
+            await self.app(scope, receive, send)
+            return
+        if not key or len(key) > MAX_KEY_LENGTH or not key.isprintable():
+            await _json(send, 400, {"detail": "Idempotency-Key invalida"})
+            return
+
+        body, receive = await _buffer(receive)
+        digest = hashlib.sha256()
+        for part in (scope["method"], scope["path"], scope.get("query_string", b"").decode("latin-1")):
+            digest.update(part.encode() + b"\0")
+        digest.update(body)
+
+        deadline = time.monotonic() + settings.idempotency_wait_seconds
+        while True:
+            outcome, record_id, stored = await run_in_threadpool(claim, caller, key, digest.hexdigest())
+            if outcome != PENDING or time.monotonic() >= deadline:
+                break
+            await anyio.sleep(POLL_SECONDS)
+
+        if outcome == DONE:
+            metrics.IDEMPOTENCY.labels("replayed").inc()
+            await _replay(send, stored)
+            return
+        if outcome == MISMATCH:
+            metrics.IDEMPOTENCY.labels("mismatch").inc()
+            await _json(send, 422, {"detail": "Idempotency-Key ja usada com outra requisicao"})
+            return
+        if outcome == PENDING:
+            metrics.IDEMPOTENCY.labels("conflict").inc()
+            await _json(send, 409, {"detail": "Requisicao com esta Idempotency-Key em andamento"}, retry_after=1)
+            return
+        await self._execute(scope, receive, send, record_id)
+
+    async def _execute(self, scope: Scope, receive: Receive, send: Send, record_id: int) -> None:
+        start: Optional[Message] = None
+        chunks: List[bytes] = []
+        size = 0
+        finished = False
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal start, size, finished
+            if message["type"] == "http.response.start":
+                # copia: os middlewares de fora trocam os cabecalhos da mensagem
+                start = dict(message)
+            elif message["type"] == "http.response.body":
+                chunk = message.get("body", b"")
+                size += len(chunk)
+                if size <= settings.idempotency_max_body_bytes:
+                    chunks.append(chunk)
+                finished = not message.get("more_body", False)
+            await send(message)
+
+        stored = None
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            if start is not None and finished and size <= settings.idempotency_max_body_bytes:
+                if _storable(start["status"]):
+                    headers = Headers(raw=start["headers"])
+                    # os RateLimit-* sao acrescentados por fora, a partir do estado da requisicao
+                    extra = scope.get("state", {}).get("rate_limit_headers") or {}
+                    stored = Stored(
+                        start["status"],
+                        headers.get("content-type"),
+                        b"".join(chunks),
+                        _replayed_headers([*headers.items(), *((name.lower(), value) for name, value in extra.items())]),
+                    )
+            if stored is not None:
+                metrics.IDEMPOTENCY.labels("executed").inc()
+                await run_in_threadpool(complete, record_id, stored)
+            else:
+                metrics.IDEMPOTENCY.labels("released").inc()
+                await run_in_threadpool(release, record_id)
+
+
+def _caller(headers: Headers) -> Optional[str]:
+    scheme, _, token = headers.get("authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return None
+    try:
+        return actor_from_payload(verify_token(token))
+    except HTTPException:
+        return None
+
+
+async def _buffer(receive: Receive) -> Tuple[bytes, Receive]:
+    # corpos de escrita sao pequenos; o app recebe o mesmo corpo depois do hash
+    parts = []
+    while True:
+        message = await receive()
+        if message["type"] != "http.request":
+            break
+        parts.append(message.get("body", b""))
+        if not message.get("more_body", False):
+            break
+    body = b"".join(parts)
+    replayed = False
+
+    async def replay() -> Message:
+        nonlocal replayed
+        if not replayed:
+            replayed = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        return await receive()
+
+    return body, replay
+
+
+def _replayed_headers(items: List[Tuple[str, str]]) -> List[Tuple[str, str]]:
+    return [(name, value) for name, value in items if name in REPLAYED_HEADERS or name.startswith(REPLAYED_PREFIXES)]
+
+
+async def _replay(send: Send, stored: Stored) -> None:
+    headers = [(b"content-length", str(len(stored.body)).encode()), (b"idempotent-replayed", b"true")]
+    if stored.content_type:
+        headers.append((b"content-type", stored.content_type.encode()))
+    headers.extend((name.encode("latin-1"), value.encode("latin-1")) for name, value in stored.headers)
+    await send({"type": "http.response.start", "status": stored.status_code, "headers": headers})
+    await send({"type": "http.response.body", "body": stored.body})
+
+
+async def _json(send: Send, status_code: int, content: dict, retry_after: Optional[int] = None) -> None:
+    body = orjson.dumps(content)
+    headers = [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]
+    if retry_after is not None:
+        headers.append((b"retry-after", str(retry_after).encode()))
+    await send({"type": "http.response.start", "status": status_code, "headers": headers})
+    await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,220 @@
+import os
+import time
+from contextlib import contextmanager
+from typing import Iterator, Tuple
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import sessionmaker
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+# Com varios workers (uvicorn --workers N), defina PROMETHEUS_MULTIPROC_DIR
+# apontando para um diretorio vazio antes de iniciar o processo.
+MULTIPROC_ENV = "PROMETHEUS_MULTIPROC_DIR"
+
+SCRIPT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0)
+FAST_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+HTTP_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+SCRIPT_DURATION = Histogram(
+    "ad_script_duration_seconds", "Duracao da execucao dos scripts AD", ["script"], buckets=SCRIPT_BUCKETS
+)
+SCRIPT_EXITS = Counter("ad_script_exits_total", "Codigos de saida dos scripts AD", ["script", "code"])
+SCRIPT_TIMEOUTS = Counter("ad_script_timeouts_total", "Scripts AD encerrados por timeout", ["script"])
+SCRIPT_IN_FLIGHT = Gauge(
+    "ad_script_in_flight", "Subprocessos de scripts AD em execucao", ["script"], multiprocess_mode="livesum"
+)
+SCRIPT_ORPHANS = Counter(
+    "ad_script_orphans_total", "Processos que sobreviveram ao script e foram mortos pelo reaper", ["script"]
+)
+SCRIPT_OUTPUT_OVERFLOWS = Counter(
+    "ad_script_output_overflows_total", "Scripts encerrados por exceder o limite de saida", ["script"]
+)
+SCRIPT_TIMEOUT_LIMIT = Gauge(
+    "ad_script_timeout_limit_seconds", "Timeout adaptativo atual por script", ["script"], multiprocess_mode="liveall"
+)
+CIRCUIT_STATE = Gauge(
+    "ad_circuit_state", "Estado do circuito por categoria (0 fechado, 1 meio aberto, 2 aberto)", ["category"],
+    multiprocess_mode="max",
+)
+CIRCUIT_OPENED = Counter("ad_circuit_opened_total", "Aberturas do circuito por categoria", ["category"])
+CIRCUIT_REJECTIONS = Counter("ad_circuit_rejections_total", "Chamadas rejeitadas com o circuito aberto", ["category"])
+
+CONCURRENCY_LIMIT = Gauge(
+    "ad_concurrency_limit", "Limite adaptativo de scripts simultaneos", multiprocess_mode="livesum"
+)
+CONCURRENCY_QUEUED = Gauge(
+    "ad_concurrency_queued", "Chamadas esperando vaga para rodar script", ["lane"], multiprocess_mode="livesum"
+)
+CONCURRENCY_WAIT = Histogram(
+    "ad_concurrency_wait_seconds", "Espera por vaga para rodar script por faixa", ["lane"], buckets=HTTP_BUCKETS
+)
+LANE_REQUESTS_IN_FLIGHT = Gauge(
+    "http_lane_in_flight", "Requisicoes em andamento por faixa de prioridade", ["lane"], multiprocess_mode="livesum"
+)
+LOAD_SHED = Counter("ad_load_shed_total", "Chamadas recusadas por sobrecarga", ["lane", "reason"])
+
+DC_UP = Gauge("ldap_dc_up", "DC considerado saudavel (1) ou fora (0)", ["dc"], multiprocess_mode="liveall")
+DC_PROBE_LATENCY = Gauge(
+    "ldap_dc_probe_latency_seconds", "Media movel da latencia das sondagens por DC", ["dc"], multiprocess_mode="liveall"
+)
+DC_CALLS = Counter("ldap_dc_calls_total", "Execucoes de scripts por DC e resultado", ["dc", "outcome"])
+DC_FAILOVERS = Counter("ldap_dc_failovers_total", "Leituras repetidas no proximo DC apos falha neste", ["dc"])
+
+RATE_LIMIT_EVICTIONS = Counter(
+    "rate_limit_evictions_total", "Baldes do rate limit descartados antes de encher (limite de chaves atingido)"
+)
+TOKEN_CACHE = Counter(
+    "auth_token_cache_total", "Verificacoes de JWT resolvidas pelo cache (hit) ou com jwt.decode (miss)", ["result"]
+)
+JOBS = Counter("ad_jobs_total", "Execucoes de jobs da fila por desfecho", ["operation", "result"])
+JOB_WAIT = Histogram("ad_job_wait_seconds", "Espera na fila ate a execucao do job", buckets=SCRIPT_BUCKETS)
+CHANGE_EVENTS = Counter("ad_change_events_total", "Eventos gravados no feed de mudancas", ["scope", "change", "source"])
+IDEMPOTENCY = Counter(
+    "idempotency_requests_total",
+    "Requisicoes com Idempotency-Key por desfecho (executed, replayed, mismatch, conflict, released)",
+    ["result"],
+)
+AD_NOT_FOUND = Counter(
+    "ad_not_found_total", "Usuarios e grupos inexistentes, por origem da resposta (script, cache, syntax, index)",
+    ["kind", "source"],
+)
+APP_CREDENTIAL_CACHE = Counter(
+    "app_credential_cache_total", "Logins de aplicacao conferidos com o hash em cache (hit) ou no banco (miss)", ["result"]
+)
+RATE_LIMIT_REJECTED = Counter(
+    "rate_limit_rejected_total", "Chamadas recusadas por cota esgotada, por aplicacao", ["app"]
+)
+RATE_LIMIT_BACKEND_ERRORS = Counter(
+    "rate_limit_backend_errors_total", "Verificacoes do rate limit liberadas por erro no backend compartilhado"
+)
+
+AUDIT_FLUSH = Histogram("audit_flush_seconds", "Tempo de gravacao de registros de auditoria", buckets=FAST_BUCKETS)
+DB_SESSION = Histogram("db_session_seconds", "Tempo de vida das sessoes de banco", buckets=HTTP_BUCKETS)
+DB_COMMIT = Histogram("db_commit_seconds", "Tempo de commit no banco", buckets=FAST_BUCKETS)
+DB_QUERY = Histogram("db_query_seconds", "Tempo de execucao de comandos SQL", buckets=FAST_BUCKETS)
+DB_LOCK_ERRORS = Counter("db_lock_errors_total", "Comandos SQL que falharam por banco bloqueado")
+
+HTTP_DURATION = Histogram(
+    "http_request_duration_seconds",
+    "Latencia das requisicoes HTTP por rota",
+    ["method", "route", "status"],
+    buckets=HTTP_BUCKETS,
+)
+
+UNMATCHED_ROUTE = "unmatched"
+
+
+@contextmanager
+def track_script(script: str) -> Iterator[None]:
+    in_flight = SCRIPT_IN_FLIGHT.labels(script)
+    in_flight.inc()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        SCRIPT_DURATION.labels(script).observe(time.perf_counter() - start)
+        in_flight.dec()
+
+
+def record_exit(script: str, returncode: int, *, timed_out: bool = False) -> None:
+    SCRIPT_EXITS.labels(script, str(returncode)).inc()
+    if timed_out:
+        SCRIPT_TIMEOUTS.labels(script).inc()
+
+
+@contextmanager
+def timed(histogram: Histogram) -> Iterator[None]:
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        histogram.observe(time.perf_counter() - start)
+
+
+def instrument_db(engine: Engine, session_factory: sessionmaker) -> None:
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+        conn.info.setdefault("metrics_query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+        DB_QUERY.observe(time.perf_counter() - conn.info["metrics_query_start"].pop())
+
+    @event.listens_for(engine, "handle_error")
+    def _on_error(context) -> None:
+        if "database is locked" in str(context.original_exception):
+            DB_LOCK_ERRORS.inc()
+        if context.connection is not None and context.connection.info.get("metrics_query_start"):
+            context.connection.info["metrics_query_start"].pop()
+
+    @event.listens_for(session_factory, "before_commit")
+    def _before_commit(session) -> None:
+        session.info["metrics_commit_start"] = time.perf_counter()
+
+    @event.listens_for(session_factory, "after_commit")
+    def _after_commit(session) -> None:
+        start = session.info.pop("metrics_commit_start", None)
+        if start is not None:
+            DB_COMMIT.observe(time.perf_counter() - start)
+
+    @event.listens_for(session_factory, "after_rollback")
+    def _after_rollback(session) -> None:
+        session.info.pop("metrics_commit_start", None)
+
+
+def route_template(scope: Scope) -> str:
+    # Versoes recentes do FastAPI guardam a rota original (sem o prefixo do
+    # include_router) em scope["route"]; o caminho completo fica no contexto.
+    context = scope.get("fastapi", {}).get("effective_route_context")
+    path = getattr(context, "path", None) or getattr(scope.get("route"), "path", None)
+    return path or UNMATCHED_ROUTE
+
+
+class MetricsMiddleware:
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+        start = time.perf_counter()
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            HTTP_DURATION.labels(scope["method"], route_template(scope), str(status_code)).observe(
+                time.perf_counter() - start
+            )
+
+
+def latest() -> Tuple[bytes, str]:
+    if os.environ.get(MULTIPROC_ENV):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
+
+
+def mark_process_dead() -> None:
+    if os.environ.get(MULTIPROC_ENV):
+        multiprocess.mark_process_dead(os.getpid())
@@ -0,0 +1,215 @@
+import cProfile
+import inspect
+import io
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from functools import wraps
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, Optional
+
+from fastapi import HTTPException, Request, status
+from fastapi.responses import PlainTextResponse, Response
+from fastapi.routing import APIRoute
+from starlette.concurrency import run_in_threadpool
+
+from core import tracing
+from core.config import settings
+from core.security import Role, verify_token
+
+PROFILE_PARAM = "profile"
+PROFILE_MODES = {"cpu", "sample"}
+STATS_LIMIT = 40
+
+
+class ProfilingBusyError(RuntimeError):
+    pass
+
+
+class StackSampler:
+    def __init__(self, thread_id: int, interval_seconds: float) -> None:
+        self.thread_id = thread_id
+        self.interval_seconds = interval_seconds
+        self.counts: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval_seconds):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({Path(code.co_filename).name}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if stack:
+                self.counts[";".join(reversed(stack))] += 1
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def write_folded(self, path: Path) -> None:
+        with path.open("w", encoding="utf-8") as fp:
+            for stack, count in self.counts.most_common():
+                fp.write(f"{stack} {count}\n")
+
+
+@dataclass
+class ProfileSession:
+    mode: str
+    profiler: Optional[cProfile.Profile] = None
+    sampler: Optional[StackSampler] = None
+
+
+_session: ContextVar[Optional[ProfileSession]] = ContextVar("profile_session", default=None)
+_tracemalloc_lock = threading.Lock()
+
+
+@contextmanager
+def _run_profiled() -> Iterator[None]:
+    session = _session.get()
+    if session is None:
+        yield
+        return
+    if session.mode == "cpu":
+        session.profiler = session.profiler or cProfile.Profile()
+        session.profiler.enable()
+        try:
+            yield
+        finally:
+            session.profiler.disable()
+        return
+    session.sampler = StackSampler(threading.get_ident(), settings.profile_sample_interval_ms / 1000)
+    session.sampler.start()
+    try:
+        yield
+    finally:
+        session.sampler.stop()
+
+
+def _profiled(endpoint: Callable[..., Any]) -> Callable[..., Any]:
+    if inspect.iscoroutinefunction(endpoint):
+
+        @wraps(endpoint)
+        async def async_wrapper(*args: Any, **kwargs: Any) -> Any:
+            with _run_profiled():
+                return await endpoint(*args, **kwargs)
+
+        return async_wrapper
+
+    @wraps(endpoint)
+    def wrapper(*args: Any, **kwargs: Any) -> Any:
+        with _run_profiled():
+            return endpoint(*args, **kwargs)
+
+    return wrapper
+
+
+def _authorize(request: Request) -> None:
+    scheme, _, token = request.headers.get("authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Token ausente")
+    if verify_token(token).get("role") != Role.admin.value:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Permissao insuficiente")
+
+
+def _cpu_summary(profiler: Optional[cProfile.Profile]) -> str:
+    if profiler is None:
+        return "Nenhuma amostra coletada\n"
+    buffer = io.StringIO()
+    pstats.Stats(profiler, stream=buffer).sort_stats(pstats.SortKey.CUMULATIVE).print_stats(STATS_LIMIT)
+    return buffer.getvalue()
+
+
+def _write_folded(sampler: Optional[StackSampler]) -> Optional[str]:
+    if sampler is None:
+        return None
+    output_dir = Path(settings.profile_output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    name = f"{int(time.time())}-{tracing.current_request_id() or tracing.new_request_id()}.folded"
+    path = output_dir / name
+    sampler.write_folded(path)
+    return str(path)
+
+
+async def _drain(response: Response) -> None:
+    body_iterator = getattr(response, "body_iterator", None)
+    if body_iterator is not None:
+        async for _ in body_iterator:
+            pass
+
+
+class ProfiledRoute(APIRoute):
+    def __init__(self, path: str, endpoint: Callable[..., Any], **kwargs: Any) -> None:
+        if settings.profiling_enabled:
+            endpoint = _profiled(endpoint)
+        super().__init__(path, endpoint, **kwargs)
+
+    def get_route_handler(self) -> Callable[[Request], Any]:
+        handler = super().get_route_handler()
+        if not settings.profiling_enabled:
+            return handler
+
+        async def profiled_handler(request: Request) -> Response:
+            mode = request.query_params.get(PROFILE_PARAM)
+            if mode is None:
+                return await handler(request)
+            _authorize(request)
+            if mode not in PROFILE_MODES:
+                raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Modo de profiling invalido")
+            session = ProfileSession(mode=mode)
+            token = _session.set(session)
+            try:
+                response = await handler(request)
+            finally:
+                _session.reset(token)
+            if mode == "cpu":
+                await _drain(response)
+                return PlainTextResponse(
+                    _cpu_summary(session.profiler), headers={"X-Profile-Status": str(response.status_code)}
+                )
+            output = await run_in_threadpool(_write_folded, session.sampler)
+            if output:
+                response.headers["X-Profile-Output"] = output
+            return response
+
+        return profiled_handler
+
+
+@contextmanager
+def allocation_profile(limit: int) -> Iterator[Dict[str, Any]]:
+    if not _tracemalloc_lock.acquire(blocking=False):
+        raise ProfilingBusyError("Ja existe um profiling de memoria em andamento")
+    report: Dict[str, Any] = {}
+    tracemalloc.start()
+    try:
+        yield report
+        snapshot = tracemalloc.take_snapshot().filter_traces(
+            [
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            ]
+        )
+        report["peak_bytes"] = tracemalloc.get_traced_memory()[1]
+        report["top"] = [
+            {
+                "file": stat.traceback[0].filename,
+                "line": stat.traceback[0].lineno,
+                "size_bytes": stat.size,
+                "count": stat.count,
+            }
+            for stat in snapshot.statistics("lineno")[:limit]
+        ]
+    finally:
+        tracemalloc.stop()
+        _tracemalloc_lock.release()
@@ -1,50 +1,278 @@
+import math
+import sqlite3
+import threading
 import time
-from dataclasses import dataclass
+from array import array
+from collections import OrderedDict
 from threading import Lock
-from typing import Dict
+from typing import Any, Callable, Dict, List, NamedTuple, Tuple
 
-from fastapi import HTTPException, Request, status
+from fastapi import Depends, HTTPException, Request, status
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 
+from core import metrics
+from core.concurrency import BULK, INTERACTIVE_READ, INTERACTIVE_WRITE, SYNC, request_lane
 from core.config import settings
+from core.security import actor_from_payload, get_current_payload
 
+# baldes ociosos descartados por chamada; mantem o custo de allow() constante
+EXPIRE_BATCH = 8
 
-@dataclass
-class Bucket:
-    tokens: float
-    last: float
+
+def _gcra_params() -> Tuple[float, float]:
+    """Intervalo entre chamadas e folga maxima (rajada) do GCRA, em segundos.
+
+    Em vez de tokens e horario da ultima reposicao, cada chave guarda so o TAT (horario
+    teorico da proxima chamada): a chamada cabe se ``max(tat, agora) + intervalo`` nao
+    passar de ``agora + rajada * intervalo``. Equivale ao token bucket de capacidade
+    ``RATE_LIMIT_BURST`` com reposicao de ``RATE_LIMIT_PER_MINUTE``.
+    """
+    interval = 60.0 / max(settings.rate_limit_per_minute, 1)
+    return interval, settings.rate_limit_burst * interval
+
+
+class Quota(NamedTuple):
+    allowed: bool
+    # unidades que ainda cabem agora, segundos ate a cota encher e ate a chamada caber
+    remaining: int
+    reset: float
+    retry_after: float
+
+
+def _cost(cost: float) -> float:
+    # custo acima da rajada nunca caberia; cobra a rajada inteira
+    return min(cost, float(settings.rate_limit_burst))
+
+
+def _quota(allowed: bool, current: float, tat: float, now: float) -> Quota:
+    """``current`` e o TAT gravado; ``tat`` o que a chamada pediu (igual, se passou)."""
+    interval, burst = _gcra_params()
+    used = max(current - now, 0.0)
+    return Quota(
+        allowed=allowed,
+        remaining=max(0, int((burst - used) / interval + 1e-9)),
+        reset=used,
+        retry_after=0.0 if allowed else tat - now - burst,
+    )
+
+
+class _Shard:
+    __slots__ = ("lock", "slots", "tat", "free")
+
+    def __init__(self, capacity: int) -> None:
+        self.lock = Lock()
+        # chave -> posicao no array, da menos para a mais recentemente usada
+        self.slots: "OrderedDict[str, int]" = OrderedDict()
+        self.tat = array("d", bytes(8 * capacity))
+        self.free: List[int] = list(range(capacity - 1, -1, -1))
 
 
 class InMemoryRateLimiter:
-    def __init__(self) -> None:
-        self._store: Dict[str, Bucket] = {}
-        self._lock = Lock()
-
-    def allow(self, key: str) -> bool:
-        now = time.monotonic()
-        refill_rate = settings.rate_limit_per_minute / 60.0
-        burst = settings.rate_limit_burst
-        with self._lock:
-            bucket = self._store.get(key)
-            if bucket is None:
-                bucket = Bucket(tokens=burst, last=now)
-                self._store[key] = bucket
-            elapsed = now - bucket.last
-            bucket.tokens = min(burst, bucket.tokens + elapsed * refill_rate)
-            bucket.last = now
-            if bucket.tokens >= 1:
-                bucket.tokens -= 1
-                return True
-            return False
-
-
-limiter = InMemoryRateLimiter()
-
-
-def rate_limit_dependency(request: Request) -> None:
-    client_key = request.client.host if request.client else "unknown"
-    path_key = request.url.path
-    key = f"{client_key}:{path_key}"
-    if not limiter.allow(key):
-        raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail="Rate limit excedido")
+    """GCRA por chave com memoria limitada, valido dentro de um processo.
+
+    As chaves ficam em ``shards`` particoes, cada uma com seu lock e ate
+    ``max_keys / shards`` chaves num array de tamanho fixo. Chave com TAT no passado
+    tem a rajada inteira disponivel, como uma chave nova, e e descartada sem perda; com
+    a particao cheia, sai a menos usada recentemente (que volta cheia se reaparecer).
+    """
+
+    def __init__(self, *, max_keys: int, shards: int, clock: Callable[[], float] = time.monotonic) -> None:
+        count = 1 << max(0, math.ceil(math.log2(max(1, shards))))
+        self._mask = count - 1
+        self._shards = [_Shard(max(1, math.ceil(max_keys / count))) for _ in range(count)]
+        self._clock = clock
+
+    def __len__(self) -> int:
+        return sum(len(shard.slots) for shard in self._shards)
+
+    def check(self, key: str, cost: float = 1.0) -> Quota:
+        now = self._clock()
+        interval, burst = _gcra_params()
+        shard = self._shards[hash(key) & self._mask]
+        with shard.lock:
+            slot = shard.slots.get(key)
+            if slot is None:
+                slot = self._new_slot(shard, now)
+                shard.slots[key] = slot
+                shard.tat[slot] = now
+            else:
+                shard.slots.move_to_end(key)
+            current = shard.tat[slot]
+            tat = max(current, now) + _cost(cost) * interval
+            allowed = tat - now <= burst
+            if allowed:
+                shard.tat[slot] = current = tat
+        return _quota(allowed, current, tat, now)
+
+    def allow(self, key: str, cost: float = 1.0) -> bool:
+        return self.check(key, cost).allowed
+
+    def _new_slot(self, shard: _Shard, now: float) -> int:
+        slots = shard.slots
+        for _ in range(EXPIRE_BATCH):
+            if not slots:
+                break
+            oldest, slot = next(iter(slots.items()))
+            if shard.tat[slot] > now:
+                break
+            del slots[oldest]
+            shard.free.append(slot)
+        if not shard.free:
+            _, slot = slots.popitem(last=False)
+            metrics.RATE_LIMIT_EVICTIONS.inc()
+            return slot
+        return shard.free.pop()
+
+
+class SQLiteRateLimiter:
+    """GCRA com o estado num arquivo SQLite compartilhado pelos workers do host.
+
+    Cada verificacao e um unico upsert condicional (atomico no SQLite): so grava o novo
+    TAT se a chamada cabe. Usa o relogio de parede, comum aos processos. Se o banco
+    falhar, a chamada passa: o rate limit nao derruba a API.
+    """
+
+    def __init__(self, path: str, *, cleanup_every: int = 1000, clock: Callable[[], float] = time.time) -> None:
+        self.path = path
+        self.cleanup_every = cleanup_every
+        self._clock = clock
+        self._local = threading.local()
+        self._calls = 0
+        connection = self._connect()
+        try:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("CREATE TABLE IF NOT EXISTS rate_limit (key TEXT PRIMARY KEY, tat REAL NOT NULL)")
+        finally:
+            connection.close()
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.path, timeout=1.0, isolation_level=None, check_same_thread=False)
+        # estado descartavel: perder os ultimos TATs numa queda do host nao importa
+        connection.execute("PRAGMA synchronous=OFF")
+        return connection
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = self._connect()
+            self._local.connection = connection
+        return connection
+
+    def check(self, key: str, cost: float = 1.0) -> Quota:
+        now = self._clock()
+        interval, burst = _gcra_params()
+        tat = now + _cost(cost) * interval
+        try:
+            connection = self._connection()
+            rows = connection.execute(
+                "INSERT INTO rate_limit (key, tat) VALUES (:key, :tat) "
+                "ON CONFLICT(key) DO UPDATE SET tat = max(tat, :now) + :step "
+                "WHERE max(tat, :now) + :step - :now <= :burst RETURNING tat",
+                {"key": key, "now": now, "tat": tat, "step": tat - now, "burst": burst},
+            ).fetchall()
+            if rows:
+                current = tat = rows[0][0]
+            else:
+                # so para os cabecalhos: outro worker pode ter mudado o TAT entre as duas leituras
+                current = connection.execute("SELECT tat FROM rate_limit WHERE key = ?", (key,)).fetchone()[0]
+                tat = max(current, now) + (tat - now)
+            self._calls += 1
+            if self._calls % self.cleanup_every == 0:
+                # TAT no passado equivale a chave nova
+                connection.execute("DELETE FROM rate_limit WHERE tat <= ?", (now,))
+        except sqlite3.Error:
+            metrics.RATE_LIMIT_BACKEND_ERRORS.inc()
+            return _quota(True, now, now, now)
+        return _quota(bool(rows), current, tat, now)
+
+    def allow(self, key: str, cost: float = 1.0) -> bool:
+        return self.check(key, cost).allowed
+
+
+def build_limiter():
+    if settings.rate_limit_backend == "memory":
+        return InMemoryRateLimiter(max_keys=settings.rate_limit_max_keys, shards=settings.rate_limit_shards)
+    if settings.rate_limit_backend == "sqlite":
+        return SQLiteRateLimiter(settings.rate_limit_sqlite_path)
+    raise ValueError(f"RATE_LIMIT_BACKEND invalido: {settings.rate_limit_backend}")
+
+
+limiter = build_limiter()
+
+
+def _route_costs(entries: List[str]) -> Dict[str, float]:
+    # "METODO /rota/{parametro}=custo", com a rota como declarada no FastAPI
+    costs = {}
+    for entry in entries:
+        route, sep, cost = entry.rpartition("=")
+        if not sep or " " not in route.strip():
+            raise ValueError(f"RATE_LIMIT_ROUTE_COSTS invalido: {entry}")
+        method, path = route.split(None, 1)
+        costs[f"{method.upper()} {path.strip()}"] = float(cost)
+    return costs
+
+
+ROUTE_COSTS = _route_costs(settings.rate_limit_route_costs)
+
+
+def request_cost(request: Request) -> float:
+    """Custo da chamada: o da rota em RATE_LIMIT_ROUTE_COSTS ou o da faixa dela."""
+    # rota com o prefixo do include_router, como em RATE_LIMIT_ROUTE_COSTS e nas metricas
+    template = metrics.route_template(request.scope)
+    if template == metrics.UNMATCHED_ROUTE:
+        template = request.url.path
+    cost = ROUTE_COSTS.get(f"{request.method} {template}")
+    if cost is not None:
+        return cost
+    return {
+        INTERACTIVE_READ: settings.rate_limit_cost_read,
+        INTERACTIVE_WRITE: settings.rate_limit_cost_write,
+        BULK: settings.rate_limit_cost_bulk,
+        SYNC: settings.rate_limit_cost_sync,
+    }[request_lane(request.method, template)]
+
+
+def _headers(quota: Quota) -> Dict[str, str]:
+    headers = {
+        "RateLimit-Limit": str(settings.rate_limit_burst),
+        "RateLimit-Remaining": str(quota.remaining),
+        "RateLimit-Reset": str(math.ceil(quota.reset)),
+    }
+    if not quota.allowed:
+        headers["Retry-After"] = str(max(1, math.ceil(quota.retry_after)))
+    return headers
+
+
+def rate_limit_dependency(request: Request, payload: Dict[str, Any] = Depends(get_current_payload)) -> None:
+    """Cota por aplicacao (claim ``app`` do JWT), cobrando o custo da rota."""
+    app = actor_from_payload(payload)
+    quota = limiter.check(f"app:{app}", request_cost(request))
+    headers = _headers(quota)
+    if not quota.allowed:
+        metrics.RATE_LIMIT_REJECTED.labels(app).inc()
+        raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail="Rate limit excedido", headers=headers)
+    # as rotas devolvem Response proprias; o middleware acrescenta os cabecalhos
+    request.state.rate_limit_headers = headers
+
+
+class RateLimitHeadersMiddleware:
+    """Acrescenta os cabecalhos RateLimit-* deixados por ``rate_limit_dependency``."""
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
 
+        async def send_wrapper(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                headers = scope.get("state", {}).get("rate_limit_headers")
+                if headers:
+                    message["headers"] = list(message.get("headers", [])) + [
+                        (name.lower().encode(), value.encode()) for name, value in headers.items()
+                    ]
+            await send(message)
 
+        await self.app(scope, receive, send_wrapper)
@@ -1,11 +1,16 @@
+import hashlib
+import time
+from collections import OrderedDict
 from datetime import datetime, timedelta, timezone
 from enum import Enum
-from typing import Any, Dict
+from threading import Lock
+from typing import Any, Callable, Dict, Optional, Tuple
 
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
 
+from core import metrics
 from core.config import settings
 
 class Role(str, Enum):
@@ -28,7 +33,80 @@ def create_access_token(subject: str, role: Role, extra: Dict[str, Any] | None =
     return jwt.encode(payload, settings.jwt_secret_key, algorithm=settings.jwt_algorithm)
 
 
+class TokenCache:
+    """LRU de tokens ja verificados: digest do token -> payload decodificado.
+
+    As integracoes reusam poucos tokens de longa duracao; o ``jwt.decode`` com HMAC
+    so roda na primeira vez. A entrada vence junto com o ``exp`` do token, quando ha,
+    e o cache inteiro e descartado se ``JWT_SECRET_KEY`` mudar.
+    """
+
+    def __init__(self, max_size: int, clock: Callable[[], float] = time.time) -> None:
+        self.max_size = max_size
+        self._clock = clock
+        self._lock = Lock()
+        self._entries: "OrderedDict[bytes, Tuple[Dict[str, Any], float]]" = OrderedDict()
+        self._secret = settings.jwt_secret_key
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, digest: bytes) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            if self._secret != settings.jwt_secret_key:
+                self._purge()
+                return None
+            entry = self._entries.get(digest)
+            if entry is None:
+                return None
+            if entry[1] <= self._clock():
+                del self._entries[digest]
+                return None
+            self._entries.move_to_end(digest)
+            return entry[0]
+
+    def put(self, digest: bytes, payload: Dict[str, Any]) -> None:
+        if self.max_size <= 0:
+            return
+        expires = float(payload["exp"]) if "exp" in payload else float("inf")
+        with self._lock:
+            self._entries[digest] = (payload, expires)
+            self._entries.move_to_end(digest)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def purge(self) -> None:
+        with self._lock:
+            self._purge()
+
+    def _purge(self) -> None:
+        self._entries.clear()
+        self._secret = settings.jwt_secret_key
+
+
+token_cache = TokenCache(settings.jwt_token_cache_size)
+_CACHE_HIT = metrics.TOKEN_CACHE.labels("hit")
+_CACHE_MISS = metrics.TOKEN_CACHE.labels("miss")
+
+
+def purge_token_cache() -> None:
+    """Esquece os tokens verificados (ex.: depois de trocar a chave de assinatura)."""
+    token_cache.purge()
+
+
 def verify_token(token: str) -> Dict[str, Any]:
+    digest = hashlib.sha256(token.encode()).digest()
+    payload = token_cache.get(digest)
+    if payload is not None:
+        _CACHE_HIT.inc()
+        return payload
+    _CACHE_MISS.inc()
+    payload = _decode_token(token)
+    token_cache.put(digest, payload)
+    return payload
+
+
+def _decode_token(token: str) -> Dict[str, Any]:
     try:
         payload = jwt.decode(token, settings.jwt_secret_key, algorithms=[settings.jwt_algorithm])
     except JWTError as exc:
@@ -43,8 +121,10 @@ def get_current_payload(token: str = Depends(oauth2_scheme)) -> Dict[str, Any]:
 
 
 def require_roles(*roles: Role):
+    allowed = frozenset(role.value for role in roles)
+
     def _checker(payload: Dict[str, Any] = Depends(get_current_payload)) -> Dict[str, Any]:
-        if payload.get("role") not in {role.value for role in roles}:
+        if payload.get("role") not in allowed:
             raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Permissao insuficiente")
         return payload
 
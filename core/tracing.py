@@ -0,0 +1,173 @@
+import re
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, Callable, ContextManager, Dict, Iterator, List, Optional
+
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from core.config import settings
+from core.metrics import route_template
+
+REQUEST_ID_HEADER = "X-Request-ID"
+REQUEST_ID_RE = re.compile(r"^[A-Za-z0-9._:-]{1,64}$")
+MAX_SPANS = 200
+
+
+@dataclass
+class Span:
+    name: str
+    start_ms: float
+    depth: int
+    attrs: Dict[str, Any]
+    duration_ms: float = 0.0
+
+
+@dataclass
+class Trace:
+    request_id: str
+    name: str
+    started: float = field(default_factory=time.perf_counter)
+    spans: List[Span] = field(default_factory=list)
+    depth: int = 0
+    dropped: int = 0
+    status: str = "ok"
+    duration_ms: float = 0.0
+    # espera por eventos (long-poll, stream): nao conta como lentidao
+    idle_ms: float = 0.0
+
+    def elapsed_ms(self) -> float:
+        return (time.perf_counter() - self.started) * 1000
+
+    def breakdown(self) -> List[Dict[str, Any]]:
+        spans = [
+            {
+                "name": item.name,
+                "start_ms": round(item.start_ms, 3),
+                "duration_ms": round(item.duration_ms, 3),
+                "depth": item.depth,
+                **({"attrs": item.attrs} if item.attrs else {}),
+            }
+            for item in self.spans
+        ]
+        if self.dropped:
+            spans.append({"name": "dropped", "count": self.dropped})
+        return spans
+
+
+_current: ContextVar[Optional[Trace]] = ContextVar("trace", default=None)
+
+
+def new_request_id() -> str:
+    return uuid.uuid4().hex
+
+
+def current_request_id() -> Optional[str]:
+    trace = _current.get()
+    return trace.request_id if trace is not None else None
+
+
+@contextmanager
+def span(name: str, **attrs: Any) -> Iterator[None]:
+    trace = _current.get()
+    if trace is None:
+        yield
+        return
+    if len(trace.spans) >= MAX_SPANS:
+        trace.dropped += 1
+        yield
+        return
+    item = Span(name=name, start_ms=trace.elapsed_ms(), depth=trace.depth, attrs=attrs)
+    trace.spans.append(item)
+    trace.depth += 1
+    try:
+        yield
+    finally:
+        trace.depth -= 1
+        item.duration_ms = trace.elapsed_ms() - item.start_ms
+
+
+@contextmanager
+def activate(current: Trace) -> Iterator[Trace]:
+    token = _current.set(current)
+    try:
+        yield current
+    except Exception:
+        current.status = "error"
+        raise
+    finally:
+        _current.reset(token)
+        current.duration_ms = current.elapsed_ms()
+
+
+def trace(name: str, request_id: Optional[str] = None) -> ContextManager[Trace]:
+    return activate(Trace(request_id=request_id or new_request_id(), name=name))
+
+
+@contextmanager
+def idle() -> Iterator[None]:
+    trace = _current.get()
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        if trace is not None:
+            trace.idle_ms += (time.perf_counter() - started) * 1000
+
+
+def is_slow(current: Trace) -> bool:
+    threshold = settings.slow_op_threshold_ms
+    return threshold > 0 and current.duration_ms - current.idle_ms >= threshold
+
+
+@contextmanager
+def record_slow(name: str, sink: Callable[[Trace], None]) -> Iterator[Trace]:
+    current = Trace(request_id=current_request_id() or new_request_id(), name=name)
+    try:
+        with activate(current):
+            yield current
+    finally:
+        if is_slow(current):
+            sink(current)
+
+
+def _request_id(scope: Scope) -> str:
+    incoming = Headers(scope=scope).get(REQUEST_ID_HEADER)
+    if incoming and REQUEST_ID_RE.match(incoming):
+        return incoming
+    return new_request_id()
+
+
+class TracingMiddleware:
+    def __init__(self, app: ASGIApp, *, sink: Callable[[Trace], None]) -> None:
+        self.app = app
+        self.sink = sink
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_id = _request_id(scope)
+        status_code = 500
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                MutableHeaders(scope=message).append(REQUEST_ID_HEADER, request_id)
+            await send(message)
+
+        current = Trace(request_id=request_id, name=f"{scope['method']} {scope['path']}")
+        try:
+            with activate(current):
+                await self.app(scope, receive, send_wrapper)
+        finally:
+            current.name = f"{scope['method']} {route_template(scope)}"
+            current.status = str(status_code)
+            if is_slow(current):
+                await run_in_threadpool(self.sink, current)
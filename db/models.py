@@ -1,6 +1,6 @@
 from datetime import datetime, timezone
 
-from sqlalchemy import DateTime, Integer, String, Text
+from sqlalchemy import DateTime, Float, Index, Integer, LargeBinary, String, Text, UniqueConstraint
 from sqlalchemy.orm import Mapped, mapped_column
 
 from db.session import Base
@@ -47,3 +47,99 @@ class AppClient(Base):
     secret_hash: Mapped[str] = mapped_column(String(64), nullable=False)
     created_at: Mapped[datetime] = mapped_column(DateTime, default=lambda: datetime.now(timezone.utc))
     last_used: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
+
+
+class SnapshotState(Base):
+    __tablename__ = "snapshot_state"
+
+    scope: Mapped[str] = mapped_column(String(32), primary_key=True)
+    generation: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    synced_generation: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    synced_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
+
+
+class SlowOperation(Base):
+    __tablename__ = "slow_operations"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    request_id: Mapped[str] = mapped_column(String(64), nullable=False, index=True)
+    name: Mapped[str] = mapped_column(String(255), nullable=False)
+    status: Mapped[str] = mapped_column(String(16), nullable=False)
+    duration_ms: Mapped[float] = mapped_column(Float, nullable=False)
+    spans_json: Mapped[str] = mapped_column(Text, nullable=False)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=lambda: datetime.now(timezone.utc))
+
+
+class IdempotencyKey(Base):
+    __tablename__ = "idempotency_keys"
+    __table_args__ = (UniqueConstraint("app", "key"),)
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    app: Mapped[str] = mapped_column(String(128), nullable=False)
+    key: Mapped[str] = mapped_column(String(255), nullable=False)
+    fingerprint: Mapped[str] = mapped_column(String(64), nullable=False)
+    # sem status_code a primeira execucao ainda esta em andamento
+    status_code: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    content_type: Mapped[str | None] = mapped_column(String(128), nullable=True)
+    # demais cabecalhos repetidos na resposta (Location, RateLimit-*...), em JSON [[nome, valor]]
+    headers_json: Mapped[str | None] = mapped_column(Text, nullable=True)
+    body: Mapped[bytes | None] = mapped_column(LargeBinary, nullable=True)
+    # epoch em segundos: a execucao pode ser assumida por outra depois de locked_until
+    locked_until: Mapped[float] = mapped_column(Float, nullable=False)
+    expires_at: Mapped[float] = mapped_column(Float, nullable=False, index=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=lambda: datetime.now(timezone.utc))
+
+
+class Job(Base):
+    __tablename__ = "jobs"
+    __table_args__ = (Index("ix_jobs_status_run_after", "status", "run_after"),)
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    operation: Mapped[str] = mapped_column(String(64), nullable=False)
+    actor: Mapped[str] = mapped_column(String(255), nullable=False)
+    # argumentos da operacao (podem conter senha), cifrados; apagados quando o job termina
+    sealed_args: Mapped[str | None] = mapped_column(Text, nullable=True)
+    status: Mapped[str] = mapped_column(String(16), nullable=False)
+    attempts: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    # epoch em segundos
+    run_after: Mapped[float] = mapped_column(Float, nullable=False)
+    locked_by: Mapped[str | None] = mapped_column(String(128), nullable=True)
+    locked_until: Mapped[float | None] = mapped_column(Float, nullable=True)
+    # inicio da tentativa em andamento: preenchido antes do script e limpo quando ela
+    # termina; se ainda estiver la, o worker anterior caiu e o AD pode ja ter mudado
+    started_at: Mapped[float | None] = mapped_column(Float, nullable=True)
+    output: Mapped[str | None] = mapped_column(Text, nullable=True)
+    error: Mapped[str | None] = mapped_column(Text, nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=lambda: datetime.now(timezone.utc))
+    finished_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
+
+
+class ChangeFeedState(Base):
+    __tablename__ = "change_feed_state"
+
+    # linha unica, travada do primeiro evento da transacao ate o commit: o seq de uma
+    # transacao so e dado depois que a anterior termina
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    last_seq: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    # maior seq ja apagado pela retencao: cursor abaixo dele perdeu eventos
+    purged_seq: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+
+
+class ChangeEvent(Base):
+    __tablename__ = "change_events"
+    # sem AUTOINCREMENT o SQLite reusaria ids depois da limpeza e o cursor voltaria
+    __table_args__ = {"sqlite_autoincrement": True}
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    # cursor do feed (``since``), dado por ChangeFeedState: segue a ordem dos commits
+    seq: Mapped[int] = mapped_column(Integer, nullable=False, unique=True)
+    scope: Mapped[str] = mapped_column(String(32), nullable=False)
+    object_id: Mapped[str] = mapped_column(String(255), nullable=False)
+    change: Mapped[str] = mapped_column(String(16), nullable=False)
+    # nomes dos atributos do AD alterados (lista JSON); vazio em remocoes
+    attributes_json: Mapped[str | None] = mapped_column(Text, nullable=True)
+    source: Mapped[str] = mapped_column(String(16), nullable=False)
+    actor: Mapped[str | None] = mapped_column(String(255), nullable=True)
+    action: Mapped[str | None] = mapped_column(String(128), nullable=True)
+    # epoch em segundos
+    recorded_at: Mapped[float] = mapped_column(Float, nullable=False, index=True)
@@ -1,10 +1,12 @@
 from sqlalchemy import create_engine
 from sqlalchemy.orm import declarative_base, sessionmaker
 
+from core import metrics
 from core.config import settings
 
 engine = create_engine(settings.db_url, future=True)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine, future=True)
+metrics.instrument_db(engine, SessionLocal)
 
 Base = declarative_base()
 
@@ -12,6 +14,7 @@ Base = declarative_base()
 def get_db():
     db = SessionLocal()
     try:
-        yield db
+        with metrics.timed(metrics.DB_SESSION):
+            yield db
     finally:
         db.close()
@@ -1,9 +1,19 @@
+from anyio import to_thread
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
-from api.v1 import auth, groups, users
+from api import metrics as metrics_api
+from api.v1 import auth, changes, groups, jobs, ops, users
+from core import concurrency, metrics
+from core.compression import CompressionMiddleware
+from core.concurrency import LoadSheddingMiddleware
 from core.config import settings
+from core.idempotency import IdempotencyMiddleware
+from core.rate_limit import RateLimitHeadersMiddleware
+from core.responses import FastJSONResponse
+from core.tracing import TracingMiddleware
 from db.session import Base, engine
+from services import app_tokens, dc_pool, slow_ops
 
 
 def create_app() -> FastAPI:
@@ -14,6 +24,7 @@ def create_app() -> FastAPI:
         openapi_url="/openapi.json",
         docs_url="/docs",
         redoc_url="/redoc",
+        default_response_class=FastJSONResponse,
     )
 
     app.add_middleware(
@@ -24,14 +35,65 @@ def create_app() -> FastAPI:
         allow_headers=["*"],
     )
 
+    if settings.idempotency_enabled:
+        # dentro da compressao: guarda e repete o corpo sem codificacao
+        app.add_middleware(IdempotencyMiddleware, paths=settings.idempotency_paths)
+
+    if settings.response_compression:
+        app.add_middleware(
+            CompressionMiddleware,
+            algorithms=settings.response_compression,
+            minimum_size=settings.response_compression_min_size,
+        )
+
+    app.add_middleware(RateLimitHeadersMiddleware)
+
+    if settings.concurrency_limit_enabled:
+        app.add_middleware(LoadSheddingMiddleware, paths=settings.load_shedding_paths)
+
+    if settings.metrics_enabled:
+        app.add_middleware(metrics.MetricsMiddleware)
+        app.include_router(metrics_api.router, tags=["metrics"])
+
+    app.add_middleware(TracingMiddleware, sink=slow_ops.record)
+
     app.include_router(auth.router, prefix="/api/v1", tags=["auth"])
     app.include_router(users.router, prefix="/api/v1", tags=["users"])
     app.include_router(groups.router, prefix="/api/v1", tags=["groups"])
+    app.include_router(ops.router, prefix="/api/v1", tags=["ops"])
+    app.include_router(jobs.router, prefix="/api/v1", tags=["jobs"])
+    app.include_router(changes.router, prefix="/api/v1", tags=["changes"])
 
     @app.on_event("startup")
     def _init_db() -> None:
         Base.metadata.create_all(bind=engine)
 
+    @app.on_event("startup")
+    async def _size_threadpool() -> None:
+        # rotas sincronas rodam no threadpool do anyio; cada faixa tem sua parte dele
+        if settings.concurrency_limit_enabled:
+            to_thread.current_default_thread_limiter().total_tokens = concurrency.thread_budget()
+
+    @app.on_event("startup")
+    def _start_dc_prober() -> None:
+        dc_pool.start_prober()
+
+    @app.on_event("shutdown")
+    def _stop_dc_prober() -> None:
+        dc_pool.stop_prober()
+
+    @app.on_event("startup")
+    def _start_last_used_flusher() -> None:
+        app_tokens.start_flusher()
+
+    @app.on_event("shutdown")
+    def _stop_last_used_flusher() -> None:
+        app_tokens.stop_flusher()
+
+    @app.on_event("shutdown")
+    def _release_metrics() -> None:
+        metrics.mark_process_dead()
+
     return app
 
 
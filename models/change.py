@@ -0,0 +1,22 @@
+from datetime import datetime
+from typing import List, Optional
+
+from pydantic import BaseModel
+
+
+class ChangeOut(BaseModel):
+    seq: int
+    scope: str
+    object_id: str
+    change: str
+    attributes: List[str]
+    source: str
+    actor: Optional[str] = None
+    action: Optional[str] = None
+    recorded_at: datetime
+
+
+class ChangeList(BaseModel):
+    events: List[ChangeOut]
+    # cursor para a proxima chamada (since)
+    next: int
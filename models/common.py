@@ -0,0 +1,12 @@
+from pydantic import BaseModel
+
+
+class ScriptResult(BaseModel):
+    status: str
+    action: str
+    identifier: str
+
+
+class SyncResult(ScriptResult):
+    total: int
+    updated: int
@@ -28,8 +28,13 @@ class GroupMemberChange(BaseModel):
 
 class GroupOut(BaseModel):
     groupname: str
+    dn: Optional[str] = None
     attributes: Dict[str, Any]
 
 
 class GroupList(BaseModel):
     groups: List[str]
+
+
+class GroupEntryList(BaseModel):
+    groups: List[GroupOut]
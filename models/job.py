@@ -0,0 +1,23 @@
+from datetime import datetime
+from typing import Optional
+
+from pydantic import BaseModel
+
+from models.common import ScriptResult
+
+
+class JobAccepted(BaseModel):
+    job_id: int
+    status: str
+    operation: str
+
+
+class JobOut(BaseModel):
+    job_id: int
+    operation: str
+    status: str
+    attempts: int
+    result: Optional[ScriptResult] = None
+    error: Optional[str] = None
+    created_at: datetime
+    finished_at: Optional[datetime] = None
@@ -0,0 +1,88 @@
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from pydantic import BaseModel
+
+
+class SlowOperationOut(BaseModel):
+    id: int
+    request_id: str
+    name: str
+    status: str
+    duration_ms: float
+    spans: List[Dict[str, Any]]
+    created_at: datetime
+
+
+class SlowOperationList(BaseModel):
+    operations: List[SlowOperationOut]
+
+
+class AllocationSite(BaseModel):
+    file: str
+    line: int
+    size_bytes: int
+    count: int
+
+
+class SyncProfile(BaseModel):
+    scope: str
+    total: int
+    updated: int
+    duration_ms: float
+    peak_bytes: int
+    top: List[AllocationSite]
+
+
+class CircuitOut(BaseModel):
+    state: str
+    calls: int
+    failures: int
+    retry_after: float
+
+
+class CircuitStatus(BaseModel):
+    enabled: bool
+    circuits: Dict[str, CircuitOut]
+    timeouts: Dict[str, float]
+
+
+class LaneOut(BaseModel):
+    limit: int
+    in_flight: int
+    queued: int
+
+
+class ConcurrencyStatus(BaseModel):
+    enabled: bool
+    limit: float
+    in_flight: int
+    queued: int
+    queue_depth: int
+    average_seconds: float
+    lanes: Dict[str, LaneOut]
+
+
+class DomainControllerOut(BaseModel):
+    uri: str
+    healthy: bool
+    latency_ms: Optional[float]
+    consecutive_failures: int
+    last_error: str
+    preferred_for_writes: bool
+
+
+class DomainControllerList(BaseModel):
+    controllers: List[DomainControllerOut]
+
+
+class OrphanReportOut(BaseModel):
+    script: str
+    pgid: int
+    pids: List[int]
+    commands: List[str]
+    found_at: datetime
+
+
+class OrphanReportList(BaseModel):
+    reports: List[OrphanReportOut]
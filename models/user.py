@@ -42,8 +42,13 @@ class UserGroupChange(BaseModel):
 
 class UserOut(BaseModel):
     username: str
+    dn: Optional[str] = None
     attributes: Dict[str, Any]
 
 
 class UserList(BaseModel):
     users: List[str]
+
+
+class UserEntryList(BaseModel):
+    users: List[UserOut]
@@ -0,0 +1,6 @@
+"""Stand-in local para o ldap-utils (ldapsearch/ldapadd/ldapmodify).
+
+Emula o comportamento do AD usado pelos scripts de scripts_ad sobre um
+diretorio SQLite gerado por ``python -m fakeldap seed``. Serve para testes de
+escala sem rede; nao e um servidor LDAP.
+"""
@@ -0,0 +1,21 @@
+import sys
+
+from fakeldap import seed, tools
+
+COMMANDS = {
+    "ldapsearch": tools.ldapsearch,
+    "ldapadd": tools.ldapadd,
+    "ldapmodify": tools.ldapmodify,
+    "seed": seed.main,
+}
+
+
+def main() -> int:
+    if len(sys.argv) < 2 or sys.argv[1] not in COMMANDS:
+        print(f"Uso: python -m fakeldap {{{'|'.join(COMMANDS)}}} [args...]", file=sys.stderr)
+        return 2
+    return COMMANDS[sys.argv[1]](sys.argv[2:])
+
+
+if __name__ == "__main__":
+    sys.exit(main())
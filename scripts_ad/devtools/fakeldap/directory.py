@@ -0,0 +1,384 @@
+import json
+import os
+import sqlite3
+import tempfile
+import uuid
+import zlib
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from fakeldap.filters import compile_filter, indexed_term
+from fakeldap.schema import (
+    ALREADY_EXISTS,
+    BACKLINKS,
+    DN_VALUED_ATTRIBUTES,
+    INDEXED_ATTRIBUTES,
+    NO_SUCH_ATTRIBUTE,
+    NO_SUCH_OBJECT,
+    NOT_ALLOWED_ON_NON_LEAF,
+    TYPE_OR_VALUE_EXISTS,
+    UNWILLING_TO_PERFORM,
+    LdapError,
+    build_sid,
+    encode_binary,
+    generalized_time,
+    ldap_error,
+    normalize_dn,
+    parent_dn,
+    rdn_value,
+    split_dn,
+)
+
+DB_ENV = "FAKELDAP_DB"
+DEFAULT_DB = os.path.join(tempfile.gettempdir(), "fakeldap.sqlite3")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    dn_key TEXT PRIMARY KEY,
+    dn TEXT NOT NULL,
+    parent_key TEXT NOT NULL,
+    attrs TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_parent ON entries (parent_key);
+CREATE TABLE IF NOT EXISTS eq_index (
+    attr TEXT NOT NULL,
+    value TEXT NOT NULL,
+    dn_key TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS eq_index_lookup ON eq_index (attr, value);
+CREATE INDEX IF NOT EXISTS eq_index_dn ON eq_index (dn_key);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+Attributes = Dict[str, List[str]]
+Change = Tuple[str, str, List[str]]
+
+
+class Entry:
+    __slots__ = ("dn", "attrs")
+
+    def __init__(self, dn: str, attrs: Attributes):
+        self.dn = dn
+        self.attrs = attrs
+
+    @property
+    def key(self) -> str:
+        return normalize_dn(self.dn)
+
+    def lowered(self) -> Attributes:
+        return {name.lower(): values for name, values in self.attrs.items()}
+
+    def name_of(self, attr: str) -> Optional[str]:
+        wanted = attr.lower()
+        return next((name for name in self.attrs if name.lower() == wanted), None)
+
+    def get(self, attr: str) -> List[str]:
+        name = self.name_of(attr)
+        return self.attrs[name] if name else []
+
+    def put(self, attr: str, values: List[str]) -> None:
+        name = self.name_of(attr) or attr
+        if values:
+            self.attrs[name] = values
+        else:
+            self.attrs.pop(name, None)
+
+
+def _index_value(attr: str, value: str) -> str:
+    if attr in DN_VALUED_ATTRIBUTES:
+        try:
+            return normalize_dn(value)
+        except LdapError:
+            return value.lower()
+    return value.lower()
+
+
+def _like_suffix(key: str) -> str:
+    escaped = key.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%,{escaped}"
+
+
+class Directory:
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or os.environ.get(DB_ENV) or DEFAULT_DB
+        self.conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        self._cache: Dict[str, Optional[Entry]] = {}
+
+    def close(self) -> None:
+        self.conn.close()
+
+    @contextmanager
+    def transaction(self) -> Iterator[None]:
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            self._cache.clear()
+            raise
+        self.conn.execute("COMMIT")
+
+    # ---- leitura -------------------------------------------------------
+
+    @staticmethod
+    def _row_entry(row: Tuple[str, str]) -> Entry:
+        return Entry(row[0], json.loads(row[1]))
+
+    def get(self, dn: str) -> Optional[Entry]:
+        key = normalize_dn(dn)
+        if key not in self._cache:
+            row = self.conn.execute("SELECT dn, attrs FROM entries WHERE dn_key = ?", (key,)).fetchone()
+            self._cache[key] = self._row_entry(row) if row else None
+        return self._cache[key]
+
+    def _lookup_lowered(self, key: str) -> Optional[Attributes]:
+        entry = self.get(key)
+        return entry.lowered() if entry else None
+
+    def base_dn(self) -> str:
+        return self._meta("base_dn", "")
+
+    def has_children(self, dn: str) -> bool:
+        row = self.conn.execute("SELECT 1 FROM entries WHERE parent_key = ? LIMIT 1", (normalize_dn(dn),)).fetchone()
+        return row is not None
+
+    def _candidates(self, base_key: str, scope: str, term: Optional[Tuple[str, str]]) -> Iterator[Tuple[str, str]]:
+        if scope == "base":
+            yield from self.conn.execute("SELECT dn, attrs FROM entries WHERE dn_key = ?", (base_key,))
+            return
+        if term is not None:
+            rows = self.conn.execute(
+                "SELECT e.dn, e.attrs, e.dn_key, e.parent_key FROM eq_index i "
+                "JOIN entries e ON e.dn_key = i.dn_key WHERE i.attr = ? AND i.value = ?",
+                term,
+            )
+            suffix = "," + base_key
+            for dn, attrs, key, parent in rows:
+                if scope == "one" and parent != base_key:
+                    continue
+                if scope == "sub" and key != base_key and not key.endswith(suffix):
+                    continue
+                yield dn, attrs
+            return
+        if scope == "one":
+            yield from self.conn.execute("SELECT dn, attrs FROM entries WHERE parent_key = ?", (base_key,))
+            return
+        yield from self.conn.execute(
+            "SELECT dn, attrs FROM entries WHERE dn_key = ? OR dn_key LIKE ? ESCAPE '\\'",
+            (base_key, _like_suffix(base_key)),
+        )
+
+    def search(self, base: str, scope: str, filter_text: str) -> Iterator[Entry]:
+        base_key = normalize_dn(base)
+        if self.get(base_key) is None:
+            raise ldap_error(NO_SUCH_OBJECT)
+        matcher = compile_filter(filter_text, self._lookup_lowered)
+        term = indexed_term(filter_text)
+        for row in self._candidates(base_key, scope, term):
+            entry = self._row_entry(row)
+            if matcher(entry.lowered()):
+                yield entry
+
+    # ---- escrita -------------------------------------------------------
+
+    def _meta(self, key: str, default: str) -> str:
+        row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def _set_meta(self, key: str, value: str) -> None:
+        self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    def _domain_sid(self) -> tuple:
+        seed = zlib.crc32(self._meta("base_dn", "").encode("utf-8"))
+        return (seed % 1000000000, (seed >> 3) % 1000000000, (seed >> 7) % 1000000000)
+
+    def _next_rid(self) -> int:
+        rid = int(self._meta("next_rid", "1100"))
+        self._set_meta("next_rid", str(rid + 1))
+        return rid
+
+    def _write(self, entry: Entry) -> None:
+        key = entry.key
+        self.conn.execute(
+            "INSERT OR REPLACE INTO entries (dn_key, dn, parent_key, attrs) VALUES (?, ?, ?, ?)",
+            (key, entry.dn, normalize_dn(parent_dn(entry.dn)) if "," in entry.dn else "", json.dumps(entry.attrs)),
+        )
+        self.conn.execute("DELETE FROM eq_index WHERE dn_key = ?", (key,))
+        self.conn.executemany(
+            "INSERT INTO eq_index (attr, value, dn_key) VALUES (?, ?, ?)",
+            [
+                (attr, _index_value(attr, value), key)
+                for name, values in entry.attrs.items()
+                if (attr := name.lower()) in INDEXED_ATTRIBUTES
+                for value in values
+            ],
+        )
+        self._cache[key] = entry
+
+    def _remove(self, key: str) -> None:
+        self.conn.execute("DELETE FROM entries WHERE dn_key = ?", (key,))
+        self.conn.execute("DELETE FROM eq_index WHERE dn_key = ?", (key,))
+        self._cache[key] = None
+
+    def _referencing(self, attr: str, key: str) -> List[Entry]:
+        rows = self.conn.execute(
+            "SELECT e.dn, e.attrs FROM eq_index i JOIN entries e ON e.dn_key = i.dn_key "
+            "WHERE i.attr = ? AND i.value = ?",
+            (attr, key),
+        ).fetchall()
+        return [self._row_entry(row) for row in rows]
+
+    def _update_backlinks(self, entry: Entry, before: Attributes) -> None:
+        for forward, backlink in BACKLINKS.items():
+            old = {normalize_dn(v): v for v in before.get(forward, [])}
+            new = {normalize_dn(v): v for v in entry.get(forward)}
+            for target_key in new.keys() - old.keys():
+                target = self.get(target_key)
+                if target is None:
+                    raise ldap_error(NO_SUCH_OBJECT)
+                target.put(backlink, target.get(backlink) + [entry.dn])
+                self._write(target)
+            for target_key in old.keys() - new.keys():
+                target = self.get(target_key)
+                if target is None:
+                    continue
+                remaining = [v for v in target.get(backlink) if normalize_dn(v) != entry.key]
+                target.put(backlink, remaining)
+                self._write(target)
+
+    def _stamp_new(self, entry: Entry) -> None:
+        now = generalized_time()
+        rdn = split_dn(entry.dn)[0]
+        classes = {value.lower() for value in entry.get("objectClass")}
+        entry.put("distinguishedName", [entry.dn])
+        entry.put("name", [rdn_value(rdn)])
+        entry.put("instanceType", ["4"])
+        entry.put("whenCreated", [now])
+        entry.put("whenChanged", [now])
+        entry.put("objectGUID", [encode_binary(uuid.uuid4().bytes_le)])
+        if classes & {"user", "group", "computer"} and not entry.get("objectSid"):
+            entry.put("objectSid", [build_sid(self._domain_sid(), self._next_rid())])
+
+    def add(self, entry: Entry) -> None:
+        key = entry.key
+        if self.get(key) is not None:
+            raise ldap_error(ALREADY_EXISTS)
+        parent = parent_dn(entry.dn)
+        if parent and self.get(parent) is None:
+            raise ldap_error(NO_SUCH_OBJECT)
+        sam = entry.get("sAMAccountName")
+        if sam and self._referencing_value("samaccountname", sam[0].lower()):
+            raise ldap_error(ALREADY_EXISTS)
+        for name in BACKLINKS.values():
+            entry.put(name, [])
+        self._stamp_new(entry)
+        self._write(entry)
+        self._update_backlinks(entry, {})
+
+    def _referencing_value(self, attr: str, value: str) -> bool:
+        row = self.conn.execute("SELECT 1 FROM eq_index WHERE attr = ? AND value = ? LIMIT 1", (attr, value)).fetchone()
+        return row is not None
+
+    def delete(self, dn: str) -> None:
+        entry = self.get(dn)
+        if entry is None:
+            raise ldap_error(NO_SUCH_OBJECT)
+        if self.has_children(dn):
+            raise ldap_error(NOT_ALLOWED_ON_NON_LEAF)
+        before = {name: list(entry.get(name)) for name in BACKLINKS}
+        for name in BACKLINKS:
+            entry.put(name, [])
+        self._update_backlinks(entry, before)
+        for forward, backlink in BACKLINKS.items():
+            for source in self._referencing(forward.lower(), entry.key):
+                source.put(forward, [v for v in source.get(forward) if normalize_dn(v) != entry.key])
+                self._write(source)
+        self._remove(entry.key)
+
+    def modify(self, dn: str, changes: Iterable[Change]) -> None:
+        entry = self.get(dn)
+        if entry is None:
+            raise ldap_error(NO_SUCH_OBJECT)
+        before = {name: list(entry.get(name)) for name in BACKLINKS}
+        for op, attr, values in changes:
+            if attr.lower() in {b.lower() for b in BACKLINKS.values()}:
+                raise ldap_error(UNWILLING_TO_PERFORM)
+            current = list(entry.get(attr))
+            lowered = [_index_value(attr.lower(), v) for v in current]
+            if op == "add":
+                for value in values:
+                    if _index_value(attr.lower(), value) in lowered:
+                        raise ldap_error(TYPE_OR_VALUE_EXISTS)
+                    current.append(value)
+                    lowered.append(_index_value(attr.lower(), value))
+            elif op == "delete":
+                if not current:
+                    raise ldap_error(NO_SUCH_ATTRIBUTE)
+                if values:
+                    for value in values:
+                        wanted = _index_value(attr.lower(), value)
+                        if wanted not in lowered:
+                            raise ldap_error(NO_SUCH_ATTRIBUTE)
+                        position = lowered.index(wanted)
+                        del current[position]
+                        del lowered[position]
+                else:
+                    current = []
+            elif op == "replace":
+                current = list(values)
+            entry.put(attr, current)
+        entry.put("whenChanged", [generalized_time()])
+        self._write(entry)
+        self._update_backlinks(entry, before)
+
+    def rename(self, dn: str, new_rdn: str, delete_old_rdn: bool, new_superior: Optional[str]) -> None:
+        entry = self.get(dn)
+        if entry is None:
+            raise ldap_error(NO_SUCH_OBJECT)
+        if self.has_children(dn):
+            raise ldap_error(NOT_ALLOWED_ON_NON_LEAF)
+        superior = new_superior if new_superior is not None else parent_dn(entry.dn)
+        if superior and self.get(superior) is None:
+            raise ldap_error(NO_SUCH_OBJECT)
+        new_dn = f"{new_rdn},{superior}" if superior else new_rdn
+        old_key = entry.key
+        if normalize_dn(new_dn) != old_key and self.get(new_dn) is not None:
+            raise ldap_error(ALREADY_EXISTS)
+
+        rdn_attr, _, _ = new_rdn.partition("=")
+        old_attr, _, _ = split_dn(entry.dn)[0].partition("=")
+        if delete_old_rdn:
+            entry.put(old_attr.strip(), [])
+        entry.put(rdn_attr.strip(), [rdn_value(new_rdn)])
+        self._remove(old_key)
+        entry.dn = new_dn
+        entry.put("distinguishedName", [new_dn])
+        entry.put("name", [rdn_value(new_rdn)])
+        entry.put("whenChanged", [generalized_time()])
+        self._write(entry)
+
+        for attr in DN_VALUED_ATTRIBUTES - {"distinguishedname"}:
+            for source in self._referencing(attr, old_key):
+                name = source.name_of(attr)
+                source.attrs[name] = [new_dn if normalize_dn(v) == old_key else v for v in source.attrs[name]]
+                self._write(source)
+
+    def bulk_load(self, entries: Iterable[Entry], base_dn: str, next_rid: int = 1100) -> int:
+        count = 0
+        with self.transaction():
+            self.conn.execute("DELETE FROM entries")
+            self.conn.execute("DELETE FROM eq_index")
+            self.conn.execute("DELETE FROM meta")
+            self._set_meta("base_dn", base_dn)
+            self._set_meta("next_rid", str(next_rid))
+            for entry in entries:
+                self._write(entry)
+                self._cache.clear()
+                count += 1
+        return count
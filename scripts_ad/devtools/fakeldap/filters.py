@@ -0,0 +1,257 @@
+import re
+import string
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from fakeldap.schema import (
+    BINARY_ATTRIBUTES,
+    DN_VALUED_ATTRIBUTES,
+    SELECTIVE_ATTRIBUTES,
+    LdapError,
+    decode_binary,
+    normalize_dn,
+)
+
+MATCHING_RULE_BIT_AND = "1.2.840.113556.1.4.803"
+MATCHING_RULE_BIT_OR = "1.2.840.113556.1.4.804"
+MATCHING_RULE_IN_CHAIN = "1.2.840.113556.1.4.1941"
+
+ATTRIBUTE_RE = re.compile(r"^[A-Za-z0-9][A-Za-z0-9.;-]*$")
+
+Node = Tuple[Any, ...]
+Entry = Dict[str, List[str]]
+Matcher = Callable[[Entry], bool]
+Lookup = Callable[[str], Optional[Entry]]
+
+
+class FilterError(ValueError):
+    pass
+
+
+def _unescape(value: str) -> str:
+    if "\\" not in value:
+        return value
+    out = bytearray()
+    index = 0
+    while index < len(value):
+        ch = value[index]
+        if ch == "\\":
+            pair = value[index + 1 : index + 3]
+            if len(pair) != 2 or any(c not in string.hexdigits for c in pair):
+                raise FilterError(f"Escape invalido em {value!r}")
+            out.append(int(pair, 16))
+            index += 3
+        else:
+            out.extend(ch.encode("utf-8"))
+            index += 1
+    return out.decode("utf-8", "surrogateescape")
+
+
+def _attribute(name: str) -> str:
+    if not ATTRIBUTE_RE.match(name):
+        raise FilterError(f"Atributo invalido no filtro: {name!r}")
+    return name.split(";", 1)[0].lower()
+
+
+def _parse_item(item: str) -> Node:
+    index = item.find("=")
+    if index <= 0:
+        raise FilterError(f"Item de filtro invalido: {item!r}")
+    marker = item[index - 1]
+    raw = item[index + 1 :]
+    if marker == ":":
+        parts = item[: index - 1].split(":")
+        rule = next((part for part in parts[1:] if part and part.lower() != "dn"), None)
+        return ("ext", _attribute(parts[0]), rule, _unescape(raw))
+    if marker in "~<>":
+        kind = {"~": "eq", "<": "le", ">": "ge"}[marker]
+        return (kind, _attribute(item[: index - 1]), _unescape(raw))
+    attr = _attribute(item[:index])
+    if raw == "*":
+        return ("present", attr)
+    if "*" in raw:
+        parts = raw.split("*")
+        return ("sub", attr, _unescape(parts[0]), [_unescape(p) for p in parts[1:-1] if p], _unescape(parts[-1]))
+    return ("eq", attr, _unescape(raw))
+
+
+def _parse(text: str, pos: int) -> Tuple[Node, int]:
+    if pos >= len(text) or text[pos] != "(":
+        raise FilterError("Filtro deve comecar com '('")
+    pos += 1
+    if pos >= len(text):
+        raise FilterError("Filtro incompleto")
+    op = text[pos]
+    if op in "&|":
+        pos += 1
+        children = []
+        while pos < len(text) and text[pos] == "(":
+            child, pos = _parse(text, pos)
+            children.append(child)
+        if pos >= len(text) or text[pos] != ")":
+            raise FilterError("Filtro sem ')'")
+        return ("and" if op == "&" else "or", children), pos + 1
+    if op == "!":
+        child, pos = _parse(text, pos + 1)
+        if pos >= len(text) or text[pos] != ")":
+            raise FilterError("Filtro sem ')'")
+        return ("not", child), pos + 1
+    end = text.find(")", pos)
+    if end < 0:
+        raise FilterError("Filtro sem ')'")
+    return _parse_item(text[pos:end]), end + 1
+
+
+def parse(text: str) -> Node:
+    text = text.strip()
+    if not text.startswith("("):
+        text = f"({text})"
+    node, pos = _parse(text, 0)
+    if pos != len(text):
+        raise FilterError("Conteudo apos o fim do filtro")
+    return node
+
+
+def _normalize(attr: str, value: str) -> str:
+    if attr in DN_VALUED_ATTRIBUTES:
+        try:
+            return normalize_dn(value)
+        except LdapError:
+            return value.lower()
+    return value.lower()
+
+
+def _as_int(value: str) -> Optional[int]:
+    try:
+        return int(value)
+    except ValueError:
+        return None
+
+
+def _compile_eq(attr: str, value: str) -> Matcher:
+    if attr in BINARY_ATTRIBUTES:
+        target = value.encode("utf-8", "surrogateescape")
+        return lambda entry: any(decode_binary(v) == target for v in entry.get(attr, ()))
+    target = _normalize(attr, value)
+    if attr in DN_VALUED_ATTRIBUTES:
+        return lambda entry: any(_normalize(attr, v) == target for v in entry.get(attr, ()))
+    return lambda entry: any(v.lower() == target for v in entry.get(attr, ()))
+
+
+def _compile_ordering(attr: str, value: str, greater: bool) -> Matcher:
+    number = _as_int(value)
+    lowered = value.lower()
+
+    def _match(entry: Entry) -> bool:
+        for item in entry.get(attr, ()):
+            current = _as_int(item)
+            if number is not None and current is not None:
+                if (current >= number) if greater else (current <= number):
+                    return True
+            elif (item.lower() >= lowered) if greater else (item.lower() <= lowered):
+                return True
+        return False
+
+    return _match
+
+
+def _compile_substring(attr: str, initial: str, middle: Sequence[str], final: str) -> Matcher:
+    initial, final = initial.lower(), final.lower()
+    middle = [part.lower() for part in middle]
+
+    def _match_value(value: str) -> bool:
+        value = value.lower()
+        if not value.startswith(initial):
+            return False
+        pos = len(initial)
+        for part in middle:
+            found = value.find(part, pos)
+            if found < 0:
+                return False
+            pos = found + len(part)
+        return len(value) - pos >= len(final) and value.endswith(final)
+
+    return lambda entry: any(_match_value(v) for v in entry.get(attr, ()))
+
+
+def _compile_in_chain(attr: str, value: str, lookup: Optional[Lookup]) -> Matcher:
+    target = _normalize(attr, value)
+
+    def _match(entry: Entry) -> bool:
+        seen = set()
+        pending = [_normalize(attr, v) for v in entry.get(attr, ())]
+        while pending:
+            current = pending.pop()
+            if current == target:
+                return True
+            if current in seen or lookup is None:
+                continue
+            seen.add(current)
+            linked = lookup(current)
+            if linked is not None:
+                pending.extend(_normalize(attr, v) for v in linked.get(attr, ()))
+        return False
+
+    return _match
+
+
+def _compile_extensible(attr: str, rule: Optional[str], value: str, lookup: Optional[Lookup]) -> Matcher:
+    if rule == MATCHING_RULE_IN_CHAIN:
+        return _compile_in_chain(attr, value, lookup)
+    if rule in (MATCHING_RULE_BIT_AND, MATCHING_RULE_BIT_OR):
+        mask = _as_int(value)
+        if mask is None:
+            raise FilterError(f"Valor numerico invalido: {value!r}")
+
+        def _match(entry: Entry) -> bool:
+            for item in entry.get(attr, ()):
+                current = _as_int(item)
+                if current is None:
+                    continue
+                if rule == MATCHING_RULE_BIT_AND and current & mask == mask:
+                    return True
+                if rule == MATCHING_RULE_BIT_OR and current & mask:
+                    return True
+            return False
+
+        return _match
+    if rule is None:
+        return _compile_eq(attr, value)
+    return lambda entry: False
+
+
+def _compile(node: Node, lookup: Optional[Lookup]) -> Matcher:
+    kind = node[0]
+    if kind == "and":
+        children = [_compile(child, lookup) for child in node[1]]
+        return lambda entry: all(child(entry) for child in children)
+    if kind == "or":
+        children = [_compile(child, lookup) for child in node[1]]
+        return lambda entry: any(child(entry) for child in children)
+    if kind == "not":
+        child = _compile(node[1], lookup)
+        return lambda entry: not child(entry)
+    if kind == "present":
+        attr = node[1]
+        return lambda entry: attr in entry
+    if kind == "eq":
+        return _compile_eq(node[1], node[2])
+    if kind in ("ge", "le"):
+        return _compile_ordering(node[1], node[2], kind == "ge")
+    if kind == "sub":
+        return _compile_substring(node[1], node[2], node[3], node[4])
+    if kind == "ext":
+        return _compile_extensible(node[1], node[2], node[3], lookup)
+    raise FilterError(f"Tipo de filtro desconhecido: {kind}")
+
+
+def compile_filter(text: str, lookup: Optional[Lookup] = None) -> Matcher:
+    return _compile(parse(text), lookup)
+
+
+def indexed_term(text: str) -> Optional[Tuple[str, str]]:
+    node = parse(text)
+    candidates = [node] if node[0] != "and" else node[1]
+    for candidate in candidates:
+        if candidate[0] == "eq" and candidate[1] in SELECTIVE_ATTRIBUTES:
+            return candidate[1], _normalize(candidate[1], candidate[2])
+    return None
@@ -0,0 +1,80 @@
+import base64
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from fakeldap.schema import BINARY_ATTRIBUTES, INVALID_SYNTAX, LdapError
+
+Line = Tuple[str, str]
+
+
+def is_safe(value: str) -> bool:
+    if not value:
+        return True
+    if value[0] in " :<" or value[-1] == " ":
+        return False
+    return value.isascii() and "\n" not in value and "\r" not in value and "\0" not in value
+
+
+def format_line(name: str, value: str, binary: bool = False) -> str:
+    if binary:
+        return f"{name}:: {value}"
+    if is_safe(value):
+        return f"{name}: {value}"
+    encoded = base64.b64encode(value.encode("utf-8", "surrogateescape")).decode("ascii")
+    return f"{name}:: {encoded}"
+
+
+def wrap_line(line: str, width: int) -> str:
+    if width <= 1 or len(line) <= width:
+        return line
+    parts = [line[:width]]
+    rest = line[width:]
+    while rest:
+        parts.append(" " + rest[: width - 1])
+        rest = rest[width - 1 :]
+    return "\n".join(parts)
+
+
+def _unfold(lines: Iterable[str]) -> Iterator[str]:
+    current: Optional[str] = None
+    for raw in lines:
+        line = raw.rstrip("\r\n")
+        if line.startswith(" ") and current is not None:
+            current += line[1:]
+            continue
+        if current is not None:
+            yield current
+        current = line
+    if current is not None:
+        yield current
+
+
+def read_records(lines: Iterable[str]) -> Iterator[List[Line]]:
+    record: List[Line] = []
+    for line in _unfold(lines):
+        if not line.strip():
+            if record:
+                yield record
+                record = []
+            continue
+        if line.startswith("#"):
+            continue
+        if line == "-":
+            record.append(("-", ""))
+            continue
+        name, sep, value = line.partition(":")
+        if not sep:
+            raise LdapError(INVALID_SYNTAX, f"Linha LDIF invalida: {line!r}")
+        if name.lower() == "version" and not record:
+            continue
+        if value.startswith(":"):
+            data = base64.b64decode(value[1:].strip())
+            if name.lower() in BINARY_ATTRIBUTES:
+                record.append((name, base64.b64encode(data).decode("ascii")))
+            else:
+                record.append((name, data.decode("utf-8", "surrogateescape")))
+        elif value.startswith("<"):
+            raise LdapError(INVALID_SYNTAX, "Valores por URL nao sao suportados")
+        else:
+            record.append((name, value[1:] if value.startswith(" ") else value))
+    if record:
+        yield record
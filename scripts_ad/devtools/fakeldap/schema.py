@@ -0,0 +1,138 @@
+import base64
+from datetime import datetime, timezone
+from typing import List
+
+BINARY_ATTRIBUTES = {
+    "objectguid",
+    "objectsid",
+    "thumbnailphoto",
+    "jpegphoto",
+    "unicodepwd",
+    "msexchmailboxguid",
+    "ms-ds-consistencyguid",
+    "usercertificate",
+    "logonhours",
+}
+NEVER_RETURNED = {"unicodepwd"}
+DN_VALUED_ATTRIBUTES = {"member", "memberof", "managedby", "manager", "distinguishedname", "directreports"}
+# atributo de ligacao -> backlink mantido automaticamente (como no AD)
+BACKLINKS = {"member": "memberOf", "manager": "directReports"}
+INDEXED_ATTRIBUTES = {
+    "samaccountname",
+    "userprincipalname",
+    "cn",
+    "name",
+    "mail",
+    "objectclass",
+    "member",
+    "memberof",
+    "managedby",
+    "manager",
+    "directreports",
+}
+SELECTIVE_ATTRIBUTES = INDEXED_ATTRIBUTES - {"objectclass"}
+
+
+class LdapError(Exception):
+    def __init__(self, code: int, message: str):
+        super().__init__(message)
+        self.code = code
+        self.message = message
+
+
+# codigos negativos sao erros do cliente; o processo sai com codigo & 0xff (255)
+SERVER_DOWN = -1
+SIZE_LIMIT_EXCEEDED = 4
+NO_SUCH_ATTRIBUTE = 16
+TYPE_OR_VALUE_EXISTS = 20
+INVALID_SYNTAX = 21
+NO_SUCH_OBJECT = 32
+INVALID_DN_SYNTAX = 34
+INVALID_CREDENTIALS = 49
+UNWILLING_TO_PERFORM = 53
+NOT_ALLOWED_ON_NON_LEAF = 66
+ALREADY_EXISTS = 68
+FILTER_ERROR = 255
+
+MESSAGES = {
+    SERVER_DOWN: "Can't contact LDAP server",
+    SIZE_LIMIT_EXCEEDED: "Size limit exceeded",
+    NO_SUCH_ATTRIBUTE: "No such attribute",
+    TYPE_OR_VALUE_EXISTS: "Type or value exists",
+    INVALID_SYNTAX: "Invalid syntax",
+    NO_SUCH_OBJECT: "No such object",
+    INVALID_DN_SYNTAX: "Invalid DN syntax",
+    INVALID_CREDENTIALS: "Invalid credentials",
+    UNWILLING_TO_PERFORM: "Server is unwilling to perform",
+    NOT_ALLOWED_ON_NON_LEAF: "Operation not allowed on non-leaf",
+    ALREADY_EXISTS: "Already exists",
+}
+
+
+def ldap_error(code: int) -> LdapError:
+    return LdapError(code, MESSAGES.get(code, "Other"))
+
+
+def split_dn(dn: str) -> List[str]:
+    parts: List[str] = []
+    current: List[str] = []
+    escaped = False
+    for ch in dn:
+        if escaped:
+            current.append(ch)
+            escaped = False
+        elif ch == "\\":
+            current.append(ch)
+            escaped = True
+        elif ch in ",;":
+            parts.append("".join(current).strip())
+            current = []
+        else:
+            current.append(ch)
+    tail = "".join(current).strip()
+    if tail or parts:
+        parts.append(tail)
+    for part in parts:
+        if "=" not in part:
+            raise ldap_error(INVALID_DN_SYNTAX)
+    return parts
+
+
+def _normalize_rdn(rdn: str) -> str:
+    name, _, value = rdn.partition("=")
+    return f"{name.strip()}={value.strip()}"
+
+
+def join_dn(parts: List[str]) -> str:
+    return ",".join(parts)
+
+
+def normalize_dn(dn: str) -> str:
+    return ",".join(_normalize_rdn(part) for part in split_dn(dn)).lower()
+
+
+def parent_dn(dn: str) -> str:
+    return join_dn(split_dn(dn)[1:])
+
+
+def rdn_value(rdn: str) -> str:
+    return rdn.partition("=")[2].strip().replace("\\,", ",")
+
+
+def generalized_time(moment: datetime | None = None) -> str:
+    return (moment or datetime.now(timezone.utc)).strftime("%Y%m%d%H%M%S.0Z")
+
+
+def encode_binary(data: bytes) -> str:
+    return base64.b64encode(data).decode("ascii")
+
+
+def decode_binary(value: str) -> bytes:
+    return base64.b64decode(value)
+
+
+def build_sid(domain: tuple, rid: int) -> str:
+    subauthorities = (21, *domain, rid)
+    data = bytes([1, len(subauthorities)]) + (5).to_bytes(6, "big")
+    data += b"".join(item.to_bytes(4, "little") for item in subauthorities)
+    return encode_binary(data)
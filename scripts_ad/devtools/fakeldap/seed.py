@@ -0,0 +1,293 @@
+import argparse
+import os
+import random
+import sys
+import time
+import unicodedata
+import uuid
+import zlib
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+from fakeldap.directory import Directory, Entry
+from fakeldap.schema import build_sid, encode_binary, generalized_time, split_dn
+
+GIVEN_NAMES = [
+    "Ana", "Joao", "Jose", "Maria", "Lucas", "Gabriel", "Julia", "Beatriz", "Rafael", "Larissa",
+    "Pedro", "Mariana", "Thiago", "Camila", "Vinicius", "Leticia", "Andre", "Fernanda", "Bruno", "Patricia",
+    "Conceição", "Antônio", "Luís", "Cecília", "Sérgio", "Márcia", "Vitória", "Otávio", "Inês", "Flávio",
+]
+SURNAMES = [
+    "Silva", "Santos", "Oliveira", "Souza", "Rodrigues", "Ferreira", "Alves", "Pereira", "Lima", "Gomes",
+    "Costa", "Ribeiro", "Martins", "Carvalho", "Almeida", "Lopes", "Soares", "Fernandes", "Vieira", "Barbosa",
+    "Araújo", "Conceição", "Gonçalves", "Magalhães", "Simões", "Brandão", "Falcão", "Estêvão", "Patrício", "Romão",
+]
+DEPARTMENTS = ["TI", "Financeiro", "Comercial", "Operações", "Jurídico", "RH", "Logística", "Marketing", "Suprimentos"]
+TITLES = ["Analista", "Assistente", "Coordenador", "Gerente", "Técnico", "Especialista", "Diretor", "Estagiário"]
+OFFICES = ["Matriz", "Filial Campinas", "Filial Recife", "Filial Curitiba", "Remoto"]
+
+UAC_NORMAL = 512
+UAC_DISABLED = 514
+UAC_WORKSTATION = 4096
+GROUP_GLOBAL_SECURITY = "-2147483646"
+GROUP_GLOBAL_DISTRIBUTION = "2"
+NEVER_EXPIRES = "9223372036854775807"
+FILETIME_EPOCH_OFFSET = 116444736000000000
+FIRST_RID = 1100
+ALL_USERS_GROUP = "Todos"
+
+
+def _ascii(text: str) -> str:
+    return unicodedata.normalize("NFKD", text).encode("ascii", "ignore").decode("ascii")
+
+
+def _filetime(rng: random.Random, days_back: int) -> str:
+    moment = time.time() - rng.uniform(0, days_back * 86400)
+    return str(int(moment * 10_000_000) + FILETIME_EPOCH_OFFSET)
+
+
+def _domain_components(base_dn: str) -> List[str]:
+    return [part for part in split_dn(base_dn) if part.lower().startswith("dc=")]
+
+
+def _container(dn: str, created: str) -> Entry:
+    rdn = split_dn(dn)[0]
+    kind, _, value = rdn.partition("=")
+    if kind.lower() == "dc":
+        classes = ["top", "domain", "domainDNS"]
+    else:
+        classes = ["top", "organizationalUnit"]
+    attrs = {
+        "objectClass": classes,
+        kind.strip(): [value.strip()],
+        "distinguishedName": [dn],
+        "name": [value.strip()],
+        "instanceType": ["4"],
+        "whenCreated": [created],
+        "whenChanged": [created],
+    }
+    return Entry(dn, attrs)
+
+
+class Generator:
+    def __init__(self, args: argparse.Namespace):
+        self.args = args
+        self.rng = random.Random(args.seed)
+        self.created = generalized_time()
+        self.domain_dn = ",".join(_domain_components(args.base_dn))
+        seed = zlib.crc32(args.base_dn.encode("utf-8"))
+        self.domain_sid = (seed % 1000000000, (seed >> 3) % 1000000000, (seed >> 7) % 1000000000)
+        self.rid = FIRST_RID
+        self.groups_ou = f"OU=Grupos,{args.base_dn}"
+        self.computers_ou = f"OU=Computadores,{args.base_dn}"
+        self.disabled_ou = f"OU=Desativados,{args.base_dn}"
+        self.entries: Dict[str, Entry] = {}
+        self.order: List[str] = []
+
+    def _guid(self) -> str:
+        return encode_binary(uuid.UUID(int=self.rng.getrandbits(128), version=4).bytes_le)
+
+    def _sid(self) -> str:
+        sid = build_sid(self.domain_sid, self.rid)
+        self.rid += 1
+        return sid
+
+    def _keep(self, entry: Entry) -> Entry:
+        key = entry.dn.lower()
+        self.entries[key] = entry
+        self.order.append(key)
+        return entry
+
+    def _principal(self, dn: str, classes: List[str], sam: str) -> Dict[str, List[str]]:
+        rdn_value = split_dn(dn)[0].partition("=")[2]
+        return {
+            "objectClass": classes,
+            "cn": [rdn_value],
+            "distinguishedName": [dn],
+            "instanceType": ["4"],
+            "whenCreated": [self.created],
+            "whenChanged": [self.created],
+            "name": [rdn_value],
+            "objectGUID": [self._guid()],
+            "objectSid": [self._sid()],
+            "sAMAccountName": [sam],
+        }
+
+    def containers(self) -> None:
+        chain = [self.domain_dn]
+        for dn in (self.args.base_dn, self.args.users_ou):
+            parts = split_dn(dn)
+            chain += [",".join(parts[index:]) for index in range(len(parts) - 1, -1, -1)]
+        chain += [self.groups_ou, self.computers_ou, self.disabled_ou]
+        domain_depth = len(split_dn(self.domain_dn))
+        chain = [dn for dn in chain if len(split_dn(dn)) >= domain_depth]
+        for dn in chain:
+            if dn.lower() not in self.entries:
+                self._keep(_container(dn, self.created))
+
+    def _photo(self) -> str:
+        size = self.rng.randint(2048, 8192)
+        data = b"\xff\xd8\xff\xe0\x00\x10JFIF\x00" + self.rng.randbytes(size) + b"\xff\xd9"
+        return encode_binary(data)
+
+    def users(self) -> List[str]:
+        dns: List[str] = []
+        used_sam: Dict[str, int] = {}
+        used_cn: Dict[str, int] = {}
+        domain = self.args.domain
+        for index in range(self.args.users):
+            given = self.rng.choice(GIVEN_NAMES)
+            surname = self.rng.choice(SURNAMES)
+            middle = self.rng.choice(SURNAMES)
+            display = f"{given} {middle} {surname}"
+            base_sam = _ascii(f"{given}.{surname}").lower()[:16]
+            count = used_sam.get(base_sam, 0)
+            used_sam[base_sam] = count + 1
+            sam = base_sam if count == 0 else f"{base_sam[:16]}{count}"
+            cn_count = used_cn.get(display, 0)
+            used_cn[display] = cn_count + 1
+            cn = display if cn_count == 0 else f"{display} {cn_count}"
+            disabled = self.rng.random() < self.args.disabled_ratio
+            container = self.disabled_ou if disabled and self.rng.random() < 0.5 else self.args.users_ou
+            dn = f"CN={cn},{container}"
+            attrs = self._principal(dn, ["top", "person", "organizationalPerson", "user"], sam)
+            department = self.rng.choice(DEPARTMENTS)
+            mail = f"{sam}@{domain}"
+            aliases = [f"smtp:{sam}.{n}@{domain}" for n in range(self.rng.randint(1, 3))]
+            attrs.update(
+                {
+                    "givenName": [given],
+                    "sn": [surname],
+                    "displayName": [display],
+                    "userPrincipalName": [f"{sam}@{domain}"],
+                    "mail": [mail],
+                    "proxyAddresses": [f"SMTP:{mail}", *aliases],
+                    "department": [department],
+                    "title": [f"{self.rng.choice(TITLES)} de {department}"],
+                    "company": ["Nabarrete"],
+                    "physicalDeliveryOfficeName": [self.rng.choice(OFFICES)],
+                    "telephoneNumber": [f"+55 11 {self.rng.randint(3000, 3999)}-{self.rng.randint(0, 9999):04d}"],
+                    "employeeID": [f"{100000 + index}"],
+                    "description": [f"Colaborador {department} - matricula {100000 + index}"],
+                    "userAccountControl": [str(UAC_DISABLED if disabled else UAC_NORMAL)],
+                    "pwdLastSet": [_filetime(self.rng, 180)],
+                    "lastLogonTimestamp": [_filetime(self.rng, 30)],
+                    "accountExpires": [NEVER_EXPIRES],
+                    "objectCategory": [f"CN=Person,CN=Schema,CN=Configuration,{self.domain_dn}"],
+                }
+            )
+            if self.rng.random() < self.args.photo_ratio:
+                attrs["thumbnailPhoto"] = [self._photo()]
+            if dns and self.rng.random() < 0.8:
+                attrs["manager"] = [self.rng.choice(dns[: max(1, len(dns) // 20)])]
+            self._keep(Entry(dn, attrs))
+            dns.append(dn)
+        return dns
+
+    def computers(self) -> None:
+        for index in range(self.args.computers):
+            name = f"NB-{index:06d}"
+            dn = f"CN={name},{self.computers_ou}"
+            attrs = self._principal(dn, ["top", "person", "organizationalPerson", "user", "computer"], f"{name}$")
+            attrs.update(
+                {
+                    "dNSHostName": [f"{name.lower()}.{self.args.domain}"],
+                    "operatingSystem": [self.rng.choice(["Windows 11 Enterprise", "Windows 10 Enterprise"])],
+                    "userAccountControl": [str(UAC_WORKSTATION)],
+                }
+            )
+            self._keep(Entry(dn, attrs))
+
+    def groups(self, users: List[str]) -> None:
+        group_dns: List[str] = []
+        for index in range(self.args.groups):
+            name = f"GRP-{self.rng.choice(DEPARTMENTS)[:3].upper()}-{index:05d}"
+            dn = f"CN={name},{self.groups_ou}"
+            attrs = self._principal(dn, ["top", "group"], name)
+            security = self.rng.random() < 0.8
+            # distribuicao de cauda longa: muitos grupos pequenos e poucos enormes
+            size = min(len(users), int(self.rng.paretovariate(1.2) * 5))
+            members = self.rng.sample(users, size) if users else []
+            if group_dns and self.rng.random() < 0.3:
+                members += self.rng.sample(group_dns, min(len(group_dns), self.rng.randint(1, 3)))
+            attrs.update(
+                {
+                    "groupType": [GROUP_GLOBAL_SECURITY if security else GROUP_GLOBAL_DISTRIBUTION],
+                    "description": [f"Grupo {name}"],
+                    "mail": [f"{name.lower()}@{self.args.domain}"] if not security else [],
+                    "member": members,
+                }
+            )
+            attrs = {key: values for key, values in attrs.items() if values}
+            self._keep(Entry(dn, attrs))
+            group_dns.append(dn)
+        if users:
+            dn = f"CN={ALL_USERS_GROUP},{self.groups_ou}"
+            attrs = self._principal(dn, ["top", "group"], ALL_USERS_GROUP)
+            attrs.update({"groupType": [GROUP_GLOBAL_SECURITY], "description": ["Todos os usuarios"], "member": users})
+            self._keep(Entry(dn, attrs))
+
+    def backlinks(self) -> None:
+        for key in self.order:
+            entry = self.entries[key]
+            for value in entry.attrs.get("member", []):
+                target = self.entries[value.lower()]
+                target.attrs.setdefault("memberOf", []).append(entry.dn)
+            for value in entry.attrs.get("manager", []):
+                target = self.entries[value.lower()]
+                target.attrs.setdefault("directReports", []).append(entry.dn)
+
+    def generate(self) -> Iterator[Entry]:
+        self.containers()
+        users = self.users()
+        self.computers()
+        self.groups(users)
+        self.backlinks()
+        for key in self.order:
+            yield self.entries[key]
+
+
+def _settings_default(name: str, fallback: str) -> str:
+    value = os.environ.get(name.upper())
+    if value:
+        return value
+    try:
+        sys.path.insert(0, str(Path(__file__).resolve().parents[3]))
+        from core.config import settings
+
+        return getattr(settings, name)
+    except ImportError:
+        return fallback
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="fakeldap seed", description="Gera um diretorio AD sintetico")
+    parser.add_argument("--db", default=None, help="Arquivo SQLite (padrao: FAKELDAP_DB)")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--groups", type=int, default=100)
+    parser.add_argument("--computers", type=int, default=0)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--photo-ratio", type=float, default=0.2)
+    parser.add_argument("--disabled-ratio", type=float, default=0.05)
+    parser.add_argument("--base-dn", default=None)
+    parser.add_argument("--users-ou", default=None)
+    parser.add_argument("--domain", default=None)
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    args.base_dn = args.base_dn or _settings_default("base_dn", "OU=Nabarrete,DC=nabarrete,DC=local")
+    args.users_ou = args.users_ou or _settings_default("users_ou", f"OU=Usuarios,{args.base_dn}")
+    args.domain = args.domain or _settings_default("domain", "nabarrete.local")
+    generator = Generator(args)
+    directory = Directory(args.db)
+    started = time.perf_counter()
+    try:
+        entries = list(generator.generate())
+        count = directory.bulk_load(entries, args.base_dn, next_rid=generator.rid)
+    finally:
+        directory.close()
+    elapsed = time.perf_counter() - started
+    print(f"{count} entradas gravadas em {directory.path} ({elapsed:.1f}s)")
+    return 0
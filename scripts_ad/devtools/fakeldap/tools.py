@@ -0,0 +1,381 @@
+import getpass
+import getopt
+import os
+import sys
+import time
+from typing import Dict, Iterable, List, Optional, TextIO, Tuple
+
+from fakeldap import ldif
+from fakeldap.directory import Directory, Entry
+from fakeldap.filters import FilterError
+from fakeldap.schema import (
+    BINARY_ATTRIBUTES,
+    FILTER_ERROR,
+    INVALID_CREDENTIALS,
+    INVALID_SYNTAX,
+    NEVER_RETURNED,
+    SERVER_DOWN,
+    SIZE_LIMIT_EXCEEDED,
+    LdapError,
+    ldap_error,
+)
+
+MAX_VALUE_RANGE_ENV = "FAKELDAP_MAX_VALUE_RANGE"
+MAX_PAGE_SIZE_ENV = "FAKELDAP_MAX_PAGE_SIZE"
+BIND_PW_ENV = "FAKELDAP_BIND_PW"
+LATENCY_ENV = "FAKELDAP_LATENCY_MS"
+DOWN_ENV = "FAKELDAP_DOWN"
+
+SCOPES = {"base": "base", "one": "one", "sub": "sub", "children": "sub"}
+DEFAULT_WRAP = 76
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+def _latency(uri: str = "") -> None:
+    # "20" vale para qualquer -H; "ldap://dc1=5,ldap://dc2=80" define por URI
+    raw = os.environ.get(LATENCY_ENV, "")
+    if "=" in raw:
+        delays = dict(item.strip().rsplit("=", 1) for item in raw.split(",") if "=" in item)
+        raw = delays.get(uri, "0")
+    try:
+        delay = int(raw or 0)
+    except ValueError:
+        delay = 0
+    if delay > 0:
+        time.sleep(delay / 1000)
+
+
+def _report(operation: str, exc: LdapError) -> int:
+    if exc.code == SERVER_DOWN:
+        operation = "ldap_sasl_bind(SIMPLE)"
+    print(f"{operation}: {exc.message} ({exc.code})", file=sys.stderr)
+    return exc.code
+
+
+class Options:
+    def __init__(self) -> None:
+        self.verbosity = 0
+        self.uri = ""
+        self.wrap = DEFAULT_WRAP
+        self.bind_pw: Optional[str] = None
+        self.base = ""
+        self.scope = "sub"
+        self.page_size = 0
+        self.size_limit = 0
+        self.file: Optional[str] = None
+        self.add_default = False
+        self.continue_on_error = False
+        self.dry_run = False
+        self.verbose = False
+
+
+SEARCH_OPTS = "xLo:H:D:w:Wy:b:s:E:z:f:cnvZ"
+MODIFY_OPTS = "xo:H:D:w:Wy:f:acnvZM"
+
+
+def _parse_options(argv: List[str], spec: str) -> Tuple[Options, List[str]]:
+    opts, rest = getopt.gnu_getopt(argv, spec)
+    options = Options()
+    for flag, value in opts:
+        if flag == "-L":
+            options.verbosity += 1
+        elif flag == "-o":
+            name, _, setting = value.partition("=")
+            if name == "ldif-wrap":
+                options.wrap = 0 if setting == "no" else int(setting)
+        elif flag == "-H":
+            options.uri = value
+        elif flag == "-w":
+            options.bind_pw = value
+        elif flag == "-W":
+            options.bind_pw = getpass.getpass("Enter LDAP Password: ")
+        elif flag == "-y":
+            with open(value, encoding="utf-8") as fp:
+                options.bind_pw = fp.read().rstrip("\n")
+        elif flag == "-b":
+            options.base = value
+        elif flag == "-s":
+            if value not in SCOPES:
+                raise getopt.GetoptError(f"invalid scope {value!r}")
+            options.scope = SCOPES[value]
+        elif flag == "-E":
+            control = value.lstrip("!")
+            if control.startswith("pr="):
+                options.page_size = int(control[3:].split("/", 1)[0])
+        elif flag == "-z":
+            options.size_limit = 0 if value in ("none", "max") else int(value)
+        elif flag == "-f":
+            options.file = value
+        elif flag == "-a":
+            options.add_default = True
+        elif flag == "-c":
+            options.continue_on_error = True
+        elif flag == "-n":
+            options.dry_run = True
+        elif flag == "-v":
+            options.verbose = True
+    return options, rest
+
+
+def _is_down(uri: str) -> bool:
+    down = os.environ.get(DOWN_ENV, "").strip()
+    if down in ("1", "*"):
+        return True
+    return bool(uri) and uri in {item.strip() for item in down.split(",")}
+
+
+def _bind(options: Options) -> None:
+    expected = os.environ.get(BIND_PW_ENV)
+    _latency(options.uri)
+    if _is_down(options.uri):
+        raise ldap_error(SERVER_DOWN)
+    if expected is not None and options.bind_pw != expected:
+        raise ldap_error(INVALID_CREDENTIALS)
+
+
+# ---- ldapsearch -----------------------------------------------------------
+
+
+class Selection:
+    def __init__(self, attributes: List[str]):
+        self.all = not attributes or "*" in attributes
+        self.none = attributes == ["1.1"]
+        self.ranges: Dict[str, Tuple[int, Optional[int]]] = {}
+        self.wanted: List[str] = []
+        for item in attributes:
+            if item in ("*", "1.1", "+"):
+                continue
+            name, _, option = item.partition(";")
+            key = name.lower()
+            if option.lower().startswith("range="):
+                low, _, high = option[6:].partition("-")
+                self.ranges[key] = (int(low), None if high == "*" else int(high))
+            # o servidor devolve cada atributo uma vez, mesmo se pedido repetido
+            if key not in self.wanted:
+                self.wanted.append(key)
+
+    def pick(self, entry: Entry) -> Iterable[Tuple[str, List[str]]]:
+        if self.none:
+            return
+        if self.all:
+            for name, values in entry.attrs.items():
+                if name.lower() not in NEVER_RETURNED and name.lower() not in self.ranges:
+                    yield name, values
+        for key in self.wanted:
+            if self.all and key not in self.ranges:
+                continue
+            if key in NEVER_RETURNED:
+                continue
+            name = entry.name_of(key)
+            if name is not None:
+                yield name, entry.attrs[name]
+
+
+def _ranged(name: str, values: List[str], requested: Optional[Tuple[int, Optional[int]]], limit: int) -> Tuple[str, List[str]]:
+    low, high = requested if requested else (0, None)
+    if high is None or high >= len(values) - 1:
+        high = len(values) - 1
+    if limit > 0 and high - low + 1 > limit:
+        high = low + limit - 1
+    if requested is None and high >= len(values) - 1:
+        return name, values
+    chunk = values[low : high + 1]
+    suffix = "*" if high >= len(values) - 1 else str(high)
+    return f"{name};range={low}-{suffix}", chunk
+
+
+def _format_entry(entry: Entry, selection: Selection, options: Options, value_limit: int) -> str:
+    lines = [ldif.format_line("dn", entry.dn)]
+    for name, values in selection.pick(entry):
+        key = name.lower()
+        label, chunk = _ranged(name, values, selection.ranges.get(key), value_limit)
+        binary = key in BINARY_ATTRIBUTES
+        lines.extend(ldif.format_line(label, value, binary) for value in chunk)
+    return "\n".join(ldif.wrap_line(line, options.wrap) for line in lines) + "\n\n"
+
+
+def _write_header(out: TextIO, options: Options, filter_text: str, attributes: List[str]) -> None:
+    if options.verbosity < 3:
+        out.write("version: 1\n\n")
+    if options.verbosity < 2:
+        out.write(
+            "#\n# LDAPv3\n"
+            f"# base <{options.base}> with scope {options.scope}tree\n"
+            f"# filter: {filter_text}\n"
+            f"# requesting: {' '.join(attributes) or 'ALL'}\n"
+            "#\n\n"
+        )
+
+
+def ldapsearch(argv: List[str], out: TextIO = sys.stdout) -> int:
+    try:
+        options, rest = _parse_options(argv, SEARCH_OPTS)
+    except (getopt.GetoptError, ValueError) as exc:
+        print(f"ldapsearch: {exc}", file=sys.stderr)
+        return 1
+    filter_text = rest[0] if rest else "(objectClass=*)"
+    attributes = rest[1:]
+    selection = Selection(attributes)
+    page_limit = _env_int(MAX_PAGE_SIZE_ENV, 0)
+    value_limit = _env_int(MAX_VALUE_RANGE_ENV, 1500)
+    directory = Directory()
+    try:
+        _bind(options)
+        if not options.base:
+            options.base = directory.base_dn()
+        _write_header(out, options, filter_text, attributes)
+        count = 0
+        in_page = 0
+        for entry in directory.search(options.base, options.scope, filter_text):
+            if options.size_limit and count >= options.size_limit:
+                raise ldap_error(SIZE_LIMIT_EXCEEDED)
+            if options.page_size:
+                if in_page >= options.page_size:
+                    in_page = 0
+                    _latency(options.uri)
+            elif page_limit and count >= page_limit:
+                raise ldap_error(SIZE_LIMIT_EXCEEDED)
+            out.write(_format_entry(entry, selection, options, value_limit))
+            count += 1
+            in_page += 1
+        out.flush()
+    except FilterError as exc:
+        print(f"ldap_search_ext: Bad search filter ({FILTER_ERROR})\n\t{exc}", file=sys.stderr)
+        return FILTER_ERROR
+    except LdapError as exc:
+        out.flush()
+        if exc.code in (INVALID_CREDENTIALS, SERVER_DOWN):
+            return _report("ldap_bind", exc)
+        if exc.code == SIZE_LIMIT_EXCEEDED:
+            print(f"{exc.message} ({exc.code})", file=sys.stderr)
+            return exc.code
+        return _report("ldap_search_ext", exc)
+    except BrokenPipeError:
+        _silence_stdout()
+        return 0
+    finally:
+        directory.close()
+    return 0
+
+
+def _silence_stdout() -> None:
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    os.dup2(devnull, sys.stdout.fileno())
+
+
+# ---- ldapadd / ldapmodify -------------------------------------------------
+
+
+def _record_changes(record: List[Tuple[str, str]]) -> List[Tuple[str, str, List[str]]]:
+    changes: List[Tuple[str, str, List[str]]] = []
+    index = 0
+    while index < len(record):
+        op, attr = record[index]
+        op = op.lower()
+        if op not in ("add", "delete", "replace"):
+            raise LdapError(INVALID_SYNTAX, f"Operacao de modify invalida: {op}")
+        index += 1
+        values: List[str] = []
+        while index < len(record) and record[index][0] != "-":
+            name, value = record[index]
+            if name.lower() != attr.lower():
+                raise LdapError(INVALID_SYNTAX, f"Atributo {name} fora do bloco {attr}")
+            values.append(value)
+            index += 1
+        index += 1
+        changes.append((op, attr, values))
+    return changes
+
+
+def _apply(
+    directory: Directory, record: List[Tuple[str, str]], add_default: bool, out: TextIO, uri: str = ""
+) -> None:
+    name, dn = record[0]
+    if name.lower() != "dn":
+        raise LdapError(INVALID_SYNTAX, "Registro LDIF sem dn")
+    body = record[1:]
+    changetype = "add" if add_default else "modify"
+    if body and body[0][0].lower() == "changetype":
+        changetype = body[0][1].strip().lower()
+        body = body[1:]
+    _latency(uri)
+    if changetype == "add":
+        out.write(f'adding new entry "{dn}"\n')
+        attrs: Dict[str, List[str]] = {}
+        for attr, value in body:
+            existing = next((key for key in attrs if key.lower() == attr.lower()), attr)
+            attrs.setdefault(existing, []).append(value)
+        with directory.transaction():
+            directory.add(Entry(dn, attrs))
+    elif changetype == "modify":
+        out.write(f'modifying entry "{dn}"\n')
+        with directory.transaction():
+            directory.modify(dn, _record_changes(body))
+    elif changetype == "delete":
+        out.write(f'deleting entry "{dn}"\n')
+        with directory.transaction():
+            directory.delete(dn)
+    elif changetype in ("modrdn", "moddn"):
+        fields = {key.lower(): value for key, value in body}
+        out.write(f'modifying rdn of entry "{dn}"\n')
+        with directory.transaction():
+            directory.rename(
+                dn,
+                fields.get("newrdn", ""),
+                fields.get("deleteoldrdn", "1") == "1",
+                fields.get("newsuperior"),
+            )
+    else:
+        raise LdapError(INVALID_SYNTAX, f"changetype desconhecido: {changetype}")
+
+
+OPERATION_NAMES = {"add": "ldap_add", "delete": "ldap_delete", "modrdn": "ldap_rename", "moddn": "ldap_rename"}
+
+
+def _operation_name(record: List[Tuple[str, str]], add_default: bool) -> str:
+    for name, value in record[1:2]:
+        if name.lower() == "changetype":
+            return OPERATION_NAMES.get(value.strip().lower(), "ldap_modify")
+    return "ldap_add" if add_default else "ldap_modify"
+
+
+def ldapmodify(argv: List[str], add_default: bool = False, out: TextIO = sys.stdout) -> int:
+    try:
+        options, _ = _parse_options(argv, MODIFY_OPTS)
+    except (getopt.GetoptError, ValueError) as exc:
+        print(f"ldapmodify: {exc}", file=sys.stderr)
+        return 1
+    add_default = add_default or options.add_default
+    source = open(options.file, encoding="utf-8") if options.file else sys.stdin
+    directory = Directory()
+    status = 0
+    try:
+        _bind(options)
+        for record in ldif.read_records(source):
+            if options.dry_run:
+                out.write(f'!{_operation_name(record, add_default)} "{record[0][1]}"\n')
+                continue
+            try:
+                _apply(directory, record, add_default, out, options.uri)
+            except LdapError as exc:
+                status = _report(_operation_name(record, add_default), exc)
+                if not options.continue_on_error:
+                    return status
+            out.write("\n")
+    except LdapError as exc:
+        return _report("ldap_bind" if exc.code in (INVALID_CREDENTIALS, SERVER_DOWN) else "ldapmodify", exc)
+    finally:
+        directory.close()
+        if source is not sys.stdin:
+            source.close()
+    return status
+
+
+def ldapadd(argv: List[str], out: TextIO = sys.stdout) -> int:
+    return ldapmodify(argv, add_default=True, out=out)
@@ -26,7 +26,7 @@ require_env() {
 }
 
 ldap_add() {
-  ldapadd -H "$LDAP_URI" -D "$BIND_DN" -w "$BIND_PW"
+  ldapadd -H "$LDAP_URI" -D "$BIND_DN" -w "$BIND_PW" "$@"
 }
 
 # PROCESSAMENTO
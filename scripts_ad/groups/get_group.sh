@@ -26,13 +26,14 @@ require_env() {
 }
 
 ldap_search() {
-  ldapsearch -LLL -o ldif-wrap=no -H "$LDAP_URI" -D "$BIND_DN" -w "$BIND_PW"
+  ldapsearch -LLL -o ldif-wrap=no -H "$LDAP_URI" -D "$BIND_DN" -w "$BIND_PW" "$@"
 }
 
 # PROCESSAMENTO
 GROUPNAME="${1:-}"
+ATTRS=("${@:2}")
 if [[ -z "$GROUPNAME" ]]; then
-  error_exit "Uso: $0 <groupname>"
+  error_exit "Uso: $0 <groupname> [atributo...]"
 fi
 
 require_env "LDAP_URI" "$LDAP_URI"
@@ -44,10 +45,10 @@ require_env "DOMAIN" "$DOMAIN"
 
 # ACAO PRINCIPAL
 RESULT="$(
-  ldap_search -b "$BASE_DN" "(sAMAccountName=${GROUPNAME})"
+  ldap_search -b "$BASE_DN" "(sAMAccountName=${GROUPNAME})" "${ATTRS[@]}"
 )"
 
-if ! printf '%s\n' "$RESULT" | grep -q '^dn: '; then
+if ! printf '%s\n' "$RESULT" | grep -Eq '^dn::? '; then
   error_exit "Grupo nao encontrado"
 fi
 
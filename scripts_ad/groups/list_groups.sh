@@ -24,10 +24,11 @@ require_env() {
 }
 
 ldap_search() {
-  ldapsearch -x -LLL -o ldif-wrap=no -H "$LDAP_URI" -D "$BIND_DN" -w "$BIND_PW"
+  ldapsearch -x -LLL -o ldif-wrap=no -E pr=1000/noprompt -H "$LDAP_URI" -D "$BIND_DN" -w "$BIND_PW" "$@"
 }
 
 # PROCESSAMENTO
+ATTRS=("$@")
 require_env "LDAP_URI" "$LDAP_URI"
 require_env "BIND_DN" "$BIND_DN"
 require_env "BIND_PW" "$BIND_PW"
@@ -35,7 +36,7 @@ require_env "BASE_DN" "$BASE_DN"
 
 # ACAO PRINCIPAL
 LDAP_ERR_FILE="$(mktemp)"
-if ! RESULT="$(ldap_search -b "$BASE_DN" "(&(objectClass=group)(groupType:1.2.840.113556.1.4.803:=2147483648))" sAMAccountName 2>"$LDAP_ERR_FILE")"; then
+if ! RESULT="$(ldap_search -b "$BASE_DN" "(&(objectClass=group)(groupType:1.2.840.113556.1.4.803:=2147483648))" sAMAccountName "${ATTRS[@]}" 2>"$LDAP_ERR_FILE")"; then
   if [[ -s "$LDAP_ERR_FILE" ]]; then
     cat "$LDAP_ERR_FILE" >&2
   fi
@@ -48,12 +49,16 @@ if [[ -s "$LDAP_ERR_FILE" ]]; then
   error_exit "Falha ao listar grupos"
 fi
 rm -f "$LDAP_ERR_FILE"
-GROUPS="$(printf '%s\n' "$RESULT" | awk -F': ' '/^sAMAccountName: / {print $2}')"
+if [[ ${#ATTRS[@]} -gt 0 ]]; then
+  GROUP_NAMES="$RESULT"
+else
+  GROUP_NAMES="$(printf '%s\n' "$RESULT" | awk -F': ' '/^sAMAccountName: / {print $2}')"
+fi
 
 # SAIDA PADRONIZADA
 echo "STATUS=OK"
 echo "ACTION=${ACTION}"
 echo "IDENTIFIER=list"
 echo "DATA_BEGIN"
-printf '%s\n' "$GROUPS"
+printf '%s\n' "$GROUP_NAMES"
 echo "DATA_END"
@@ -31,11 +31,11 @@ encode_password() {
 }
 
 ldap_add() {
-  ldapadd -H "$LDAP_URI" -D "$BIND_DN" -w "$BIND_PW"
+  ldapadd -H "$LDAP_URI" -D "$BIND_DN" -w "$BIND_PW" "$@"
 }
 
 ldap_modify() {
-  ldapmodify -H "$LDAP_URI" -D "$BIND_DN" -w "$BIND_PW"
+  ldapmodify -H "$LDAP_URI" -D "$BIND_DN" -w "$BIND_PW" "$@"
 }
 
 # PROCESSAMENTO
@@ -26,13 +26,14 @@ require_env() {
 }
 
 ldap_search() {
-  ldapsearch -LLL -o ldif-wrap=no -H "$LDAP_URI" -D "$BIND_DN" -w "$BIND_PW"
+  ldapsearch -LLL -o ldif-wrap=no -H "$LDAP_URI" -D "$BIND_DN" -w "$BIND_PW" "$@"
 }
 
 # PROCESSAMENTO
 USERNAME="${1:-}"
+ATTRS=("${@:2}")
 if [[ -z "$USERNAME" ]]; then
-  error_exit "Uso: $0 <username>"
+  error_exit "Uso: $0 <username> [atributo...]"
 fi
 
 require_env "LDAP_URI" "$LDAP_URI"
@@ -44,10 +45,10 @@ require_env "DOMAIN" "$DOMAIN"
 
 # ACAO PRINCIPAL
 RESULT="$(
-  ldap_search -b "$USERS_OU" "(sAMAccountName=${USERNAME})"
+  ldap_search -b "$USERS_OU" "(sAMAccountName=${USERNAME})" "${ATTRS[@]}"
 )"
 
-if ! printf '%s\n' "$RESULT" | grep -q '^dn: '; then
+if ! printf '%s\n' "$RESULT" | grep -Eq '^dn::? '; then
   error_exit "Usuario nao encontrado"
 fi
 
@@ -24,10 +24,11 @@ require_env() {
 }
 
 ldap_search() {
-  ldapsearch -x -LLL -o ldif-wrap=no -H "$LDAP_URI" -D "$BIND_DN" -w "$BIND_PW"
+  ldapsearch -x -LLL -o ldif-wrap=no -E pr=1000/noprompt -H "$LDAP_URI" -D "$BIND_DN" -w "$BIND_PW" "$@"
 }
 
 # PROCESSAMENTO
+ATTRS=("$@")
 require_env "LDAP_URI" "$LDAP_URI"
 require_env "BIND_DN" "$BIND_DN"
 require_env "BIND_PW" "$BIND_PW"
@@ -35,7 +36,7 @@ require_env "USERS_OU" "$USERS_OU"
 
 # ACAO PRINCIPAL
 LDAP_ERR_FILE="$(mktemp)"
-if ! RESULT="$(ldap_search -b "$USERS_OU" "(&(objectClass=user)(!(objectClass=computer))(!(userAccountControl:1.2.840.113556.1.4.803:=2)))" sAMAccountName 2>"$LDAP_ERR_FILE")"; then
+if ! RESULT="$(ldap_search -b "$USERS_OU" "(&(objectClass=user)(!(objectClass=computer))(!(userAccountControl:1.2.840.113556.1.4.803:=2)))" sAMAccountName "${ATTRS[@]}" 2>"$LDAP_ERR_FILE")"; then
   if [[ -s "$LDAP_ERR_FILE" ]]; then
     cat "$LDAP_ERR_FILE" >&2
   fi
@@ -48,7 +49,11 @@ if [[ -s "$LDAP_ERR_FILE" ]]; then
   error_exit "Falha ao listar usuarios"
 fi
 rm -f "$LDAP_ERR_FILE"
-USERS="$(printf '%s\n' "$RESULT" | awk -F': ' '/^sAMAccountName: / {print $2}')"
+if [[ ${#ATTRS[@]} -gt 0 ]]; then
+  USERS="$RESULT"
+else
+  USERS="$(printf '%s\n' "$RESULT" | awk -F': ' '/^sAMAccountName: / {print $2}')"
+fi
 
 # SAIDA PADRONIZADA
 echo "STATUS=OK"
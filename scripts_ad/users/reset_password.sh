@@ -31,16 +31,16 @@ encode_password() {
 }
 
 ldap_search() {
-  ldapsearch -LLL -o ldif-wrap=no -H "$LDAP_URI" -D "$BIND_DN" -w "$BIND_PW"
+  ldapsearch -LLL -o ldif-wrap=no -H "$LDAP_URI" -D "$BIND_DN" -w "$BIND_PW" "$@"
 }
 
 ldap_modify() {
-  ldapmodify -H "$LDAP_URI" -D "$BIND_DN" -w "$BIND_PW"
+  ldapmodify -H "$LDAP_URI" -D "$BIND_DN" -w "$BIND_PW" "$@"
 }
 
 get_user_dn() {
   ldap_search -b "$USERS_OU" "(sAMAccountName=${1})" dn \
-    | awk '/^dn: / {sub(/^dn: /, "", $0); print; exit}'
+    | awk '/^dn:: / {print substr($0, 6) | "base64 -d"; exit} /^dn: / {sub(/^dn: /, "", $0); print; exit}'
 }
 
 # PROCESSAMENTO
@@ -1,14 +1,32 @@
 import hashlib
 import hmac
+import logging
+import threading
+import time
 from datetime import datetime, timezone
 from secrets import token_urlsafe
-from typing import Tuple
+from threading import Lock
+from typing import Dict, Optional, Tuple
 
+from sqlalchemy import bindparam, update
+from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.orm import Session
 
+from core import metrics
 from core.config import settings
 from core.security import Role, create_access_token
 from db.models import AppClient
+from db.session import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+# app_name -> (hash do secret, quando foi lido do banco)
+_credentials: Dict[str, Tuple[str, float]] = {}
+# app_name -> ultimo login ainda nao gravado em app_clients.last_used
+_pending_last_used: Dict[str, datetime] = {}
+_lock = Lock()
+_stop = threading.Event()
+_flusher: Optional[threading.Thread] = None
 
 
 def _hash_secret(secret: str) -> str:
@@ -27,20 +45,116 @@ def create_app_credentials(db: Session, app_name: str) -> Tuple[str, str]:
     else:
         db.add(AppClient(app_name=app_name, secret_hash=secret_hash, created_at=now, last_used=now))
     db.commit()
+    with _lock:
+        _credentials[app_name] = (secret_hash, time.monotonic())
+        _pending_last_used.pop(app_name, None)
     return app_name, secret
 
 
+def _cached_hash(app_name: str) -> Optional[str]:
+    ttl = settings.app_credential_cache_seconds
+    with _lock:
+        entry = _credentials.get(app_name)
+    if entry is None or time.monotonic() - entry[1] >= ttl:
+        return None
+    return entry[0]
+
+
+def _load_hash(db: Session, app_name: str) -> Optional[str]:
+    secret_hash = db.query(AppClient.secret_hash).filter(AppClient.app_name == app_name).scalar()
+    with _lock:
+        if secret_hash is None:
+            _credentials.pop(app_name, None)
+        elif settings.app_credential_cache_seconds > 0:
+            _credentials[app_name] = (secret_hash, time.monotonic())
+    return secret_hash
+
+
 def verify_app_secret(db: Session, app_name: str, secret: str) -> bool:
-    client = db.query(AppClient).filter(AppClient.app_name == app_name).one_or_none()
-    if not client:
-        return False
+    """Confere o secret com o hash em cache; so vai ao banco na primeira vez, depois de
+    APP_CREDENTIAL_CACHE_SECONDS ou quando o secret nao bate (pode ter sido rotacionado
+    por outro worker)."""
     expected = _hash_secret(secret)
-    if not hmac.compare_digest(expected, client.secret_hash):
-        return False
-    client.last_used = datetime.now(timezone.utc)
-    db.commit()
+    secret_hash = _cached_hash(app_name)
+    if secret_hash is not None and hmac.compare_digest(expected, secret_hash):
+        metrics.APP_CREDENTIAL_CACHE.labels("hit").inc()
+    else:
+        metrics.APP_CREDENTIAL_CACHE.labels("miss").inc()
+        secret_hash = _load_hash(db, app_name)
+        if secret_hash is None or not hmac.compare_digest(expected, secret_hash):
+            return False
+    _touch(db, app_name)
     return True
 
 
+def _touch(db: Session, app_name: str) -> None:
+    now = datetime.now(timezone.utc)
+    if settings.app_last_used_flush_seconds <= 0:
+        db.query(AppClient).filter(AppClient.app_name == app_name).update({AppClient.last_used: now})
+        db.commit()
+        return
+    with _lock:
+        _pending_last_used[app_name] = now
+
+
+def flush_last_used() -> int:
+    """Grava os last_used acumulados em um unico UPDATE em lote."""
+    with _lock:
+        if not _pending_last_used:
+            return 0
+        pending = dict(_pending_last_used)
+        _pending_last_used.clear()
+    statement = (
+        update(AppClient)
+        .where(AppClient.app_name == bindparam("name"))
+        .values(last_used=bindparam("used"))
+        .execution_options(synchronize_session=False)
+    )
+    db = SessionLocal()
+    try:
+        db.connection().execute(statement, [{"name": name, "used": used} for name, used in pending.items()])
+        db.commit()
+    except SQLAlchemyError:
+        # devolve ao buffer sem sobrescrever logins mais novos
+        with _lock:
+            for name, used in pending.items():
+                _pending_last_used.setdefault(name, used)
+        raise
+    finally:
+        db.close()
+    return len(pending)
+
+
+def _run_flusher() -> None:
+    while not _stop.wait(settings.app_last_used_flush_seconds):
+        try:
+            flush_last_used()
+        except SQLAlchemyError:
+            # os valores voltaram ao buffer; tenta de novo no proximo ciclo
+            pass
+
+
+def start_flusher() -> None:
+    global _flusher
+    if _flusher is not None or settings.app_last_used_flush_seconds <= 0:
+        return
+    _stop.clear()
+    _flusher = threading.Thread(target=_run_flusher, name="app-last-used", daemon=True)
+    _flusher.start()
+
+
+def stop_flusher() -> None:
+    global _flusher
+    _stop.set()
+    if _flusher is not None:
+        _flusher.join(timeout=5)
+        _flusher = None
+    try:
+        flush_last_used()
+    except Exception:
+        # no desligamento nao ha proximo ciclo: os logins pendentes se perdem
+        logger.exception("falha ao gravar last_used pendente no desligamento")
+
+
 def issue_app_token(app_name: str) -> str:
     return create_access_token(subject=f"app:{app_name}", role=Role.admin, extra={"app": app_name})
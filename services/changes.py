@@ -0,0 +1,136 @@
+import json
+import time
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+from sqlalchemy import func, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from core import metrics
+from core.config import settings
+from db.models import ChangeEvent, ChangeFeedState
+from db.session import SessionLocal
+
+CREATED = "created"
+UPDATED = "updated"
+REMOVED = "removed"
+# origem do evento: rota/worker da API ou diferenca encontrada na sincronizacao
+API = "api"
+SYNC = "sync"
+FEED_STATE_ID = 1
+
+
+def _next_seq(db: Session) -> int:
+    """Proximo seq do feed; a linha do contador fica travada ate o fim da transacao.
+
+    Um id do banco nao serve de cursor: no PostgreSQL uma transacao mais lenta grava um id
+    menor depois de outro ja visivel, e o cliente que ja passou dele nunca o veria.
+    """
+    statement = (
+        update(ChangeFeedState)
+        .where(ChangeFeedState.id == FEED_STATE_ID)
+        .values(last_seq=ChangeFeedState.last_seq + 1)
+        .returning(ChangeFeedState.last_seq)
+        .execution_options(synchronize_session=False)
+    )
+    seq = db.execute(statement).scalar()
+    if seq is None:
+        last = db.query(func.max(ChangeEvent.seq)).scalar() or 0
+        try:
+            with db.begin_nested():
+                db.add(ChangeFeedState(id=FEED_STATE_ID, last_seq=last, purged_seq=0))
+        except IntegrityError:
+            pass
+        seq = db.execute(statement).scalar()
+    return seq
+
+
+def record(
+    db: Session,
+    scope: str,
+    object_id: str,
+    change: str,
+    attributes: Iterable[str] = (),
+    *,
+    source: str = API,
+    actor: Optional[str] = None,
+    action: Optional[str] = None,
+) -> None:
+    """Acrescenta o evento na transacao de ``db``: sai junto com o commit da mudanca."""
+    names = sorted(set(attributes))
+    db.add(
+        ChangeEvent(
+            seq=_next_seq(db),
+            scope=scope,
+            object_id=object_id,
+            change=change,
+            attributes_json=json.dumps(names, ensure_ascii=True) if names else None,
+            source=source,
+            actor=actor,
+            action=action,
+            recorded_at=time.time(),
+        )
+    )
+    metrics.CHANGE_EVENTS.labels(scope, change, source).inc()
+
+
+def changed_attributes(previous: Dict[str, Any], current: Dict[str, Any]) -> List[str]:
+    return sorted(name for name in previous.keys() | current.keys() if previous.get(name) != current.get(name))
+
+
+def created_by_api(db: Session, scope: str, since_seconds: Optional[float]) -> Set[str]:
+    """Objetos criados pela API nos ultimos ``since_seconds`` (None: desde sempre).
+
+    A sincronizacao seguinte encontra esses objetos sem snapshot; o evento ``created``
+    deles ja saiu e nao deve sair de novo.
+    """
+    query = db.query(ChangeEvent.object_id).filter(
+        ChangeEvent.scope == scope, ChangeEvent.change == CREATED, ChangeEvent.source == API
+    )
+    if since_seconds is not None:
+        query = query.filter(ChangeEvent.recorded_at >= time.time() - since_seconds)
+    return {object_id for (object_id,) in query}
+
+
+def purge(db: Session) -> None:
+    """Apaga os eventos fora da retencao e guarda o maior seq apagado."""
+    if settings.changes_retention_days <= 0:
+        return
+    cutoff = time.time() - settings.changes_retention_days * 86400
+    old = db.query(ChangeEvent).filter(ChangeEvent.recorded_at < cutoff)
+    newest = old.with_entities(func.max(ChangeEvent.seq)).scalar()
+    if newest is None:
+        return
+    old.delete(synchronize_session=False)
+    db.query(ChangeFeedState).filter(
+        ChangeFeedState.id == FEED_STATE_ID, ChangeFeedState.purged_seq < newest
+    ).update({ChangeFeedState.purged_seq: newest}, synchronize_session=False)
+
+
+def expired(since: int) -> bool:
+    """True se eventos depois de ``since`` ja foram apagados pela retencao.
+
+    Compara com o maior seq apagado, nao com o mais antigo que sobrou: com a tabela vazia
+    ou com buracos no seq o evento mais antigo nao diz o que se perdeu.
+    """
+    if since <= 0:
+        return False
+    db = SessionLocal()
+    try:
+        purged = db.query(ChangeFeedState.purged_seq).filter(ChangeFeedState.id == FEED_STATE_ID).scalar()
+    finally:
+        db.close()
+    return purged is not None and since < purged
+
+
+def read(since: int, limit: int, scope: Optional[str] = None) -> List[ChangeEvent]:
+    """Eventos com seq maior que ``since``, em ordem; sessao propria para nao prender
+    conexao do pool durante a espera do long-poll."""
+    db = SessionLocal()
+    try:
+        query = db.query(ChangeEvent).filter(ChangeEvent.seq > since)
+        if scope is not None:
+            query = query.filter(ChangeEvent.scope == scope)
+        return query.order_by(ChangeEvent.seq).limit(limit).all()
+    finally:
+        db.close()
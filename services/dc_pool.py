@@ -0,0 +1,191 @@
+import math
+import os
+import re
+import subprocess
+import threading
+import time
+from dataclasses import dataclass
+from threading import Lock
+from typing import Dict, List, Optional
+
+from core import circuit_breaker, metrics
+from core.config import settings
+
+# peso da amostra nova na media movel da latencia das sondagens
+LATENCY_ALPHA = 0.3
+
+
+def configured_uris() -> List[str]:
+    return [item for item in re.split(r"[\s,]+", settings.ldap_uri) if item]
+
+
+@dataclass
+class DomainController:
+    uri: str
+    healthy: bool = True
+    latency: Optional[float] = None
+    consecutive_failures: int = 0
+    last_error: str = ""
+    last_probe_at: Optional[float] = None
+
+
+class DCPool:
+    """Ordena os DCs por saude e latencia e escolhe para onde cada script vai.
+
+    Leituras vao para o DC saudavel mais rapido e, em falha de conexao, seguem para o
+    proximo. Escritas vao para o DC preferido (ou o melhor saudavel, se ele estiver
+    fora) e nao sao repetidas em outro DC: o script pode ter aplicado parte da alteracao.
+    """
+
+    def __init__(self, uris: List[str], write_uri: str = "") -> None:
+        if not uris:
+            raise ValueError("Nenhum DC configurado em LDAP_URI")
+        self.order = list(dict.fromkeys(uris))
+        self.write_uri = write_uri if write_uri in self.order else self.order[0]
+        self.controllers: Dict[str, DomainController] = {uri: DomainController(uri) for uri in self.order}
+        self._lock = Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        for uri in self.order:
+            metrics.DC_UP.labels(uri).set(1)
+
+    def _ranked(self) -> List[str]:
+        def key(uri: str):
+            controller = self.controllers[uri]
+            latency = controller.latency if controller.latency is not None else math.inf
+            return (not controller.healthy, latency, self.order.index(uri))
+
+        return sorted(self.order, key=key)
+
+    def route(self, script_relative: str) -> List[str]:
+        """DCs a tentar, em ordem; escritas recebem um unico DC."""
+        if len(self.order) == 1:
+            return list(self.order)
+        with self._lock:
+            ranked = self._ranked()
+            if circuit_breaker.script_category(script_relative) == circuit_breaker.WRITE:
+                if self.controllers[self.write_uri].healthy:
+                    return [self.write_uri]
+                return ranked[:1]
+            return ranked
+
+    def report(self, uri: str, *, failed: bool, error: str = "") -> None:
+        # resultado das chamadas reais: falha de conexao tira o DC da frente ate a proxima sondagem
+        metrics.DC_CALLS.labels(uri, "failure" if failed else "ok").inc()
+        with self._lock:
+            controller = self.controllers.get(uri)
+            if controller is None:
+                return
+            self._mark(controller, failed=failed, error=error)
+
+    def _mark(self, controller: DomainController, *, failed: bool, error: str = "") -> None:
+        if failed:
+            controller.consecutive_failures += 1
+            controller.last_error = error[-500:]
+            controller.healthy = False
+        else:
+            controller.consecutive_failures = 0
+            controller.healthy = True
+        metrics.DC_UP.labels(controller.uri).set(1 if controller.healthy else 0)
+
+    def probe(self, uri: str) -> None:
+        command = [
+            "ldapsearch", "-x", "-LLL",
+            "-o", f"nettimeout={settings.ldap_probe_timeout_seconds}",
+            "-H", uri,
+            "-D", settings.bind_dn,
+            "-w", settings.bind_pw,
+            "-s", "base",
+            "-b", settings.base_dn,
+            "(objectClass=*)", "1.1",
+        ]
+        start = time.perf_counter()
+        try:
+            result = subprocess.run(
+                command,
+                capture_output=True,
+                text=True,
+                timeout=settings.ldap_probe_timeout_seconds,
+                env=os.environ.copy(),
+            )
+            failed = result.returncode != 0
+            error = (result.stderr or "").strip()
+        except subprocess.TimeoutExpired:
+            failed, error = True, "Timeout na sondagem"
+        except OSError as exc:
+            failed, error = True, str(exc)
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            controller = self.controllers[uri]
+            controller.last_probe_at = time.time()
+            if not failed:
+                if controller.latency is None:
+                    controller.latency = elapsed
+                else:
+                    controller.latency = LATENCY_ALPHA * elapsed + (1 - LATENCY_ALPHA) * controller.latency
+                metrics.DC_PROBE_LATENCY.labels(uri).set(controller.latency)
+            self._mark(controller, failed=failed, error=error)
+
+    def probe_all(self) -> None:
+        for uri in self.order:
+            self.probe(uri)
+
+    def _run(self) -> None:
+        self.probe_all()
+        while not self._stop.wait(settings.ldap_probe_interval_seconds):
+            self.probe_all()
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="dc-prober", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=settings.ldap_probe_timeout_seconds + 1)
+            self._thread = None
+
+    def snapshot(self) -> List[Dict[str, object]]:
+        with self._lock:
+            ranked = self._ranked()
+            return [
+                {
+                    "uri": uri,
+                    "healthy": self.controllers[uri].healthy,
+                    "latency_ms": (
+                        round(self.controllers[uri].latency * 1000, 3)
+                        if self.controllers[uri].latency is not None
+                        else None
+                    ),
+                    "consecutive_failures": self.controllers[uri].consecutive_failures,
+                    "last_error": self.controllers[uri].last_error,
+                    "preferred_for_writes": uri == self.write_uri,
+                }
+                for uri in ranked
+            ]
+
+
+_pool: Optional[DCPool] = None
+_pool_lock = Lock()
+
+
+def get_pool() -> DCPool:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = DCPool(configured_uris(), settings.ldap_write_uri)
+        return _pool
+
+
+def start_prober() -> None:
+    pool = get_pool()
+    if len(pool.order) > 1 and settings.ldap_probe_interval_seconds > 0:
+        pool.start()
+
+
+def stop_prober() -> None:
+    if _pool is not None:
+        _pool.stop()
@@ -0,0 +1,161 @@
+import re
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from threading import Lock
+from typing import Dict, FrozenSet, Iterator, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from core import metrics
+from core.config import settings
+from services import snapshots
+from services.script_runner import ScriptExecutionError, is_dc_failure
+
+USER = "user"
+GROUP = "group"
+SCOPES = {USER: "users", GROUP: "groups"}
+MESSAGES = {USER: "Usuario nao encontrado", GROUP: "Grupo nao encontrado"}
+# caracteres que o AD nao aceita em sAMAccountName: o nome nao pode existir
+INVALID_NAME = re.compile(r'["/\\\[\]:;|=,+*?<>]')
+
+
+class NotFoundError(ScriptExecutionError):
+    def __init__(self, kind: str, name: str, *, stdout: str = "", stderr: str = "", returncode: int = 1):
+        super().__init__(MESSAGES[kind], stdout=stdout, stderr=stderr, returncode=returncode)
+        self.kind = kind
+        self.name = name
+
+
+class NegativeCache:
+    """Nomes que o AD respondeu como inexistentes, por ``ttl`` segundos (LRU limitado)."""
+
+    def __init__(self, ttl: float, max_entries: int) -> None:
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = Lock()
+        self._entries: "OrderedDict[Tuple[str, str], float]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def contains(self, kind: str, name: str) -> bool:
+        key = (kind, name.lower())
+        with self._lock:
+            expires = self._entries.get(key)
+            if expires is None:
+                return False
+            if expires <= time.monotonic():
+                del self._entries[key]
+                return False
+            return True
+
+    def add(self, kind: str, name: str) -> None:
+        if self.ttl <= 0 or self.max_entries <= 0:
+            return
+        key = (kind, name.lower())
+        with self._lock:
+            self._entries[key] = time.monotonic() + self.ttl
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def discard(self, kind: str, name: str) -> None:
+        with self._lock:
+            self._entries.pop((kind, name.lower()), None)
+
+    def clear(self, kind: Optional[str] = None) -> None:
+        with self._lock:
+            if kind is None:
+                self._entries.clear()
+                return
+            for key in [key for key in self._entries if key[0] == kind]:
+                del self._entries[key]
+
+
+negative_cache = NegativeCache(settings.negative_cache_seconds, settings.negative_cache_max_entries)
+
+# escopo -> (geracao sincronizada, nomes em minusculas)
+_index: Dict[str, Tuple[int, FrozenSet[str]]] = {}
+_index_lock = Lock()
+
+
+def _index_says_missing(db: Session, kind: str, name: str) -> bool:
+    """True so com o indice sincronizado valido (ver snapshots.is_fresh) e sem o nome."""
+    scope = SCOPES[kind]
+    generation = snapshots.fresh_generation(db, scope)
+    if generation is None:
+        return False
+    with _index_lock:
+        cached = _index.get(scope)
+        if cached is None or cached[0] != generation:
+            _, column = snapshots.SCOPE_MODELS[scope]
+            cached = _index[scope] = (generation, frozenset(value.lower() for (value,) in db.query(column)))
+    return name.lower() not in cached[1]
+
+
+def _reject(kind: str, name: str, source: str) -> NotFoundError:
+    metrics.AD_NOT_FOUND.labels(kind, source).inc()
+    return NotFoundError(kind, name)
+
+
+def check(db: Session, kind: str, name: str) -> None:
+    """Recusa antes de ir ao DC o que ja se sabe inexistente.
+
+    ``AD_NAME_PREVALIDATION``: ``off`` usa so o cache negativo; ``strict`` tambem recusa
+    nomes com caracteres que o AD nao aceita; ``index`` ainda recusa nomes ausentes do
+    indice sincronizado, quando ele esta em dia.
+    """
+    if negative_cache.contains(kind, name):
+        raise _reject(kind, name, "cache")
+    mode = settings.ad_name_prevalidation
+    if mode == "off":
+        return
+    if not name.strip() or name.endswith(".") or INVALID_NAME.search(name):
+        raise _reject(kind, name, "syntax")
+    if mode == "index" and _index_says_missing(db, kind, name):
+        raise _reject(kind, name, "index")
+
+
+def missing_kind(exc: ScriptExecutionError) -> Optional[str]:
+    """Tipo (``user``/``group``) que o script disse nao encontrar, se foi isso."""
+    if is_dc_failure(exc.returncode, exc.stderr):
+        # sem DC a busca volta vazia e o script diz "nao encontrado": nao e resposta do AD
+        return None
+    lines = exc.stderr.splitlines()
+    for kind, message in MESSAGES.items():
+        if f"MESSAGE={message}" in lines:
+            return kind
+    return None
+
+
+@contextmanager
+def guard(db: Session, **names: str) -> Iterator[None]:
+    """Confere os nomes antes do script e lembra os que o script nao encontrou.
+
+    ``names`` mapeia o tipo (``user``/``group``) para o nome usado na operacao.
+    """
+    for kind, name in names.items():
+        check(db, kind, name)
+    try:
+        yield
+    except NotFoundError:
+        raise
+    except ScriptExecutionError as exc:
+        kind = missing_kind(exc)
+        if kind is None or kind not in names:
+            raise
+        negative_cache.add(kind, names[kind])
+        metrics.AD_NOT_FOUND.labels(kind, "script").inc()
+        raise NotFoundError(
+            kind, names[kind], stdout=exc.stdout, stderr=exc.stderr, returncode=exc.returncode
+        ) from exc
+
+
+def created(kind: str, name: str) -> None:
+    negative_cache.discard(kind, name)
+
+
+def synced(kind: str) -> None:
+    # a sincronizacao pode ter trazido nomes criados fora da API
+    negative_cache.clear(kind)
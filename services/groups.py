@@ -1,18 +1,20 @@
-import json
-from datetime import datetime, timezone
-from typing import Any, Dict, List
+import tempfile
+from typing import IO, Any, Dict, Iterator, List, Optional, Set, Tuple
 
 from sqlalchemy.orm import Session
 
-from audit.logger import log_audit
-from db.models import GroupMeta
+from audit.logger import audit_stream, log_audit
+from core import tracing
+from core.config import settings
 from db.session import SessionLocal
+from services import changes, existence, slow_ops, snapshots
 from services.script_runner import (
     ScriptExecutionError,
-    extract_data_block,
-    normalize_for_hash,
-    parse_ldif_entries,
+    chunked,
+    iter_ldif_entries,
     run_script,
+    stream_data_block,
+    tee_lines,
 )
 
 
@@ -39,11 +41,11 @@ def _log_and_raise(
     raise exc
 
 
-def list_groups(db: Session, actor: str) -> str:
+def list_groups(db: Session, actor: str, fields: Optional[List[str]] = None) -> Tuple[List[str], Iterator[str]]:
     script = "groups/list_groups.sh"
-    args: List[str] = []
+    args: List[str] = list(fields or [])
     try:
-        output = run_script(script, args)
+        header, data = stream_data_block(script, args)
     except ScriptExecutionError as exc:
         _log_and_raise(
             db,
@@ -55,23 +57,22 @@ def list_groups(db: Session, actor: str) -> str:
             arguments=args,
             exc=exc,
         )
-    log_audit(
-        db,
+    return header, audit_stream(
+        data,
         actor=actor,
         action="list_groups",
         object_type="group",
         object_id="list",
-        result="success",
         details={"script": script, "arguments": args},
     )
-    return output
 
 
-def get_group(db: Session, actor: str, groupname: str) -> str:
+def get_group(db: Session, actor: str, groupname: str, fields: Optional[List[str]] = None) -> str:
     script = "groups/get_group.sh"
-    args = [groupname]
+    args = [groupname, *(fields or [])]
     try:
-        output = run_script(script, args)
+        with existence.guard(db, group=groupname):
+            output = run_script(script, args)
     except ScriptExecutionError as exc:
         _log_and_raise(
             db,
@@ -111,6 +112,17 @@ def create_group(db: Session, actor: str, groupname: str, description: str | Non
             arguments=args,
             exc=exc,
         )
+    snapshots.touch(db, "groups")
+    changes.record(
+        db,
+        "groups",
+        groupname,
+        changes.CREATED,
+        ["sAMAccountName", "description"] if description else ["sAMAccountName"],
+        actor=actor,
+        action="create_group",
+    )
+    existence.created(existence.GROUP, groupname)
     log_audit(
         db,
         actor=actor,
@@ -127,7 +139,8 @@ def update_group_description(db: Session, actor: str, groupname: str, descriptio
     script = "groups/update_group.sh"
     args = [groupname, description]
     try:
-        output = run_script(script, args)
+        with existence.guard(db, group=groupname):
+            output = run_script(script, args)
     except ScriptExecutionError as exc:
         _log_and_raise(
             db,
@@ -139,6 +152,16 @@ def update_group_description(db: Session, actor: str, groupname: str, descriptio
             arguments=args,
             exc=exc,
         )
+    snapshots.touch(db, "groups")
+    changes.record(
+        db,
+        "groups",
+        groupname,
+        changes.UPDATED,
+        ["description"],
+        actor=actor,
+        action="update_group_description",
+    )
     log_audit(
         db,
         actor=actor,
@@ -155,7 +178,8 @@ def add_member(db: Session, actor: str, groupname: str, member: str) -> str:
     script = "groups/add_user_to_group.sh"
     args = [member, groupname]
     try:
-        output = run_script(script, args)
+        with existence.guard(db, group=groupname, user=member):
+            output = run_script(script, args)
     except ScriptExecutionError as exc:
         _log_and_raise(
             db,
@@ -167,6 +191,9 @@ def add_member(db: Session, actor: str, groupname: str, member: str) -> str:
             arguments=args,
             exc=exc,
         )
+    snapshots.touch(db, "groups", "users")
+    changes.record(db, "groups", groupname, changes.UPDATED, ["member"], actor=actor, action="add_member")
+    changes.record(db, "users", member, changes.UPDATED, ["memberOf"], actor=actor, action="add_member")
     log_audit(
         db,
         actor=actor,
@@ -183,7 +210,8 @@ def remove_member(db: Session, actor: str, groupname: str, member: str) -> str:
     script = "groups/remove_user_from_group.sh"
     args = [member, groupname]
     try:
-        output = run_script(script, args)
+        with existence.guard(db, group=groupname, user=member):
+            output = run_script(script, args)
     except ScriptExecutionError as exc:
         _log_and_raise(
             db,
@@ -195,6 +223,9 @@ def remove_member(db: Session, actor: str, groupname: str, member: str) -> str:
             arguments=args,
             exc=exc,
         )
+    snapshots.touch(db, "groups", "users")
+    changes.record(db, "groups", groupname, changes.UPDATED, ["member"], actor=actor, action="remove_member")
+    changes.record(db, "users", member, changes.UPDATED, ["memberOf"], actor=actor, action="remove_member")
     log_audit(
         db,
         actor=actor,
@@ -211,7 +242,8 @@ def disable_group(db: Session, actor: str, groupname: str, target_ou_dn: str) ->
     script = "groups/disable_group.sh"
     args = [groupname, target_ou_dn]
     try:
-        output = run_script(script, args)
+        with existence.guard(db, group=groupname):
+            output = run_script(script, args)
     except ScriptExecutionError as exc:
         _log_and_raise(
             db,
@@ -223,6 +255,8 @@ def disable_group(db: Session, actor: str, groupname: str, target_ou_dn: str) ->
             arguments=args,
             exc=exc,
         )
+    snapshots.touch(db, "groups", "users")
+    changes.record(db, "groups", groupname, changes.UPDATED, ["distinguishedName"], actor=actor, action="disable_group")
     log_audit(
         db,
         actor=actor,
@@ -235,14 +269,45 @@ def disable_group(db: Session, actor: str, groupname: str, target_ou_dn: str) ->
     return output
 
 
-def sync_groups(db: Session, actor: str) -> str:
+def _stage_group_chunk(
+    db: Session, entries: List[Dict[str, Any]], seen: Set[str], announced: Set[str], staged: IO[str]
+) -> int:
+    payloads: Dict[str, Dict[str, Any]] = {}
+    for entry in entries:
+        groupname = entry.get("sAMAccountName") or entry.get("cn")
+        if not groupname:
+            continue
+        payloads[groupname] = {"groupname": groupname, "attributes": entry}
+    seen.update(payloads)
+    if not payloads:
+        return 0
+    return snapshots.stage_changes(db, "groups", payloads, announced, staged)
+
+
+def sync_groups(db: Session, actor: str) -> Dict[str, Any]:
     script = "groups/sync_groups.sh"
     args: List[str] = []
+    output = tempfile.SpooledTemporaryFile(max_size=settings.response_spool_max_bytes, mode="w+t", encoding="utf-8")
+    # diferencas encontradas durante o streaming: so sao gravadas depois que o script termina
+    staged = tempfile.SpooledTemporaryFile(max_size=settings.response_spool_max_bytes, mode="w+t", encoding="utf-8")
+    header: List[str] = []
+    total = 0
+    updated = 0
+    seen: Set[str] = set()
+    # criados pela API depois da ultima sincronizacao: o evento created ja foi gravado
+    announced = changes.created_by_api(db, "groups", snapshots.snapshot_age(db, "groups"))
     try:
-        output = run_script(script, args)
-        data_block = extract_data_block(output)
-        entries = parse_ldif_entries(data_block)
+        header, data = stream_data_block(script, args)
+        output.write("\n".join([*header, "DATA_BEGIN", ""]))
+        for chunk in chunked(iter_ldif_entries(tee_lines(data, output)), settings.sync_chunk_size):
+            total += len(chunk)
+            with tracing.span("sync.chunk", size=len(chunk)):
+                updated += _stage_group_chunk(db, chunk, seen, announced, staged)
+        output.write("DATA_END\n")
     except ScriptExecutionError as exc:
+        output.close()
+        staged.close()
+        db.rollback()
         _log_and_raise(
             db,
             actor=actor,
@@ -254,7 +319,10 @@ def sync_groups(db: Session, actor: str) -> str:
             exc=exc,
         )
     except Exception as exc:
-        error = ScriptExecutionError("Falha ao processar saida do script", stdout=output if "output" in locals() else "")
+        output.close()
+        staged.close()
+        db.rollback()
+        error = ScriptExecutionError("Falha ao processar saida do script", stdout="\n".join(header))
         _log_and_raise(
             db,
             actor=actor,
@@ -267,31 +335,25 @@ def sync_groups(db: Session, actor: str) -> str:
         )
         raise exc
 
-    updated = 0
-    for entry in entries:
-        groupname = entry.get("sAMAccountName") or entry.get("cn")
-        if not groupname:
-            continue
-        payload = {"groupname": groupname, "attributes": entry}
-        ad_hash = normalize_for_hash(payload)
-        existing = db.query(GroupMeta).filter(GroupMeta.groupname == groupname).one_or_none()
-        if existing and existing.ad_hash == ad_hash:
-            continue
-        if existing:
-            existing.ad_hash = ad_hash
-            existing.extra_json = json.dumps(payload, ensure_ascii=True)
-            existing.last_sync = datetime.now(timezone.utc)
-        else:
-            db.add(
-                GroupMeta(
-                    groupname=groupname,
-                    ad_hash=ad_hash,
-                    extra_json=json.dumps(payload, ensure_ascii=True),
-                    last_sync=datetime.now(timezone.utc),
-                )
-            )
-        updated += 1
-    db.commit()
+    # uma transacao curta com o resultado inteiro: script que falha no meio nao deixa
+    # snapshot pela metade nem eventos de mudanca, e o banco nao espera o DC
+    try:
+        with tracing.span("sync.write", size=updated):
+            snapshots.apply_staged(db, "groups", staged, "sync_groups")
+            # saida vazia e mais provavelmente erro de escopo do que diretorio vazio: nada e removido
+            removed = snapshots.remove_missing(db, "groups", seen) if seen else []
+            for name in removed:
+                changes.record(db, "groups", name, changes.REMOVED, source=changes.SYNC, action="sync_groups")
+            changes.purge(db)
+            snapshots.mark_synced(db, "groups", changed=updated > 0 or bool(removed))
+            db.commit()
+    except Exception:
+        output.close()
+        db.rollback()
+        raise
+    finally:
+        staged.close()
+    existence.synced(existence.GROUP)
     log_audit(
         db,
         actor=actor,
@@ -299,15 +361,17 @@ def sync_groups(db: Session, actor: str) -> str:
         object_type="sync",
         object_id="groups",
         result="success",
-        details={"script": script, "arguments": args, "total": len(entries), "updated": updated},
+        details={"script": script, "arguments": args, "total": total, "updated": updated, "removed": len(removed)},
     )
-    return output
+    output.seek(0)
+    return {"header": header, "output": output, "total": total, "updated": updated}
 
 
 def sync_groups_job(actor: str) -> Dict[str, int]:
     db = SessionLocal()
     try:
-        sync_groups(db, actor)
+        with tracing.record_slow("job sync_groups", slow_ops.record):
+            sync_groups(db, actor)["output"].close()
         return {"status": "ok"}
     finally:
         db.close()
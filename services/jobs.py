@@ -0,0 +1,258 @@
+import base64
+import json
+import threading
+import time
+from datetime import datetime, timezone
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Optional
+
+from cryptography.fernet import Fernet, InvalidToken
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+from sqlalchemy import and_, or_
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from core import metrics, tracing
+from core.config import settings
+from db.models import Job
+from db.session import SessionLocal
+from services import existence, groups, slow_ops, users
+from services.script_runner import (
+    CircuitOpenError,
+    OverloadedError,
+    ScriptExecutionError,
+    extract_data_block,
+    is_dc_failure,
+    parse_ldif_entries,
+    run_script,
+)
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+CLAIM_ATTEMPTS = 3
+
+# operacoes que podem ir para a fila: recebem (db, actor, *args) e devolvem a saida do script
+OPERATIONS: Dict[str, Callable[..., str]] = {
+    "users.create_user": users.create_user,
+    "users.update_user": users.update_user,
+    "users.reset_password": users.reset_password,
+    "users.enable_user": users.enable_user,
+    "users.disable_user": users.disable_user,
+    "users.delete_user": users.delete_user,
+    "users.add_user_to_group": users.add_user_to_group,
+    "users.remove_user_from_group": users.remove_user_from_group,
+    "groups.create_group": groups.create_group,
+    "groups.update_group_description": groups.update_group_description,
+    "groups.add_member": groups.add_member,
+    "groups.remove_member": groups.remove_member,
+    "groups.disable_group": groups.disable_group,
+}
+
+
+@lru_cache(maxsize=1)
+def _fernet(secret: str) -> Fernet:
+    # chave propria dos jobs, derivada do segredo do JWT: um nao revela o outro
+    key = HKDF(algorithm=hashes.SHA256(), length=32, salt=None, info=b"ad-api jobs args").derive(secret.encode())
+    return Fernet(base64.urlsafe_b64encode(key))
+
+
+def _seal(args: Any) -> str:
+    return _fernet(settings.jwt_secret_key).encrypt(json.dumps(args, ensure_ascii=True).encode()).decode()
+
+
+def _unseal(sealed: Optional[str]) -> List[Any]:
+    if not sealed:
+        return []
+    return json.loads(_fernet(settings.jwt_secret_key).decrypt(sealed.encode()))
+
+
+def _lookup(kind: str, name: str, *fields: str) -> Optional[Dict[str, Any]]:
+    script = "users/get_user.sh" if kind == existence.USER else "groups/get_group.sh"
+    try:
+        output = run_script(script, [name, *fields])
+    except ScriptExecutionError as exc:
+        if existence.missing_kind(exc) == kind:
+            return None
+        raise
+    entries = parse_ldif_entries(extract_data_block(output))
+    return entries[0] if entries else {}
+
+
+def _is_member(username: str, group: str) -> bool:
+    found = _lookup(existence.GROUP, group, "distinguishedName")
+    if not found or not found.get("distinguishedName"):
+        return False
+    member_of = (_lookup(existence.USER, username, "memberOf") or {}).get("memberOf") or []
+    if isinstance(member_of, str):
+        member_of = [member_of]
+    return found["distinguishedName"].lower() in (dn.lower() for dn in member_of)
+
+
+# operacoes que nao se repetem sem erro ("ja existe", "nao encontrado"): quando a tentativa
+# anterior caiu no meio, confere no AD se ela chegou a ser aplicada antes de rodar de novo.
+# As demais gravam o mesmo estado se repetidas.
+APPLIED: Dict[str, Callable[..., bool]] = {
+    "users.create_user": lambda payload: _lookup(existence.USER, payload["username"]) is not None,
+    "users.delete_user": lambda username: _lookup(existence.USER, username) is None,
+    "users.add_user_to_group": lambda username, group: _is_member(username, group),
+    "users.remove_user_from_group": lambda username, group: not _is_member(username, group),
+    "groups.create_group": lambda groupname, description: _lookup(existence.GROUP, groupname) is not None,
+    "groups.add_member": lambda groupname, member: _is_member(member, groupname),
+    "groups.remove_member": lambda groupname, member: not _is_member(member, groupname),
+}
+
+
+def enqueue(db: Session, actor: str, operation: str, *args: Any) -> Job:
+    if operation not in OPERATIONS:
+        raise ValueError(f"Operacao sem suporte na fila: {operation}")
+    job = Job(
+        operation=operation,
+        actor=actor,
+        sealed_args=_seal(args),
+        status=QUEUED,
+        attempts=0,
+        run_after=time.time(),
+    )
+    db.add(job)
+    db.commit()
+    return job
+
+
+def get_job(db: Session, job_id: int) -> Optional[Job]:
+    return db.get(Job, job_id)
+
+
+def _claimable(now: float):
+    # job em execucao com a trava vencida: o worker que o pegou caiu
+    return or_(
+        and_(Job.status == QUEUED, Job.run_after <= now),
+        and_(Job.status == RUNNING, Job.locked_until <= now),
+    )
+
+
+def claim(db: Session, worker: str) -> Optional[Job]:
+    """Pega o proximo job pronto para ``worker``.
+
+    No PostgreSQL a escolha usa ``FOR UPDATE SKIP LOCKED``; no SQLite, que nao tem
+    travas por linha, o UPDATE condicional garante que so um worker leva o job.
+    """
+    for _ in range(CLAIM_ATTEMPTS):
+        now = time.time()
+        candidate = (
+            db.query(Job.id)
+            .filter(_claimable(now))
+            .order_by(Job.run_after, Job.id)
+            .limit(1)
+            .with_for_update(skip_locked=True)
+            .scalar()
+        )
+        if candidate is None:
+            db.rollback()
+            return None
+        taken = (
+            db.query(Job)
+            .filter(Job.id == candidate, _claimable(now))
+            .update(
+                {
+                    Job.status: RUNNING,
+                    Job.locked_by: worker,
+                    Job.locked_until: now + settings.job_lock_seconds,
+                    Job.attempts: Job.attempts + 1,
+                },
+                synchronize_session=False,
+            )
+        )
+        db.commit()
+        if taken:
+            return db.get(Job, candidate)
+    return None
+
+
+def _retryable(exc: ScriptExecutionError) -> bool:
+    # so falhas do DC ou da protecao contra sobrecarga: o resto se repetiria igual
+    return isinstance(exc, (CircuitOpenError, OverloadedError)) or is_dc_failure(exc.returncode, exc.stderr)
+
+
+def _finish(job: Job, status: str, *, output: Optional[str] = None, error: Optional[str] = None) -> None:
+    job.status = status
+    job.output = output
+    job.error = error
+    job.sealed_args = None
+    job.started_at = None
+    job.locked_until = None
+    job.finished_at = datetime.now(timezone.utc)
+
+
+def run(db: Session, job: Job) -> None:
+    if job.attempts == 1:
+        created = job.created_at if job.created_at.tzinfo else job.created_at.replace(tzinfo=timezone.utc)
+        metrics.JOB_WAIT.observe(max(0.0, (datetime.now(timezone.utc) - created).total_seconds()))
+    operation = OPERATIONS[job.operation]
+    try:
+        args = _unseal(job.sealed_args)
+    except InvalidToken:
+        _finish(job, FAILED, error="Argumentos do job ilegiveis (JWT_SECRET_KEY mudou?)")
+        metrics.JOBS.labels(job.operation, FAILED).inc()
+        db.commit()
+        return
+    interrupted = job.started_at is not None
+    started = False
+    try:
+        applied = APPLIED.get(job.operation)
+        if interrupted and applied is not None and applied(*args):
+            _finish(job, SUCCEEDED, output="Aplicado pela tentativa interrompida")
+            metrics.JOBS.labels(job.operation, "recovered").inc()
+            db.commit()
+            return
+        job.started_at = time.time()
+        db.commit()
+        started = True
+        with tracing.record_slow(f"job {job.operation}", slow_ops.record):
+            output = operation(db, job.actor, *args)
+    except ScriptExecutionError as exc:
+        db.rollback()
+        error = exc.stderr or exc.stdout or str(exc)
+        if _retryable(exc) and job.attempts < settings.job_max_attempts:
+            job.status = QUEUED
+            job.error = error
+            if started:
+                # falha do DC: o script nao chegou a mudar nada
+                job.started_at = None
+            job.locked_until = None
+            job.run_after = time.time() + settings.job_retry_base_seconds * 2 ** (job.attempts - 1)
+            metrics.JOBS.labels(job.operation, "retried").inc()
+        else:
+            _finish(job, FAILED, error=error)
+            metrics.JOBS.labels(job.operation, FAILED).inc()
+        db.commit()
+        return
+    except Exception as exc:
+        db.rollback()
+        _finish(job, FAILED, error=f"{type(exc).__name__}: {exc}")
+        metrics.JOBS.labels(job.operation, FAILED).inc()
+        db.commit()
+        return
+    _finish(job, SUCCEEDED, output=output)
+    metrics.JOBS.labels(job.operation, SUCCEEDED).inc()
+    db.commit()
+
+
+def work(worker: str, stop: threading.Event) -> None:
+    """Executa jobs ate ``stop``; sem job pronto, espera JOB_POLL_SECONDS."""
+    while not stop.is_set():
+        job = None
+        db = SessionLocal()
+        try:
+            job = claim(db, worker)
+            if job is not None:
+                run(db, job)
+        except SQLAlchemyError:
+            # banco indisponivel ou bloqueado: o job, se pego, volta quando a trava vencer
+            db.rollback()
+        finally:
+            db.close()
+        if job is None:
+            stop.wait(settings.job_poll_seconds)
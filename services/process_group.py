@@ -0,0 +1,298 @@
+import os
+import selectors
+import signal
+import subprocess
+import tempfile
+import time
+from collections import deque
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from threading import Condition, Lock, Thread, Timer
+from typing import Any, Callable, Deque, Dict, Iterator, List, Optional, Tuple
+
+try:
+    import resource
+except ImportError:  # pragma: no cover - fora de POSIX
+    resource = None
+
+from core import metrics
+from core.config import settings
+
+READ_CHUNK = 65536
+# o stderr so serve para a mensagem de erro e para reconhecer falha do DC
+STDERR_LIMIT = 65536
+MAX_REPORTS = 50
+EXIT_POLL_SECONDS = 0.25
+
+
+@dataclass
+class Captured:
+    stdout: str
+    stderr: str
+    timed_out: bool = False
+    overflowed: bool = False
+
+
+def spawn(cmd: List[str], **kwargs: Any) -> subprocess.Popen:
+    """Inicia o script em uma sessao propria: o grupo de processos tem o pid do bash."""
+    proc = subprocess.Popen(cmd, start_new_session=True, **kwargs)
+    _apply_limits(proc.pid)
+    return proc
+
+
+def _limits() -> List[Tuple[int, int]]:
+    limits = []
+    if settings.ad_script_rlimit_cpu_seconds > 0:
+        limits.append((resource.RLIMIT_CPU, settings.ad_script_rlimit_cpu_seconds))
+    if settings.ad_script_rlimit_as_mb > 0:
+        limits.append((resource.RLIMIT_AS, settings.ad_script_rlimit_as_mb * 1024 * 1024))
+    return limits
+
+
+def _apply_limits(pid: int) -> None:
+    # preexec_fn nao e seguro com as threads do servidor; o Popen so retorna depois do
+    # exec e o bash ainda vai ler o script, entao ldapsearch e cia. ja nascem com os limites
+    if resource is None or not hasattr(resource, "prlimit"):
+        return
+    for kind, value in _limits():
+        try:
+            resource.prlimit(pid, kind, (value, value))
+        except (ProcessLookupError, PermissionError, ValueError):
+            pass
+
+
+def kill_group(proc: subprocess.Popen) -> None:
+    try:
+        os.killpg(proc.pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+def _decode(data: bytes) -> str:
+    text = data.decode("utf-8", errors="replace")
+    if "\r" in text:
+        # mesmas quebras de linha do Popen(text=True)
+        text = text.replace("\r\n", "\n").replace("\r", "\n")
+    return text
+
+
+def _open_pidfd(pid: int) -> Optional[int]:
+    try:
+        return os.pidfd_open(pid)
+    except (AttributeError, OSError):
+        return None
+
+
+def capture(proc: subprocess.Popen, timeout: float, script: str) -> Captured:
+    """Le stdout/stderr ate o fim ou o timeout; o grupo e morto acima de
+    AD_SCRIPT_MAX_OUTPUT_BYTES, que e o teto de memoria por chamada (a saida volta como str).
+
+    Ao sair, o bash ja terminou e o que restou no grupo passou pelo reaper.
+    """
+    deadline = time.monotonic() + timeout
+    limit = settings.ad_script_max_output_bytes
+    stdout: List[bytes] = []
+    stderr = bytearray()
+    size = 0
+    open_streams = 2
+    timed_out = overflowed = reaped = False
+    # sem pidfd, a saida do bash e notada por polling
+    pidfd = _open_pidfd(proc.pid)
+    with selectors.DefaultSelector() as selector:
+        selector.register(proc.stdout, selectors.EVENT_READ)
+        selector.register(proc.stderr, selectors.EVENT_READ)
+        if pidfd is not None:
+            selector.register(pidfd, selectors.EVENT_READ)
+        try:
+            while open_streams and not overflowed:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    timed_out = True
+                    break
+                wait = remaining if pidfd is not None else min(remaining, EXIT_POLL_SECONDS)
+                for key, _ in selector.select(wait):
+                    if key.fd == pidfd:
+                        selector.unregister(pidfd)
+                        continue
+                    chunk = os.read(key.fd, READ_CHUNK)
+                    if not chunk:
+                        selector.unregister(key.fileobj)
+                        open_streams -= 1
+                    elif key.fileobj is proc.stdout:
+                        size += len(chunk)
+                        if limit > 0 and size > limit:
+                            overflowed = True
+                            break
+                        stdout.append(chunk)
+                    else:
+                        stderr += chunk
+                        del stderr[:-STDERR_LIMIT]
+                if open_streams and not reaped and proc.poll() is not None:
+                    # o bash saiu, mas algum processo do grupo (ex.: comando em background)
+                    # ainda segura os pipes; sem o reaper a leitura iria ate o timeout
+                    reap(proc, script)
+                    reaped = True
+            if not (timed_out or overflowed):
+                try:
+                    proc.wait(max(0.0, deadline - time.monotonic()))
+                except subprocess.TimeoutExpired:
+                    timed_out = True
+        finally:
+            if pidfd is not None:
+                os.close(pidfd)
+            if proc.poll() is None:
+                kill_group(proc)
+                proc.wait()
+            if not reaped:
+                reap(proc, script)
+            proc.stdout.close()
+            proc.stderr.close()
+        return Captured(_decode(b"".join(stdout)), _decode(bytes(stderr)), timed_out, overflowed)
+
+
+class Spool:
+    """Copia o stdout do script para um arquivo temporario em uma thread propria.
+
+    O script nunca espera o consumidor (cliente HTTP lento lendo a resposta): o prazo
+    de ``timeout`` e ``elapsed`` medem so o script. ``lines()`` entrega as linhas
+    conforme chegam. ``on_exit`` roda na thread da copia assim que o script termina,
+    antes de o consumidor ler o resto.
+    """
+
+    def __init__(
+        self, proc: subprocess.Popen, timeout: float, on_exit: Optional[Callable[["Spool"], None]] = None
+    ) -> None:
+        self.proc = proc
+        self.timed_out = False
+        self.aborted = False
+        self.elapsed = 0.0
+        self._on_exit = on_exit
+        self._file = tempfile.TemporaryFile()
+        self._size = 0
+        self._done = False
+        self._cond = Condition()
+        self._started = time.perf_counter()
+        self._timer = Timer(timeout, self._expire)
+        self._timer.daemon = True
+        self._thread = Thread(target=self._pump, name="script-spool", daemon=True)
+        self._timer.start()
+        self._thread.start()
+
+    def _expire(self) -> None:
+        self.timed_out = True
+        kill_group(self.proc)
+
+    def _pump(self) -> None:
+        fd = self._file.fileno()
+        try:
+            while True:
+                chunk = os.read(self.proc.stdout.fileno(), READ_CHUNK)
+                if not chunk:
+                    break
+                os.pwrite(fd, chunk, self._size)
+                with self._cond:
+                    self._size += len(chunk)
+                    self._cond.notify_all()
+            self.proc.wait()
+        finally:
+            self._timer.cancel()
+            self.elapsed = time.perf_counter() - self._started
+            try:
+                if self._on_exit is not None and self.proc.returncode is not None and not self.aborted:
+                    self._on_exit(self)
+            finally:
+                with self._cond:
+                    self._done = True
+                    self._cond.notify_all()
+
+    def lines(self) -> Iterator[str]:
+        fd = self._file.fileno()
+        position = 0
+        pending = b""
+        while True:
+            with self._cond:
+                while position >= self._size and not self._done:
+                    self._cond.wait()
+                size, done = self._size, self._done
+            if position >= size and done:
+                break
+            data = os.pread(fd, min(size - position, READ_CHUNK), position)
+            position += len(data)
+            *complete, pending = (pending + data).split(b"\n")
+            for line in complete:
+                yield line.rstrip(b"\r").decode("utf-8", errors="replace")
+        if pending:
+            yield pending.rstrip(b"\r").decode("utf-8", errors="replace")
+
+    def close(self) -> bool:
+        """Encerra a copia; True se o script ainda rodava (consumidor desistiu antes)."""
+        with self._cond:
+            aborted = self.aborted = not self._done
+        if aborted:
+            kill_group(self.proc)
+        self._thread.join()
+        self._file.close()
+        return aborted
+
+
+_reports: Deque[Dict[str, Any]] = deque(maxlen=MAX_REPORTS)
+_reports_lock = Lock()
+
+
+def _group_members(pgid: int) -> List[Tuple[int, str]]:
+    members = []
+    try:
+        entries = os.listdir("/proc")
+    except OSError:
+        return members
+    for entry in entries:
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat", "rb") as handle:
+                stat = handle.read()
+        except OSError:
+            continue
+        # o nome do comando fica entre parenteses e pode conter espacos
+        name_end = stat.rfind(b")")
+        fields = stat[name_end + 2:].split()
+        if len(fields) > 2 and fields[0] != b"Z" and int(fields[2]) == pgid:
+            members.append((int(entry), stat[stat.find(b"(") + 1:name_end].decode(errors="replace")))
+    return members
+
+
+def reap(proc: subprocess.Popen, script: str) -> int:
+    """Depois que o script terminou, mata e registra o que sobrou no grupo dele."""
+    try:
+        os.killpg(proc.pid, 0)
+    except (ProcessLookupError, PermissionError):
+        return 0
+    members = _group_members(proc.pid)
+    kill_group(proc)
+    # se este processo for o init do container, os orfaos viram filhos dele
+    while True:
+        try:
+            pid, _ = os.waitpid(-proc.pid, os.WNOHANG)
+        except ChildProcessError:
+            break
+        if pid == 0:
+            break
+    if not members:
+        return 0
+    metrics.SCRIPT_ORPHANS.labels(script).inc(len(members))
+    with _reports_lock:
+        _reports.append(
+            {
+                "script": script,
+                "pgid": proc.pid,
+                "pids": [pid for pid, _ in members],
+                "commands": [name for _, name in members],
+                "found_at": datetime.now(timezone.utc),
+            }
+        )
+    return len(members)
+
+
+def recent_orphans() -> List[Dict[str, Any]]:
+    with _reports_lock:
+        return list(reversed(_reports))
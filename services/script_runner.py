@@ -1,16 +1,55 @@
-import base64
+import binascii
 import hashlib
 import json
 import os
 import re
 import subprocess
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from itertools import islice
 from pathlib import Path
-from typing import Any, Dict, Iterable, List, Optional
+from typing import IO, Any, Dict, Generator, Iterable, Iterator, List, Optional, Sequence, Tuple
 
+from core import circuit_breaker, concurrency, metrics, tracing
 from core.config import settings
+from services import dc_pool, process_group
 
 
 CONTROL_CHARS_RE = re.compile(r"[\x00-\x08\x0B\x0C\x0E-\x1F]")
+FIELD_NAME_RE = re.compile(r"^[A-Za-z][A-Za-z0-9-]{0,63}$")
+ALL_FIELDS = "*"
+GUID_ATTRIBUTES = {"objectguid", "msexchmailboxguid"}
+HEX_VALUE_RE = re.compile(r"^(?:[0-9a-f]{2})+$")
+TIMEOUT_RETURNCODE = 124
+# saida acima de AD_SCRIPT_MAX_OUTPUT_BYTES: o grupo do script e morto
+OUTPUT_LIMIT_RETURNCODE = 125
+# mensagens do ldap-utils que indicam DC inacessivel ou sobrecarregado (nao erro de negocio)
+DC_FAILURE_MARKERS = (
+    "Can't contact LDAP server",
+    "Server is unavailable",
+    "Server is busy",
+    "Timed out",
+    "Connect error",
+)
+# mesmo resultado de json.dumps(sort_keys=True, ensure_ascii=True), sem recriar
+# o encoder a cada chamada; a saida precisa ficar estavel porque o hash e gravado
+_HASH_ENCODER = json.JSONEncoder(sort_keys=True, ensure_ascii=True)
+_MISSING = object()
+MULTI_VALUED_ATTRIBUTES = {
+    "member",
+    "memberof",
+    "objectclass",
+    "proxyaddresses",
+    "serviceprincipalname",
+    "othertelephone",
+    "othermobile",
+    "url",
+    "directreports",
+    "showinaddressbook",
+}
 
 
 class ScriptExecutionError(RuntimeError):
@@ -21,12 +60,45 @@ class ScriptExecutionError(RuntimeError):
         self.returncode = returncode
 
 
+class CircuitOpenError(ScriptExecutionError):
+    def __init__(self, category: str, retry_after: float):
+        super().__init__("Controlador de dominio indisponivel (circuito aberto)")
+        self.category = category
+        self.retry_after = retry_after
+
+
+class OverloadedError(ScriptExecutionError):
+    def __init__(self, retry_after: float):
+        super().__init__("Servico sobrecarregado, tente novamente")
+        self.retry_after = retry_after
+
+
 def _sanitize_arg(value: str) -> str:
     if CONTROL_CHARS_RE.search(value):
         raise ScriptExecutionError("Parametro contem caracteres invalidos")
     return value
 
 
+def resolve_fields(raw: Optional[str], default: Sequence[str]) -> List[str]:
+    if raw is None or not raw.strip():
+        return list(default)
+    if raw.strip() == ALL_FIELDS:
+        return [ALL_FIELDS]
+    fields: List[str] = []
+    seen = set()
+    for item in raw.split(","):
+        name = item.strip()
+        if not name:
+            continue
+        if not FIELD_NAME_RE.match(name):
+            raise ScriptExecutionError(f"Atributo invalido: {name}")
+        if name.lower() in seen:
+            continue
+        seen.add(name.lower())
+        fields.append(name)
+    return fields or list(default)
+
+
 def _script_base_dir() -> Path:
     root = Path(__file__).resolve().parents[1]
     base = Path(settings.ad_scripts_dir)
@@ -35,11 +107,11 @@ def _script_base_dir() -> Path:
     return (root / base).resolve()
 
 
-def _script_env() -> Dict[str, str]:
+def _script_env(ldap_uri: Optional[str] = None) -> Dict[str, str]:
     env = os.environ.copy()
     env.update(
         {
-            "LDAP_URI": settings.ldap_uri,
+            "LDAP_URI": ldap_uri or settings.ldap_uri,
             "BIND_DN": settings.bind_dn,
             "BIND_PW": settings.bind_pw,
             "BASE_DN": settings.base_dn,
@@ -47,104 +119,427 @@ def _script_env() -> Dict[str, str]:
             "DOMAIN": settings.domain,
         }
     )
+    request_id = tracing.current_request_id()
+    if request_id:
+        env["REQUEST_ID"] = request_id
     return env
 
 
-def run_script(
-    script_relative: str,
-    args: Iterable[str],
-    *,
-    timeout_seconds: Optional[int] = None,
-) -> str:
+def _build_command(script_relative: str, args: Iterable[str]) -> List[str]:
     base_dir = _script_base_dir()
     script_path = (base_dir / script_relative).resolve()
     if not script_path.exists():
         raise ScriptExecutionError(f"Script nao encontrado: {script_path}")
     if not script_path.is_file():
         raise ScriptExecutionError(f"Caminho do script invalido: {script_path}")
+    return [str(script_path)] + [_sanitize_arg(str(arg)) for arg in args]
+
+
+def is_dc_failure(returncode: int, stderr: str) -> bool:
+    if returncode == TIMEOUT_RETURNCODE:
+        return True
+    return returncode != 0 and any(marker in stderr for marker in DC_FAILURE_MARKERS)
+
+
+def _should_failover(returncode: int, stderr: str, attempt: int, candidates: List[str]) -> bool:
+    # so falha de conexao: repetir apos timeout dobraria a espera do cliente
+    return (
+        attempt < len(candidates)
+        and returncode != TIMEOUT_RETURNCODE
+        and is_dc_failure(returncode, stderr)
+    )
+
+
+def _admit(script_relative: str, lane: str) -> circuit_breaker.Guard:
+    current = circuit_breaker.guard(script_relative)
+    if settings.circuit_breaker_enabled:
+        retry_after = current.breaker.acquire()
+        if retry_after is not None:
+            raise CircuitOpenError(current.breaker.name, retry_after)
+    if settings.concurrency_limit_enabled:
+        with tracing.span("script.queue", lane=lane):
+            retry_after = concurrency.limiter().acquire(lane)
+        if retry_after is not None:
+            if settings.circuit_breaker_enabled:
+                current.breaker.cancel()
+            raise OverloadedError(retry_after)
+    return current
+
+
+def _settle(
+    current: circuit_breaker.Guard, elapsed: float, returncode: int, stderr: str, *, observe: bool = True
+) -> None:
+    failed = is_dc_failure(returncode, stderr)
+    if observe:
+        current.timeout.observe(elapsed)
+        if settings.concurrency_limit_enabled:
+            concurrency.limiter().observe(current.timeout.name, elapsed, failed=failed)
+    if settings.circuit_breaker_enabled:
+        current.breaker.record(failed=failed)
+
+
+class _Admission:
+    """Vaga de um script (circuito e concorrencia), devolvida uma unica vez.
+
+    No streaming quem devolve e a thread do spool, quando o script termina: o cliente que
+    ainda le a resposta nao segura a vaga da faixa nem a chamada de teste do circuito.
+    """
+
+    def __init__(self, script_relative: str) -> None:
+        self.lane = concurrency.script_lane(script_relative)
+        self.guard = _admit(script_relative, self.lane)
+        self._lock = threading.Lock()
+        self._held = True
+
+    def _take(self) -> bool:
+        with self._lock:
+            held, self._held = self._held, False
+        return held
+
+    def settle(self, elapsed: float, returncode: int, stderr: str, *, observe: bool = True) -> None:
+        if not self._take():
+            return
+        try:
+            _settle(self.guard, elapsed, returncode, stderr, observe=observe)
+        finally:
+            if settings.concurrency_limit_enabled:
+                concurrency.limiter().release(self.lane)
+
+    def release(self) -> None:
+        """Devolve a vaga de uma chamada interrompida por erro inesperado, que conta como
+        falha: sem resultado a chamada de teste do circuito meio aberto nunca se resolveria."""
+        if not self._take():
+            return
+        try:
+            if settings.circuit_breaker_enabled:
+                self.guard.breaker.record(failed=True)
+        finally:
+            if settings.concurrency_limit_enabled:
+                concurrency.limiter().release(self.lane)
+
+
+@contextmanager
+def _admitted(script_relative: str) -> Iterator[_Admission]:
+    admission = _Admission(script_relative)
+    try:
+        yield admission
+    finally:
+        admission.release()
+
+
+def run_script(
+    script_relative: str,
+    args: Iterable[str],
+    *,
+    timeout_seconds: Optional[float] = None,
+) -> str:
+    cmd = _build_command(script_relative, args)
+    script_path = cmd[0]
+    with _admitted(script_relative) as admission:
+        timeout = timeout_seconds or admission.guard.timeout.current()
+        pool = dc_pool.get_pool()
+        candidates = pool.route(script_relative)
+        start = time.perf_counter()
+        with metrics.track_script(script_relative), tracing.span("script", script=script_relative):
+            for attempt, ldap_uri in enumerate(candidates, start=1):
+                try:
+                    with tracing.span("script.spawn", dc=ldap_uri):
+                        proc = process_group.spawn(
+                            cmd,
+                            stdout=subprocess.PIPE,
+                            stderr=subprocess.PIPE,
+                            env=_script_env(ldap_uri),
+                        )
+                except FileNotFoundError as exc:
+                    metrics.record_exit(script_relative, 127)
+                    admission.settle(0.0, 127, "", observe=False)
+                    raise ScriptExecutionError(
+                        f"Executavel nao encontrado: {script_path}",
+                        stdout="",
+                        stderr=str(exc),
+                        returncode=127,
+                    ) from exc
+                with tracing.span("script.wait"):
+                    captured = process_group.capture(proc, timeout, script_relative)
+                stderr = captured.stderr.strip()
+                if captured.timed_out:
+                    metrics.record_exit(script_relative, TIMEOUT_RETURNCODE, timed_out=True)
+                    pool.report(ldap_uri, failed=True, error="Timeout ao executar script")
+                    admission.settle(time.perf_counter() - start, TIMEOUT_RETURNCODE, stderr)
+                    raise ScriptExecutionError(
+                        "Timeout ao executar script",
+                        stdout=captured.stdout.strip(),
+                        stderr=stderr,
+                        returncode=TIMEOUT_RETURNCODE,
+                    )
+                if captured.overflowed:
+                    # o DC respondeu; a saida e que passou do limite
+                    metrics.record_exit(script_relative, OUTPUT_LIMIT_RETURNCODE)
+                    metrics.SCRIPT_OUTPUT_OVERFLOWS.labels(script_relative).inc()
+                    pool.report(ldap_uri, failed=False)
+                    admission.settle(time.perf_counter() - start, OUTPUT_LIMIT_RETURNCODE, stderr, observe=False)
+                    raise ScriptExecutionError(
+                        f"Saida do script excede {settings.ad_script_max_output_bytes} bytes",
+                        returncode=OUTPUT_LIMIT_RETURNCODE,
+                    )
+                metrics.record_exit(script_relative, proc.returncode)
+                pool.report(ldap_uri, failed=is_dc_failure(proc.returncode, stderr), error=stderr)
+                if not _should_failover(proc.returncode, stderr, attempt, candidates):
+                    break
+                metrics.DC_FAILOVERS.labels(ldap_uri).inc()
 
-    timeout = timeout_seconds or settings.ad_script_timeout_seconds
-    cmd = [str(script_path)] + [_sanitize_arg(str(arg)) for arg in args]
+        stdout = captured.stdout.strip()
+        admission.settle(time.perf_counter() - start, proc.returncode, stderr)
+        if proc.returncode != 0:
+            raise ScriptExecutionError(
+                "Falha ao executar script", stdout=stdout, stderr=stderr, returncode=proc.returncode
+            )
+        return stdout
+
+
+def stream_script(
+    script_relative: str,
+    args: Iterable[str],
+    *,
+    timeout_seconds: Optional[float] = None,
+) -> Generator[str, None, None]:
+    cmd = _build_command(script_relative, args)
+    admission = _Admission(script_relative)
+    try:
+        timeout = timeout_seconds or admission.guard.timeout.current()
+        pool = dc_pool.get_pool()
+        candidates = pool.route(script_relative)
+        # so o tempo do script: a espera pelo consumidor nao e latencia do DC
+        elapsed = 0.0
+        with (
+            tempfile.TemporaryFile(mode="w+t", encoding="utf-8") as stderr_file,
+            metrics.track_script(script_relative),
+            tracing.span("script", script=script_relative, streamed=True),
+        ):
+            for attempt, ldap_uri in enumerate(candidates, start=1):
+                stderr_file.seek(0)
+                stderr_file.truncate()
+                try:
+                    with tracing.span("script.spawn", dc=ldap_uri):
+                        proc = process_group.spawn(
+                            cmd,
+                            stdout=subprocess.PIPE,
+                            stderr=stderr_file,
+                            env=_script_env(ldap_uri),
+                        )
+                except FileNotFoundError as exc:
+                    metrics.record_exit(script_relative, 127)
+                    admission.settle(0.0, 127, "", observe=False)
+                    raise ScriptExecutionError(
+                        f"Executavel nao encontrado: {cmd[0]}",
+                        stdout="",
+                        stderr=str(exc),
+                        returncode=127,
+                    ) from exc
+
+                def exited(spool: process_group.Spool, attempt: int = attempt) -> None:
+                    # roda na thread do spool: o consumidor ainda nao leu o stderr
+                    outcome = TIMEOUT_RETURNCODE if spool.timed_out else spool.proc.returncode
+                    stderr_file.seek(0)
+                    stderr = stderr_file.read().strip()
+                    # falha que ainda pode ir para outro DC fica com o consumidor, na mesma vaga
+                    if not _should_failover(outcome, stderr, attempt, candidates):
+                        admission.settle(elapsed + spool.elapsed, outcome, stderr)
+
+                # o spool le o stdout em outra thread: cliente lento nao segura o script
+                spool = process_group.Spool(proc, timeout, on_exit=exited)
+                streamed = False
+                retry = False
+                try:
+                    for line in spool.lines():
+                        streamed = True
+                        yield line
+                finally:
+                    # consumidor desistiu antes do fim: o DC respondeu, mas a duracao nao e representativa
+                    aborted = spool.close()
+                    elapsed += spool.elapsed
+                    timed_out = spool.timed_out
+                    returncode = proc.returncode
+                    proc.stdout.close()
+                    process_group.reap(proc, script_relative)
+                    if timed_out:
+                        metrics.record_exit(script_relative, TIMEOUT_RETURNCODE, timed_out=True)
+                    else:
+                        metrics.record_exit(script_relative, returncode)
+                    stderr_file.seek(0)
+                    stderr = stderr_file.read().strip()
+                    outcome = TIMEOUT_RETURNCODE if timed_out else (0 if aborted else returncode)
+                    pool.report(ldap_uri, failed=is_dc_failure(outcome, stderr), error=stderr)
+                    # com linhas ja entregues ao consumidor nao da para recomecar em outro DC
+                    retry = not streamed and _should_failover(outcome, stderr, attempt, candidates)
+                    if not retry:
+                        # sem efeito se o spool ja devolveu a vaga
+                        admission.settle(elapsed, outcome, stderr, observe=not aborted)
+                if not retry:
+                    break
+                metrics.DC_FAILOVERS.labels(ldap_uri).inc()
+    finally:
+        admission.release()
+
+    if timed_out:
+        raise ScriptExecutionError("Timeout ao executar script", stderr=stderr, returncode=TIMEOUT_RETURNCODE)
+    if returncode != 0:
+        raise ScriptExecutionError("Falha ao executar script", stderr=stderr, returncode=returncode)
+
+
+def _until_data_end(lines: Generator[str, None, None]) -> Iterator[str]:
     try:
-        result = subprocess.run(
-            cmd,
-            capture_output=True,
-            text=True,
-            timeout=timeout,
-            env=_script_env(),
-            check=False,
-        )
-    except FileNotFoundError as exc:
-        raise ScriptExecutionError(
-            f"Executavel nao encontrado: {script_path}",
-            stdout="",
-            stderr=str(exc),
-            returncode=127,
-        ) from exc
-    except subprocess.TimeoutExpired as exc:
-        raise ScriptExecutionError(
-            "Timeout ao executar script",
-            stdout=(exc.stdout or "").strip() if isinstance(exc.stdout, str) else "",
-            stderr=(exc.stderr or "").strip() if isinstance(exc.stderr, str) else "",
-            returncode=124,
-        ) from exc
-
-    stdout = (result.stdout or "").strip()
-    stderr = (result.stderr or "").strip()
-    if result.returncode != 0:
-        raise ScriptExecutionError("Falha ao executar script", stdout=stdout, stderr=stderr, returncode=result.returncode)
-    return stdout
+        for line in lines:
+            if line == "DATA_END":
+                break
+            yield line
+        else:
+            raise ScriptExecutionError("Saida do script com bloco DATA invalido")
+        for _ in lines:
+            pass
+    finally:
+        lines.close()
+
+
+def stream_data_block(
+    script_relative: str,
+    args: Iterable[str],
+    *,
+    timeout_seconds: Optional[float] = None,
+) -> Tuple[List[str], Iterator[str]]:
+    lines = stream_script(script_relative, args, timeout_seconds=timeout_seconds)
+    header: List[str] = []
+    for line in lines:
+        if line == "DATA_BEGIN":
+            return header, _until_data_end(lines)
+        header.append(line)
+    raise ScriptExecutionError("Saida do script sem bloco DATA", stdout="\n".join(header))
+
+
+def tee_lines(lines: Iterable[str], fp: IO[str]) -> Iterator[str]:
+    for line in lines:
+        fp.write(line)
+        fp.write("\n")
+        yield line
+
+
+def chunked(items: Iterable[Any], size: int) -> Iterator[List[Any]]:
+    iterator = iter(items)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _marker_line(output: str, marker: str) -> int:
+    pos = output.find(marker)
+    while pos >= 0:
+        end = pos + len(marker)
+        if (pos == 0 or output[pos - 1] == "\n") and (end == len(output) or output[end] in "\r\n"):
+            return pos
+        pos = output.find(marker, end)
+    return -1
 
 
 def extract_data_block(output: str) -> str:
-    lines = output.splitlines()
+    # Localiza os marcadores direto no texto: dividir a saida inteira em linhas
+    # e junta-las de novo custava duas copias de um sync completo.
+    with tracing.span("script.parse"):
+        start = _marker_line(output, "DATA_BEGIN")
+        end = _marker_line(output, "DATA_END")
+        if start < 0 or end < 0:
+            raise ScriptExecutionError("Saida do script sem bloco DATA")
+        if end <= start:
+            raise ScriptExecutionError("Saida do script com bloco DATA invalido")
+        begin = start + len("DATA_BEGIN")
+        while begin < end and output[begin].isspace():
+            begin += 1
+        while end > begin and output[end - 1].isspace():
+            end -= 1
+        return output[begin:end]
+
+
+def parse_script_header(output: str) -> Dict[str, str]:
+    header: Dict[str, str] = {}
+    for line in output.splitlines():
+        if line == "DATA_BEGIN":
+            break
+        key, sep, value = line.partition("=")
+        if sep and key.isupper():
+            header[key] = value
+    return header
+
+
+def _decode_binary_value(key: str, value: str) -> str:
+    data = binascii.a2b_base64(value.strip())
+    if key.lower() in GUID_ATTRIBUTES and len(data) == 16:
+        return str(uuid.UUID(bytes_le=data))
     try:
-        start = lines.index("DATA_BEGIN")
-        end = lines.index("DATA_END")
-    except ValueError as exc:
-        raise ScriptExecutionError("Saida do script sem bloco DATA") from exc
-    if end <= start:
-        raise ScriptExecutionError("Saida do script com bloco DATA invalido")
-    return "\n".join(lines[start + 1 : end]).strip()
+        text = data.decode("utf-8")
+    except UnicodeDecodeError:
+        return data.hex()
+    if CONTROL_CHARS_RE.search(text):
+        return data.hex()
+    return text
 
 
-def parse_ldif_entries(ldif_text: str) -> List[Dict[str, Any]]:
-    entries: List[Dict[str, Any]] = []
-    current: Dict[str, Any] = {}
+def legacy_binary_value(key: str, value: str) -> Optional[str]:
+    """Como o parser antigo mostrava o valor binario (UTF-8 com substituicao), ou None se
+    ``value`` nao e um GUID nem hex produzidos por ``_decode_binary_value``."""
+    if key.lower() in GUID_ATTRIBUTES:
+        try:
+            return uuid.UUID(value).bytes_le.decode("utf-8", errors="replace")
+        except ValueError:
+            pass
+    if not HEX_VALUE_RE.match(value):
+        return None
+    return bytes.fromhex(value).decode("utf-8", errors="replace")
 
-    def _commit() -> None:
-        nonlocal current
-        if current:
-            entries.append(current)
-            current = {}
 
-    for raw_line in ldif_text.splitlines():
+def iter_ldif_entries(lines: Iterable[str]) -> Iterator[Dict[str, Any]]:
+    decode = _decode_binary_value
+    current: Dict[str, Any] = {}
+    for raw_line in lines:
         line = raw_line.rstrip()
         if not line:
-            _commit()
+            if current:
+                yield current
+                current = {}
             continue
-        if "::" in line:
-            key, value = line.split("::", 1)
-            decoded = base64.b64decode(value.strip()).decode("utf-8", errors="replace")
-            value = decoded
-        elif ":" in line:
-            key, value = line.split(":", 1)
-            value = value.strip()
-        else:
+        key, sep, value = line.partition(":")
+        if not sep:
             continue
         key = key.strip()
-        if key in current:
-            existing = current[key]
-            if isinstance(existing, list):
-                existing.append(value)
-            else:
-                current[key] = [existing, value]
+        if value[:1] == ":":
+            value = decode(key, value[1:])
         else:
+            value = value.strip()
+        existing = current.get(key, _MISSING)
+        if existing is _MISSING:
             current[key] = value
-    _commit()
-    return entries
+        elif type(existing) is list:
+            existing.append(value)
+        else:
+            current[key] = [existing, value]
+    if current:
+        yield current
+
+
+def parse_ldif_entries(ldif_text: str) -> List[Dict[str, Any]]:
+    with tracing.span("script.parse"):
+        return list(iter_ldif_entries(ldif_text.splitlines()))
+
+
+def normalize_attributes(entry: Dict[str, Any]) -> Dict[str, Any]:
+    attributes: Dict[str, Any] = {}
+    for key, value in entry.items():
+        if key.lower() in MULTI_VALUED_ATTRIBUTES and not isinstance(value, list):
+            value = [value]
+        attributes[key] = value
+    return attributes
 
 
 def normalize_for_hash(payload: Dict[str, Any]) -> str:
-    data = json.dumps(payload, sort_keys=True, ensure_ascii=True).encode("utf-8")
+    data = _HASH_ENCODER.encode(payload).encode("utf-8")
     return hashlib.sha256(data).hexdigest()
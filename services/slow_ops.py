@@ -0,0 +1,37 @@
+import json
+from typing import List, Optional
+
+from sqlalchemy.orm import Session
+
+from core.config import settings
+from core.tracing import Trace
+from db.models import SlowOperation
+from db.session import SessionLocal
+
+
+def record(trace: Trace) -> None:
+    db = SessionLocal()
+    try:
+        entry = SlowOperation(
+            request_id=trace.request_id,
+            name=trace.name[:255],
+            status=trace.status,
+            duration_ms=round(trace.duration_ms, 3),
+            spans_json=json.dumps(trace.breakdown(), ensure_ascii=True, default=str),
+        )
+        db.add(entry)
+        db.flush()
+        if settings.slow_op_max_rows > 0:
+            db.query(SlowOperation).filter(SlowOperation.id <= entry.id - settings.slow_op_max_rows).delete(
+                synchronize_session=False
+            )
+        db.commit()
+    finally:
+        db.close()
+
+
+def list_slow(db: Session, *, limit: int, min_ms: Optional[float] = None) -> List[SlowOperation]:
+    query = db.query(SlowOperation)
+    if min_ms is not None:
+        query = query.filter(SlowOperation.duration_ms >= min_ms)
+    return query.order_by(SlowOperation.id.desc()).limit(limit).all()
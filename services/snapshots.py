@@ -0,0 +1,256 @@
+import hashlib
+import json
+from datetime import datetime, timezone
+from typing import IO, Any, Dict, Iterator, List, Optional, Set, Tuple
+
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from audit.logger import log_audit
+from core.config import settings
+from db.models import GroupMeta, SnapshotState, UserMeta
+from db.session import SessionLocal
+from services import changes
+from services.script_runner import (
+    ALL_FIELDS,
+    CONTROL_CHARS_RE,
+    GUID_ATTRIBUTES,
+    chunked,
+    legacy_binary_value,
+    normalize_attributes,
+    normalize_for_hash,
+)
+
+SCOPE_MODELS = {
+    "users": (UserMeta, UserMeta.username),
+    "groups": (GroupMeta, GroupMeta.groupname),
+}
+
+
+def _state(db: Session, scope: str) -> SnapshotState:
+    state = db.get(SnapshotState, scope)
+    if state is not None:
+        return state
+    try:
+        with db.begin_nested():
+            state = SnapshotState(scope=scope, generation=0, synced_generation=0)
+            db.add(state)
+    except IntegrityError:
+        state = db.get(SnapshotState, scope)
+    return state
+
+
+def touch(db: Session, *scopes: str) -> None:
+    for scope in scopes:
+        state = _state(db, scope)
+        state.generation += 1
+
+
+def mark_synced(db: Session, scope: str, *, changed: bool) -> None:
+    state = _state(db, scope)
+    if changed:
+        state.generation += 1
+    state.synced_generation = state.generation
+    state.synced_at = datetime.now(timezone.utc)
+
+
+def _rendering_only(key: str, previous: Any, current: Any) -> bool:
+    """Diferenca que vem so da forma nova dos valores binarios (GUID e hex): o snapshot
+    gravado antes dela guarda o mesmo valor decodificado como UTF-8 com substituicao."""
+    if isinstance(previous, str) and isinstance(current, str):
+        pairs = [(previous, current)]
+    elif isinstance(previous, list) and isinstance(current, list) and len(previous) == len(current):
+        pairs = list(zip(previous, current))
+    else:
+        return False
+    for old, new in pairs:
+        if old == new:
+            continue
+        # texto limpo nunca veio de um valor binario, mesmo que o novo pareca hex
+        if key.lower() not in GUID_ATTRIBUTES and "\ufffd" not in old and not CONTROL_CHARS_RE.search(old):
+            return False
+        if legacy_binary_value(key, new) != old:
+            return False
+    return True
+
+
+def stage_changes(
+    db: Session, scope: str, payloads: Dict[str, Dict[str, Any]], announced: Set[str], staged: IO[str]
+) -> int:
+    """Compara um lote da sincronizacao com o snapshot e anota em ``staged`` o que mudou.
+
+    So le o banco e encerra a leitura em seguida: enquanto o script ainda envia a saida
+    nenhuma transacao fica aberta. ``announced`` sao os criados pela API (sem evento).
+    Linha que so mudou a forma dos valores binarios e regravada sem evento.
+    """
+    model, column = SCOPE_MODELS[scope]
+    rows = db.query(column, model.ad_hash, model.extra_json).filter(column.in_(list(payloads))).all()
+    db.rollback()
+    existing = {name: (ad_hash, extra_json) for name, ad_hash, extra_json in rows}
+    staged_count = 0
+    for name, payload in payloads.items():
+        ad_hash = normalize_for_hash(payload)
+        current = existing.get(name)
+        if current and current[0] == ad_hash:
+            continue
+        if current:
+            previous = json.loads(current[1] or "{}").get("attributes", {})
+            attributes = [
+                key
+                for key in changes.changed_attributes(previous, payload["attributes"])
+                if not _rendering_only(key, previous.get(key), payload["attributes"].get(key))
+            ]
+            change = changes.UPDATED if attributes else None
+        else:
+            change = None if name in announced else changes.CREATED
+            attributes = sorted(payload["attributes"])
+        # JSON com ensure_ascii nao tem tabulacao nem quebra de linha crua
+        header = json.dumps([name, change, attributes, ad_hash], ensure_ascii=True)
+        staged.write(f"{header}\t{json.dumps(payload, ensure_ascii=True)}\n")
+        staged_count += 1
+    return staged_count
+
+
+def apply_staged(db: Session, scope: str, staged: IO[str], action: str) -> None:
+    """Grava no snapshot e no feed o que ``stage_changes`` anotou, sem commit."""
+    model, column = SCOPE_MODELS[scope]
+    now = datetime.now(timezone.utc)
+    staged.seek(0)
+    for batch in chunked(staged, settings.sync_chunk_size):
+        items = []
+        for line in batch:
+            header, _, extra_json = line.rstrip("\n").partition("\t")
+            items.append((*json.loads(header), extra_json))
+        existing = {getattr(meta, column.key): meta for meta in db.query(model).filter(column.in_([i[0] for i in items]))}
+        for name, change, attributes, ad_hash, extra_json in items:
+            if change is not None:
+                changes.record(db, scope, name, change, attributes, source=changes.SYNC, action=action)
+            meta = existing.get(name)
+            if meta is None:
+                db.add(model(**{column.key: name}, ad_hash=ad_hash, extra_json=extra_json, last_sync=now))
+            else:
+                meta.ad_hash = ad_hash
+                meta.extra_json = extra_json
+                meta.last_sync = now
+        db.flush()
+        db.expunge_all()
+
+
+def forget(db: Session, scope: str, name: str) -> None:
+    """Tira do snapshot o objeto removido pela API, na transacao do evento ``removed``:
+    a proxima sincronizacao nao o encontra e nao anuncia a remocao de novo."""
+    model, column = SCOPE_MODELS[scope]
+    db.query(model).filter(column == name).delete(synchronize_session=False)
+
+
+def remove_missing(db: Session, scope: str, seen: Set[str]) -> List[str]:
+    """Apaga do snapshot o que a sincronizacao completa nao trouxe e devolve os nomes."""
+    model, column = SCOPE_MODELS[scope]
+    missing = [name for (name,) in db.query(column) if name not in seen]
+    for batch in chunked(missing, settings.sync_chunk_size):
+        db.query(model).filter(column.in_(batch)).delete(synchronize_session=False)
+    return missing
+
+
+def _synced_age(state: SnapshotState) -> Optional[float]:
+    if state.synced_at is None:
+        return None
+    synced_at = state.synced_at
+    if synced_at.tzinfo is None:
+        synced_at = synced_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (datetime.now(timezone.utc) - synced_at).total_seconds())
+
+
+def is_fresh(state: SnapshotState) -> bool:
+    if state.synced_generation != state.generation:
+        return False
+    age = _synced_age(state)
+    return age is not None and age <= settings.snapshot_max_age_seconds
+
+
+def fresh_generation(db: Session, scope: str) -> Optional[int]:
+    """Geracao sincronizada do escopo, ou None se a tabela local nao esta em dia."""
+    state = _state(db, scope)
+    return state.synced_generation if is_fresh(state) else None
+
+
+def snapshot_age(db: Session, scope: str) -> Optional[float]:
+    return _synced_age(_state(db, scope))
+
+
+def _variant_digest(fields: List[str], variant: str) -> str:
+    key = ",".join(sorted(field.lower() for field in fields)) + "|" + variant
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()[:12]
+
+
+def project(attributes: Dict[str, Any], fields: List[str]) -> Dict[str, Any]:
+    if ALL_FIELDS in fields:
+        return dict(attributes)
+    wanted = {field.lower() for field in fields}
+    wanted.add("dn")
+    return {key: value for key, value in attributes.items() if key.split(";", 1)[0].lower() in wanted}
+
+
+def entry_etag(identifier: str, attributes: Dict[str, Any], fields: List[str], variant: str) -> str:
+    projected = normalize_attributes(project(attributes, fields))
+    digest = normalize_for_hash({"id": identifier, "attributes": projected, "variant": _variant_digest(fields, variant)})
+    return f'"{digest}"'
+
+
+def snapshot_entry_etag(db: Session, scope: str, identifier: str, fields: List[str], variant: str) -> Optional[str]:
+    if not is_fresh(_state(db, scope)):
+        return None
+    model, column = SCOPE_MODELS[scope]
+    meta = db.query(model).filter(column == identifier).one_or_none()
+    if meta is None or not meta.extra_json:
+        return None
+    attributes = json.loads(meta.extra_json).get("attributes") or {}
+    return entry_etag(identifier, attributes, fields, variant)
+
+
+def snapshot_entry(
+    db: Session, scope: str, identifier: str, fields: List[str]
+) -> Optional[Tuple[Dict[str, Any], float]]:
+    age = snapshot_age(db, scope)
+    if age is None:
+        return None
+    model, column = SCOPE_MODELS[scope]
+    meta = db.query(model).filter(column == identifier).one_or_none()
+    if meta is None or not meta.extra_json:
+        return None
+    attributes = json.loads(meta.extra_json).get("attributes") or {}
+    return project(attributes, fields), age
+
+
+def iter_snapshot(scope: str, fields: List[str]) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    # sessao propria: o consumo acontece durante o streaming da resposta
+    model, column = SCOPE_MODELS[scope]
+    db = SessionLocal()
+    try:
+        if not fields:
+            for (identifier,) in db.query(column).order_by(column).yield_per(settings.sync_chunk_size):
+                yield identifier, {}
+            return
+        rows = db.query(column, model.extra_json).order_by(column).yield_per(settings.sync_chunk_size)
+        for identifier, extra_json in rows:
+            attributes = json.loads(extra_json).get("attributes") or {} if extra_json else {}
+            yield identifier, project(attributes, fields)
+    finally:
+        db.close()
+
+
+def list_etag(db: Session, scope: str, fields: List[str], variant: str) -> Tuple[str, bool]:
+    state = _state(db, scope)
+    return f'"{scope}-g{state.generation}-{_variant_digest(fields, variant)}"', is_fresh(state)
+
+
+def record_not_modified(db: Session, *, actor: str, action: str, object_type: str, object_id: str, etag: str) -> None:
+    log_audit(
+        db,
+        actor=actor,
+        action=action,
+        object_type=object_type,
+        object_id=object_id,
+        result="not_modified",
+        details={"etag": etag},
+    )
@@ -1,21 +1,39 @@
-import json
-from datetime import datetime, timezone
-from typing import Any, Dict, List
+import tempfile
+from typing import IO, Any, Dict, Iterator, List, Optional, Set, Tuple
 
 from sqlalchemy.orm import Session
 
-from audit.logger import log_audit
-from db.models import UserMeta
+from audit.logger import audit_stream, log_audit
+from core import tracing
+from core.config import settings
 from db.session import SessionLocal
+from services import changes, existence, slow_ops, snapshots
 from services.script_runner import (
     ScriptExecutionError,
-    extract_data_block,
-    normalize_for_hash,
-    parse_ldif_entries,
+    chunked,
+    iter_ldif_entries,
     run_script,
+    stream_data_block,
+    tee_lines,
 )
 
 
+# campos da API -> atributos do AD, para os eventos do feed de mudancas
+AD_ATTRIBUTES = {
+    "username": "sAMAccountName",
+    "password": "unicodePwd",
+    "given_name": "givenName",
+    "surname": "sn",
+    "display_name": "displayName",
+    "mail": "mail",
+    "upn": "userPrincipalName",
+}
+
+
+def _ad_attributes(values: Dict[str, Any]) -> List[str]:
+    return [AD_ATTRIBUTES[key] for key, value in values.items() if key in AD_ATTRIBUTES and value]
+
+
 def _log_and_raise(
     db: Session,
     *,
@@ -39,11 +57,11 @@ def _log_and_raise(
     raise exc
 
 
-def list_users(db: Session, actor: str) -> str:
+def list_users(db: Session, actor: str, fields: Optional[List[str]] = None) -> Tuple[List[str], Iterator[str]]:
     script = "users/list_users.sh"
-    args: List[str] = []
+    args: List[str] = list(fields or [])
     try:
-        output = run_script(script, args)
+        header, data = stream_data_block(script, args)
     except ScriptExecutionError as exc:
         _log_and_raise(
             db,
@@ -55,23 +73,22 @@ def list_users(db: Session, actor: str) -> str:
             arguments=args,
             exc=exc,
         )
-    log_audit(
-        db,
+    return header, audit_stream(
+        data,
         actor=actor,
         action="list_users",
         object_type="user",
         object_id="list",
-        result="success",
         details={"script": script, "arguments": args},
     )
-    return output
 
 
-def get_user(db: Session, actor: str, username: str) -> str:
+def get_user(db: Session, actor: str, username: str, fields: Optional[List[str]] = None) -> str:
     script = "users/get_user.sh"
-    args = [username]
+    args = [username, *(fields or [])]
     try:
-        output = run_script(script, args)
+        with existence.guard(db, user=username):
+            output = run_script(script, args)
     except ScriptExecutionError as exc:
         _log_and_raise(
             db,
@@ -119,6 +136,17 @@ def create_user(db: Session, actor: str, payload: Dict[str, Any]) -> str:
             arguments=args,
             exc=exc,
         )
+    snapshots.touch(db, "users")
+    changes.record(
+        db,
+        "users",
+        payload["username"],
+        changes.CREATED,
+        _ad_attributes(payload),
+        actor=actor,
+        action="create_user",
+    )
+    existence.created(existence.USER, payload["username"])
     log_audit(
         db,
         actor=actor,
@@ -142,7 +170,8 @@ def update_user(db: Session, actor: str, username: str, attrs: Dict[str, Any]) -
         attrs.get("upn") or "",
     ]
     try:
-        output = run_script(script, args)
+        with existence.guard(db, user=username):
+            output = run_script(script, args)
     except ScriptExecutionError as exc:
         _log_and_raise(
             db,
@@ -154,6 +183,8 @@ def update_user(db: Session, actor: str, username: str, attrs: Dict[str, Any]) -
             arguments=args,
             exc=exc,
         )
+    snapshots.touch(db, "users")
+    changes.record(db, "users", username, changes.UPDATED, _ad_attributes(attrs), actor=actor, action="update_user")
     log_audit(
         db,
         actor=actor,
@@ -170,7 +201,8 @@ def reset_password(db: Session, actor: str, username: str, new_password: str, mu
     script = "users/reset_password.sh"
     args = [username, new_password, "true" if must_change else "false"]
     try:
-        output = run_script(script, args)
+        with existence.guard(db, user=username):
+            output = run_script(script, args)
     except ScriptExecutionError as exc:
         _log_and_raise(
             db,
@@ -182,6 +214,16 @@ def reset_password(db: Session, actor: str, username: str, new_password: str, mu
             arguments=args,
             exc=exc,
         )
+    snapshots.touch(db, "users")
+    changes.record(
+        db,
+        "users",
+        username,
+        changes.UPDATED,
+        ["unicodePwd", "pwdLastSet"] if must_change else ["unicodePwd"],
+        actor=actor,
+        action="reset_password",
+    )
     log_audit(
         db,
         actor=actor,
@@ -198,7 +240,8 @@ def enable_user(db: Session, actor: str, username: str) -> str:
     script = "users/enable_user.sh"
     args = [username]
     try:
-        output = run_script(script, args)
+        with existence.guard(db, user=username):
+            output = run_script(script, args)
     except ScriptExecutionError as exc:
         _log_and_raise(
             db,
@@ -210,6 +253,8 @@ def enable_user(db: Session, actor: str, username: str) -> str:
             arguments=args,
             exc=exc,
         )
+    snapshots.touch(db, "users")
+    changes.record(db, "users", username, changes.UPDATED, ["userAccountControl"], actor=actor, action="enable_user")
     log_audit(
         db,
         actor=actor,
@@ -226,7 +271,8 @@ def disable_user(db: Session, actor: str, username: str) -> str:
     script = "users/disable_user.sh"
     args = [username]
     try:
-        output = run_script(script, args)
+        with existence.guard(db, user=username):
+            output = run_script(script, args)
     except ScriptExecutionError as exc:
         _log_and_raise(
             db,
@@ -238,6 +284,8 @@ def disable_user(db: Session, actor: str, username: str) -> str:
             arguments=args,
             exc=exc,
         )
+    snapshots.touch(db, "users")
+    changes.record(db, "users", username, changes.UPDATED, ["userAccountControl"], actor=actor, action="disable_user")
     log_audit(
         db,
         actor=actor,
@@ -254,7 +302,8 @@ def delete_user(db: Session, actor: str, username: str) -> str:
     script = "users/delete_user.sh"
     args = [username]
     try:
-        output = run_script(script, args)
+        with existence.guard(db, user=username):
+            output = run_script(script, args)
     except ScriptExecutionError as exc:
         _log_and_raise(
             db,
@@ -266,6 +315,9 @@ def delete_user(db: Session, actor: str, username: str) -> str:
             arguments=args,
             exc=exc,
         )
+    snapshots.touch(db, "users")
+    snapshots.forget(db, "users", username)
+    changes.record(db, "users", username, changes.REMOVED, actor=actor, action="delete_user")
     log_audit(
         db,
         actor=actor,
@@ -282,7 +334,8 @@ def add_user_to_group(db: Session, actor: str, username: str, group: str) -> str
     script = "groups/add_user_to_group.sh"
     args = [username, group]
     try:
-        output = run_script(script, args)
+        with existence.guard(db, user=username, group=group):
+            output = run_script(script, args)
     except ScriptExecutionError as exc:
         _log_and_raise(
             db,
@@ -294,6 +347,9 @@ def add_user_to_group(db: Session, actor: str, username: str, group: str) -> str
             arguments=args,
             exc=exc,
         )
+    snapshots.touch(db, "users", "groups")
+    changes.record(db, "users", username, changes.UPDATED, ["memberOf"], actor=actor, action="add_user_to_group")
+    changes.record(db, "groups", group, changes.UPDATED, ["member"], actor=actor, action="add_user_to_group")
     log_audit(
         db,
         actor=actor,
@@ -310,7 +366,8 @@ def remove_user_from_group(db: Session, actor: str, username: str, group: str) -
     script = "groups/remove_user_from_group.sh"
     args = [username, group]
     try:
-        output = run_script(script, args)
+        with existence.guard(db, user=username, group=group):
+            output = run_script(script, args)
     except ScriptExecutionError as exc:
         _log_and_raise(
             db,
@@ -322,6 +379,9 @@ def remove_user_from_group(db: Session, actor: str, username: str, group: str) -
             arguments=args,
             exc=exc,
         )
+    snapshots.touch(db, "users", "groups")
+    changes.record(db, "users", username, changes.UPDATED, ["memberOf"], actor=actor, action="remove_user_from_group")
+    changes.record(db, "groups", group, changes.UPDATED, ["member"], actor=actor, action="remove_user_from_group")
     log_audit(
         db,
         actor=actor,
@@ -334,14 +394,45 @@ def remove_user_from_group(db: Session, actor: str, username: str, group: str) -
     return output
 
 
-def sync_users(db: Session, actor: str) -> str:
+def _stage_user_chunk(
+    db: Session, entries: List[Dict[str, Any]], seen: Set[str], announced: Set[str], staged: IO[str]
+) -> int:
+    payloads: Dict[str, Dict[str, Any]] = {}
+    for entry in entries:
+        username = entry.get("sAMAccountName")
+        if not username:
+            continue
+        payloads[username] = {"username": username, "attributes": entry}
+    seen.update(payloads)
+    if not payloads:
+        return 0
+    return snapshots.stage_changes(db, "users", payloads, announced, staged)
+
+
+def sync_users(db: Session, actor: str) -> Dict[str, Any]:
     script = "users/sync_users.sh"
     args: List[str] = []
+    output = tempfile.SpooledTemporaryFile(max_size=settings.response_spool_max_bytes, mode="w+t", encoding="utf-8")
+    # diferencas encontradas durante o streaming: so sao gravadas depois que o script termina
+    staged = tempfile.SpooledTemporaryFile(max_size=settings.response_spool_max_bytes, mode="w+t", encoding="utf-8")
+    header: List[str] = []
+    total = 0
+    updated = 0
+    seen: Set[str] = set()
+    # criados pela API depois da ultima sincronizacao: o evento created ja foi gravado
+    announced = changes.created_by_api(db, "users", snapshots.snapshot_age(db, "users"))
     try:
-        output = run_script(script, args)
-        data_block = extract_data_block(output)
-        entries = parse_ldif_entries(data_block)
+        header, data = stream_data_block(script, args)
+        output.write("\n".join([*header, "DATA_BEGIN", ""]))
+        for chunk in chunked(iter_ldif_entries(tee_lines(data, output)), settings.sync_chunk_size):
+            total += len(chunk)
+            with tracing.span("sync.chunk", size=len(chunk)):
+                updated += _stage_user_chunk(db, chunk, seen, announced, staged)
+        output.write("DATA_END\n")
     except ScriptExecutionError as exc:
+        output.close()
+        staged.close()
+        db.rollback()
         _log_and_raise(
             db,
             actor=actor,
@@ -353,7 +444,10 @@ def sync_users(db: Session, actor: str) -> str:
             exc=exc,
         )
     except Exception as exc:
-        error = ScriptExecutionError("Falha ao processar saida do script", stdout=output if "output" in locals() else "")
+        output.close()
+        staged.close()
+        db.rollback()
+        error = ScriptExecutionError("Falha ao processar saida do script", stdout="\n".join(header))
         _log_and_raise(
             db,
             actor=actor,
@@ -366,31 +460,25 @@ def sync_users(db: Session, actor: str) -> str:
         )
         raise exc
 
-    updated = 0
-    for entry in entries:
-        username = entry.get("sAMAccountName")
-        if not username:
-            continue
-        payload = {"username": username, "attributes": entry}
-        ad_hash = normalize_for_hash(payload)
-        existing = db.query(UserMeta).filter(UserMeta.username == username).one_or_none()
-        if existing and existing.ad_hash == ad_hash:
-            continue
-        if existing:
-            existing.ad_hash = ad_hash
-            existing.extra_json = json.dumps(payload, ensure_ascii=True)
-            existing.last_sync = datetime.now(timezone.utc)
-        else:
-            db.add(
-                UserMeta(
-                    username=username,
-                    ad_hash=ad_hash,
-                    extra_json=json.dumps(payload, ensure_ascii=True),
-                    last_sync=datetime.now(timezone.utc),
-                )
-            )
-        updated += 1
-    db.commit()
+    # uma transacao curta com o resultado inteiro: script que falha no meio nao deixa
+    # snapshot pela metade nem eventos de mudanca, e o banco nao espera o DC
+    try:
+        with tracing.span("sync.write", size=updated):
+            snapshots.apply_staged(db, "users", staged, "sync_users")
+            # saida vazia e mais provavelmente erro de escopo do que diretorio vazio: nada e removido
+            removed = snapshots.remove_missing(db, "users", seen) if seen else []
+            for name in removed:
+                changes.record(db, "users", name, changes.REMOVED, source=changes.SYNC, action="sync_users")
+            changes.purge(db)
+            snapshots.mark_synced(db, "users", changed=updated > 0 or bool(removed))
+            db.commit()
+    except Exception:
+        output.close()
+        db.rollback()
+        raise
+    finally:
+        staged.close()
+    existence.synced(existence.USER)
     log_audit(
         db,
         actor=actor,
@@ -398,15 +486,17 @@ def sync_users(db: Session, actor: str) -> str:
         object_type="sync",
         object_id="users",
         result="success",
-        details={"script": script, "arguments": args, "total": len(entries), "updated": updated},
+        details={"script": script, "arguments": args, "total": total, "updated": updated, "removed": len(removed)},
     )
-    return output
+    output.seek(0)
+    return {"header": header, "output": output, "total": total, "updated": updated}
 
 
 def sync_users_job(actor: str) -> Dict[str, int]:
     db = SessionLocal()
     try:
-        sync_users(db, actor)
+        with tracing.record_slow("job sync_users", slow_ops.record):
+            sync_users(db, actor)["output"].close()
         return {"status": "ok"}
     finally:
         db.close()
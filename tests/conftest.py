@@ -0,0 +1,51 @@
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+DEVTOOLS = ROOT / "scripts_ad" / "devtools"
+WORKDIR = tempfile.mkdtemp(prefix="ad-api-tests-")
+
+# antes de importar o app: o Settings le o ambiente uma vez. Os scripts sempre falam
+# com o diretorio falso, mesmo que o ambiente aponte para um DC de verdade.
+os.environ.setdefault("JWT_SECRET_KEY", "teste-" + "x" * 40)
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{WORKDIR}/app.db")
+os.environ.setdefault("RATE_LIMIT_PER_MINUTE", "100000")
+os.environ.setdefault("RATE_LIMIT_BURST", "100000")
+os.environ.update(
+    LDAP_URI="ldap://fakeldap",
+    AD_SCRIPTS_DIR=f"{WORKDIR}/scripts",
+    FAKELDAP_DB=f"{WORKDIR}/fakeldap.sqlite3",
+    PATH=f"{DEVTOOLS / 'fakeldap' / 'bin'}{os.pathsep}{os.environ['PATH']}",
+)
+os.environ.pop("FAKELDAP_BIND_PW", None)
+
+
+@pytest.fixture(scope="session")
+def directory():
+    """Diretorio falso com poucos usuarios e grupos, criado uma vez por sessao."""
+    # copia executavel dos scripts: o checkout pode nao preservar o bit de execucao
+    scripts = shutil.copytree(ROOT / "scripts_ad", os.environ["AD_SCRIPTS_DIR"], ignore=shutil.ignore_patterns("devtools"))
+    for script in Path(scripts).rglob("*.sh"):
+        script.chmod(0o755)
+    env = {**os.environ, "PYTHONPATH": os.pathsep.join([str(DEVTOOLS), str(ROOT)])}
+    subprocess.run(
+        [sys.executable, "-m", "fakeldap", "seed", "--users", "20", "--groups", "5"],
+        env=env,
+        cwd=ROOT,
+        check=True,
+        capture_output=True,
+    )
+    return os.environ["FAKELDAP_DB"]
+
+
+@pytest.fixture
+def admin_headers():
+    from core.security import Role, create_access_token
+
+    return {"Authorization": "Bearer " + create_access_token("app:teste", Role.admin, {"app": "teste"})}
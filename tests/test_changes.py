@@ -0,0 +1,110 @@
+import json
+import uuid
+
+import pytest
+from fastapi.testclient import TestClient
+
+from core.config import settings
+from db.models import ChangeEvent, UserMeta
+from db.session import SessionLocal
+from main import app
+from services import changes
+from services.script_runner import normalize_for_hash
+
+
+@pytest.fixture
+def client(directory):
+    with TestClient(app) as client:
+        yield client
+
+
+def _cursor(client, headers):
+    return client.get("/api/v1/changes", params={"limit": 100000}, headers=headers).json()["next"]
+
+
+def _events(client, headers, since, object_id):
+    events = client.get("/api/v1/changes", params={"since": since, "limit": 100000}, headers=headers).json()["events"]
+    return [(event["change"], event["source"]) for event in events if event["object_id"] == object_id]
+
+
+def _new_user(client, headers, username):
+    body = {"username": username, "password": "Senha@12345678", "display_name": username}
+    assert client.post("/api/v1/users", json=body, headers=headers).status_code == 201
+
+
+def test_api_create_and_delete_are_not_repeated_by_sync(client, admin_headers):
+    assert client.post("/api/v1/sync/users", headers=admin_headers).status_code == 200
+    cursor = _cursor(client, admin_headers)
+
+    _new_user(client, admin_headers, "feed.apagado")
+    assert client.post("/api/v1/sync/users", headers=admin_headers).status_code == 200
+    assert client.delete("/api/v1/users/feed.apagado", headers=admin_headers).status_code == 200
+    assert client.post("/api/v1/sync/users", headers=admin_headers).status_code == 200
+
+    assert _events(client, admin_headers, cursor, "feed.apagado") == [("created", "api"), ("removed", "api")]
+
+
+def test_binary_rendering_change_is_not_an_update(client, admin_headers):
+    assert client.post("/api/v1/sync/users", headers=admin_headers).status_code == 200
+    # snapshot gravado pelo parser antigo: objectGUID decodificado como UTF-8 com substituicao
+    db = SessionLocal()
+    meta = db.query(UserMeta).filter(UserMeta.extra_json.contains("objectGUID")).first()
+    payload = json.loads(meta.extra_json)
+    guid = payload["attributes"]["objectGUID"]
+    payload["attributes"]["objectGUID"] = uuid.UUID(guid).bytes_le.decode("utf-8", errors="replace")
+    meta.extra_json = json.dumps(payload, ensure_ascii=True)
+    meta.ad_hash = normalize_for_hash(payload)
+    username = meta.username
+    db.commit()
+    cursor = _cursor(client, admin_headers)
+
+    assert client.post("/api/v1/sync/users", headers=admin_headers).status_code == 200
+
+    assert _events(client, admin_headers, cursor, username) == []
+    db.refresh(meta)
+    assert json.loads(meta.extra_json)["attributes"]["objectGUID"] == guid
+    db.close()
+
+
+def test_cursor_pages_through_events_in_order(client, admin_headers):
+    cursor = _cursor(client, admin_headers)
+    for username in ("feed.pagina1", "feed.pagina2", "feed.pagina3"):
+        _new_user(client, admin_headers, username)
+
+    seen = []
+    while True:
+        page = client.get("/api/v1/changes", params={"since": cursor, "limit": 1}, headers=admin_headers).json()
+        if not page["events"]:
+            assert page["next"] == cursor
+            break
+        assert [event["seq"] for event in page["events"]] == [page["next"]]
+        assert page["next"] > cursor
+        seen.append(page["events"][0]["object_id"])
+        cursor = page["next"]
+    assert seen == ["feed.pagina1", "feed.pagina2", "feed.pagina3"]
+
+
+def test_sync_without_directory_changes_records_nothing(client, admin_headers):
+    assert client.post("/api/v1/sync/users", headers=admin_headers).status_code == 200
+    cursor = _cursor(client, admin_headers)
+
+    assert client.post("/api/v1/sync/users", headers=admin_headers).status_code == 200
+
+    assert client.get("/api/v1/changes", params={"since": cursor}, headers=admin_headers).json()["events"] == []
+
+
+def test_since_before_purged_events_is_gone(client, admin_headers, monkeypatch):
+    _new_user(client, admin_headers, "feed.antigo")
+    cursor = _cursor(client, admin_headers)
+    assert client.get("/api/v1/changes", params={"since": cursor - 1}, headers=admin_headers).status_code == 200
+
+    # a retencao apaga tudo: sem evento restante, so a marca diz que houve perda
+    monkeypatch.setattr(settings, "changes_retention_days", 1)
+    db = SessionLocal()
+    db.query(ChangeEvent).update({ChangeEvent.recorded_at: 0})
+    changes.purge(db)
+    db.commit()
+    db.close()
+
+    assert client.get("/api/v1/changes", params={"since": cursor - 1}, headers=admin_headers).status_code == 410
+    assert client.get("/api/v1/changes", params={"since": cursor}, headers=admin_headers).status_code == 200
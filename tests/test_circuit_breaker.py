@@ -0,0 +1,34 @@
+import time
+
+import pytest
+
+from core import circuit_breaker
+from core.config import settings
+from services import process_group, script_runner
+
+
+def _broken_spawn(*args, **kwargs):
+    raise PermissionError("sem permissao")
+
+
+@pytest.fixture
+def half_open(directory, monkeypatch):
+    # circuitos novos, so deste teste
+    monkeypatch.setattr(circuit_breaker, "_breakers", {})
+    breaker = circuit_breaker.guard("users/get_user.sh").breaker
+    breaker._trip(time.monotonic() - settings.circuit_breaker_open_seconds)
+    assert breaker.state == circuit_breaker.HALF_OPEN
+    monkeypatch.setattr(process_group, "spawn", _broken_spawn)
+    return breaker
+
+
+def test_unexpected_error_settles_probe_of_run_script(half_open):
+    with pytest.raises(PermissionError):
+        script_runner.run_script("users/get_user.sh", ["qualquer"])
+    assert half_open.state == circuit_breaker.OPEN
+
+
+def test_unexpected_error_settles_probe_of_stream_script(half_open):
+    with pytest.raises(PermissionError):
+        list(script_runner.stream_script("users/get_user.sh", ["qualquer"]))
+    assert half_open.state == circuit_breaker.OPEN
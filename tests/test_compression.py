@@ -0,0 +1,55 @@
+import pytest
+from starlette.applications import Starlette
+from starlette.responses import PlainTextResponse, StreamingResponse
+from starlette.routing import Route
+from fastapi.testclient import TestClient
+
+from core.compression import CompressionMiddleware
+
+BODY = "linha de resposta comprimivel\n" * 200
+
+
+def _chunks(prefix):
+    for index in range(20):
+        yield f"{prefix}{index}: {BODY[:300]}\n\n"
+
+
+app = Starlette(
+    routes=[
+        Route("/plain", lambda request: PlainTextResponse(BODY)),
+        Route("/small", lambda request: PlainTextResponse("curto")),
+        Route("/stream", lambda request: StreamingResponse(_chunks("parte "), media_type="text/plain")),
+        Route("/events", lambda request: StreamingResponse(_chunks("data: "), media_type="text/event-stream")),
+    ]
+)
+app.add_middleware(CompressionMiddleware, algorithms=["br", "gzip"], minimum_size=500)
+
+
+@pytest.fixture
+def client():
+    return TestClient(app)
+
+
+@pytest.mark.parametrize(
+    "accept, encoding",
+    [("br, gzip", "br"), ("gzip, br", "br"), ("gzip", "gzip"), ("br;q=0, gzip", "gzip"), ("identity", None)],
+)
+def test_negotiates_encoding_in_configured_order(client, accept, encoding):
+    for path, text in (("/plain", BODY), ("/stream", "".join(_chunks("parte ")))):
+        response = client.get(path, headers={"Accept-Encoding": accept})
+        assert response.headers.get("content-encoding") == encoding
+        assert response.text == text
+        if encoding:
+            assert "Accept-Encoding" in response.headers["vary"]
+
+
+def test_small_body_is_not_compressed(client):
+    response = client.get("/small", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in response.headers
+    assert response.text == "curto"
+
+
+def test_event_stream_passes_through(client):
+    response = client.get("/events", headers={"Accept-Encoding": "br, gzip"})
+    assert "content-encoding" not in response.headers
+    assert response.text == "".join(_chunks("data: "))
@@ -0,0 +1,78 @@
+import threading
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+from core.config import settings
+from db.models import IdempotencyKey
+from db.session import SessionLocal
+from main import app
+from services import users
+
+
+@pytest.fixture
+def client(directory):
+    with TestClient(app) as client:
+        yield client
+
+
+def _body(username):
+    return {"username": username, "password": "Senha@12345678", "display_name": username}
+
+
+def test_repeated_key_replays_the_first_response(client, admin_headers):
+    headers = {**admin_headers, "Idempotency-Key": "repete-1"}
+    first = client.post("/api/v1/users", json=_body("idem.repete"), headers=headers)
+    assert first.status_code == 201
+
+    second = client.post("/api/v1/users", json=_body("idem.repete"), headers=headers)
+    assert second.status_code == 201
+    assert second.headers["idempotent-replayed"] == "true"
+    assert second.content == first.content
+    # sem a chave o script roda de novo e o usuario ja existe
+    assert client.post("/api/v1/users", json=_body("idem.repete"), headers=admin_headers).status_code != 201
+
+
+def test_same_key_with_another_body_is_rejected(client, admin_headers):
+    headers = {**admin_headers, "Idempotency-Key": "repete-2"}
+    assert client.post("/api/v1/users", json=_body("idem.primeiro"), headers=headers).status_code == 201
+
+    response = client.post("/api/v1/users", json=_body("idem.segundo"), headers=headers)
+    assert response.status_code == 422
+    assert client.get("/api/v1/users/idem.segundo", headers=admin_headers).status_code == 404
+
+
+def test_concurrent_repeat_gets_conflict(client, admin_headers, monkeypatch):
+    headers = {**admin_headers, "Idempotency-Key": "repete-3"}
+    release = threading.Event()
+    run_script = users.run_script
+
+    def slow_run_script(*args, **kwargs):
+        release.wait(10)
+        return run_script(*args, **kwargs)
+
+    monkeypatch.setattr(users, "run_script", slow_run_script)
+    monkeypatch.setattr(settings, "idempotency_wait_seconds", 0.0)
+    results = []
+    first = threading.Thread(
+        target=lambda: results.append(client.post("/api/v1/users", json=_body("idem.paralelo"), headers=headers))
+    )
+    first.start()
+    try:
+        # espera a primeira reservar a chave
+        for _ in range(100):
+            db = SessionLocal()
+            claimed = db.query(IdempotencyKey).filter(IdempotencyKey.key == "repete-3").count()
+            db.close()
+            if claimed:
+                break
+            time.sleep(0.05)
+
+        response = client.post("/api/v1/users", json=_body("idem.paralelo"), headers=headers)
+        assert response.status_code == 409
+        assert response.headers["retry-after"] == "1"
+    finally:
+        release.set()
+        first.join(10)
+    assert results[0].status_code == 201
@@ -0,0 +1,62 @@
+import time
+
+import pytest
+
+from db.models import Job
+from db.session import Base, SessionLocal, engine
+from services import jobs, users
+
+SECRET = "Senha@Secreta12345"
+
+
+@pytest.fixture
+def db(directory):
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    # fila vazia: cada teste pega so os proprios jobs
+    db.query(Job).delete()
+    db.commit()
+    yield db
+    db.close()
+
+
+def test_sealed_args_hold_no_plaintext(db):
+    job = jobs.enqueue(db, "teste", "users.reset_password", "fila.selada", SECRET)
+
+    stored = db.query(Job.sealed_args).filter(Job.id == job.id).scalar()
+    assert SECRET not in stored and "fila.selada" not in stored
+    assert jobs._unseal(stored) == ["fila.selada", SECRET]
+
+
+def test_claimed_job_is_not_taken_again(db):
+    job_id = jobs.enqueue(db, "teste", "users.enable_user", "fila.unica").id
+
+    claimed = jobs.claim(db, "w1")
+    assert claimed.id == job_id and claimed.status == jobs.RUNNING and claimed.locked_by == "w1"
+    other = SessionLocal()
+    try:
+        assert jobs.claim(other, "w2") is None
+    finally:
+        other.close()
+
+
+def test_reclaimed_job_interrupted_after_applying_is_recovered(db):
+    payload = {"username": "fila.recuperada", "password": SECRET, "display_name": "fila.recuperada"}
+    job_id = jobs.enqueue(db, "teste", "users.create_user", payload).id
+    job = jobs.claim(db, "w1")
+    assert job.id == job_id
+    # o worker w1 criou o usuario e caiu antes de gravar o resultado
+    job.started_at = time.time()
+    db.commit()
+    users.create_user(db, "teste", payload)
+    job.locked_until = time.time() - 1
+    db.commit()
+
+    job = jobs.claim(db, "w2")
+    assert job.id == job_id and job.locked_by == "w2" and job.attempts == 2
+    jobs.run(db, job)
+
+    db.refresh(job)
+    assert job.status == jobs.SUCCEEDED
+    assert job.output == "Aplicado pela tentativa interrompida"
+    assert job.sealed_args is None
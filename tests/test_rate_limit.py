@@ -0,0 +1,40 @@
+import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+
+from core import rate_limit
+from core.config import settings
+from core.security import Role, create_access_token
+from main import app
+
+
+@pytest.fixture
+def charged(monkeypatch):
+    costs = []
+    request_cost = rate_limit.request_cost
+
+    def spy(request):
+        costs.append(request_cost(request))
+        # custo registrado: a rota nao precisa executar
+        raise HTTPException(status_code=418)
+
+    monkeypatch.setattr(rate_limit, "request_cost", spy)
+    return costs
+
+
+def _headers():
+    return {"Authorization": "Bearer " + create_access_token("app:teste", Role.admin, {"app": "teste"})}
+
+
+def test_route_cost_override_uses_prefixed_template(charged):
+    with TestClient(app) as client:
+        assert client.post("/api/v1/ops/profile/sync", headers=_headers()).status_code == 418
+    assert rate_limit.ROUTE_COSTS["POST /api/v1/ops/profile/sync"] == 60
+    assert charged == [60]
+
+
+def test_lane_cost_uses_route_template(charged):
+    with TestClient(app) as client:
+        client.get("/api/v1/users/fulano", headers=_headers())
+        client.get("/api/v1/users", headers=_headers())
+    assert charged == [settings.rate_limit_cost_read, settings.rate_limit_cost_bulk]
@@ -0,0 +1,60 @@
+"""Worker da fila de operacoes no AD (``JOB_QUEUE_ENABLED=true``).
+
+Pega os jobs gravados pela API na tabela ``jobs`` e executa os scripts. Pode rodar em
+quantos processos e hosts forem precisos, apontando para o mesmo ``DATABASE_URL``.
+Uso: ``python -m worker --help``.
+"""
+
+import argparse
+import logging
+import os
+import signal
+import socket
+import sys
+import threading
+from typing import List, Optional
+
+from core import metrics
+from core.config import settings
+from db.session import Base, engine
+from services import dc_pool, jobs
+
+logger = logging.getLogger("worker")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m worker", description=__doc__.splitlines()[0])
+    parser.add_argument("--concurrency", type=int, default=settings.worker_concurrency, help="jobs simultaneos")
+    args = parser.parse_args(argv)
+    # mesmo formato do log do uvicorn na API
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s:     %(message)s")
+
+    Base.metadata.create_all(bind=engine)
+    dc_pool.start_prober()
+    stop = threading.Event()
+    # SIGTERM deixa os jobs em andamento terminarem; os proximos ficam na fila
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    signal.signal(signal.SIGINT, lambda *_: stop.set())
+
+    prefix = f"{socket.gethostname()}:{os.getpid()}"
+    threads = [
+        threading.Thread(target=jobs.work, args=(f"{prefix}:{index}", stop), name=f"job-worker-{index}")
+        for index in range(max(1, args.concurrency))
+    ]
+    for thread in threads:
+        thread.start()
+    logger.info("worker %s: %d threads", prefix, len(threads))
+    try:
+        while not stop.wait(1.0):
+            pass
+    finally:
+        logger.info("worker %s: encerrando, aguardando os jobs em andamento", prefix)
+        for thread in threads:
+            thread.join()
+        dc_pool.stop_prober()
+        metrics.mark_process_dead()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())